@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,11 +45,19 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero, para que la medición incluya al resto de middlewares (ver usuarios/metricas.py)
+    'usuarios.metricas.MetricasMiddleware',
+    # Solo actúa con DETECTOR_CONSULTAS (desarrollo y staging)
+    'usuarios.deteccion.DetectorConsultasMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Antes de SessionMiddleware: también la escritura de la sesión fija a la primaria
+    'usuarios.routers.ReplicasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Límite de intentos de login y compras (LIMITES); necesita request.user
+    'usuarios.limites.LimitesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -54,7 +66,10 @@ ROOT_URLCONF = 'tienda.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates con medición del tiempo de render para MetricasMiddleware
+        'BACKEND': 'usuarios.metricas.PlantillasMedidas',
+        # Sin NAME el alias se deduciría del módulo ('metricas'); se conserva 'django'
+        'NAME': 'django',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -80,6 +95,10 @@ WSGI_APPLICATION = 'tienda.wsgi.application'
 #     }
 # }
 
+def _segundos(valor):
+    return None if valor.lower() == 'none' else int(valor)
+
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.mysql',
@@ -90,10 +109,84 @@ DATABASES = {
         'PORT': '3306',
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
-        }
+        },
+        # Conexiones persistentes: se reutilizan entre peticiones del mismo hilo hasta
+        # CONN_MAX_AGE segundos ('none' = sin límite, 0 = una conexión por petición).
+        # Con las vistas async (ASGI) el valor por defecto es 0: cada petición async puede
+        # correr en otro hilo y las conexiones persistentes se acumularían sin reutilizarse.
+        'CONN_MAX_AGE': _segundos(os.environ.get(
+            'TIENDA_CONN_MAX_AGE', '0' if os.environ.get('TIENDA_VISTAS_ASYNC') == '1' else '60',
+        )),
+        # Antes de reutilizar una conexión se comprueba que siga viva (un ping por petición)
+        'CONN_HEALTH_CHECKS': os.environ.get('TIENDA_CONN_HEALTH_CHECKS', '1') == '1',
     }
 }
 
+# Réplicas de lectura (usuarios/routers.py). TIENDA_REPLICAS=host1,host2 agrega los alias
+# replica1, replica2... con la misma configuración que default y otro HOST. En las pruebas
+# son espejos de default (TEST MIRROR), como en settings_sqlite.py.
+REPLICAS = []
+for _numero, _host in enumerate(h.strip() for h in os.environ.get('TIENDA_REPLICAS', '').split(',') if h.strip()):
+    _alias = f'replica{_numero + 1}'
+    DATABASES[_alias] = {**DATABASES['default'], 'HOST': _host, 'TEST': {'MIRROR': 'default'}}
+    REPLICAS.append(_alias)
+
+DATABASE_ROUTERS = ['usuarios.routers.RouterReplicas']
+
+# Segundos que un usuario lee de la primaria tras escribir (cubre el retraso de replicación)
+REPLICA_VENTANA_SEGUNDOS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Tiene que ser compartida por todos los workers: la versión del catálogo, las del perfil,
+# las sesiones cacheadas y las cubetas de los límites viven aquí, y con una cache por
+# proceso cada worker vería las suyas (un worker no se enteraría de la invalidación de
+# otro). TIENDA_CACHE es obligatoria fuera de las pruebas:
+#   redis://host:6379/0               RedisCache
+#   memcached://host1:11211,host2:11211   PyMemcacheCache
+#   locmem                            por proceso: pruebas y settings_sqlite.py
+
+def _cache(url):
+    if url.startswith(('redis://', 'rediss://')):
+        return {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': url}
+    if url.startswith('memcached://'):
+        return {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': url.removeprefix('memcached://').split(','),
+        }
+    if url == 'locmem':
+        return {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tienda'}
+    raise ImproperlyConfigured(f'TIENDA_CACHE no reconocida: {url!r}')
+
+
+_CACHE = os.environ.get('TIENDA_CACHE') or ('locmem' if sys.argv[1:2] == ['test'] else None)
+if _CACHE is None:
+    raise ImproperlyConfigured('Falta TIENDA_CACHE (redis://... o memcached://...; locmem solo en pruebas)')
+CACHES = {'default': _cache(_CACHE)}
+
+# Duración (segundos) de los conteos de categorías de la página de compra
+FACETAS_TIMEOUT = 60 * 60
+
+# Foto del catálogo en memoria (usuarios/catalogo.py). 'hilo' la rearma en segundo plano
+# cuando cambia la versión y sirve la anterior mientras tanto; 'sincrono' la arma dentro
+# de la petición (pruebas: el hilo no vería los datos de la transacción del test).
+CATALOGO_REARMADO = os.environ.get('TIENDA_CATALOGO_REARMADO', 'hilo')
+
+# Duración (segundos) de los fragmentos cacheados del perfil; se invalidan por versión
+PERFIL_CACHE_TIMEOUT = 60 * 60
+
+# Límite de peticiones por nombre de URL (usuarios/limites.py). 'ip' y 'usuario' son
+# (capacidad, segundos): ráfaga máxima y tiempo en que la cubeta se rellena entera.
+# Las cubetas viven en la cache LIMITES_CACHE: con varios workers tiene que ser compartida.
+LIMITES_ACTIVOS = os.environ.get('TIENDA_LIMITES', '1') == '1'
+LIMITES_CACHE = 'default'
+LIMITES = {
+    'usuarios:login': {'metodos': ('POST',), 'ip': (20, 60), 'usuario': (5, 60)},
+    'usuarios:comprar': {'metodos': ('POST',), 'ip': (60, 60), 'usuario': (30, 60)},
+    'usuarios:carrito': {'metodos': ('POST',), 'ip': (60, 60), 'usuario': (30, 60)},
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -113,6 +206,45 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Hash de contraseñas (usuarios/hashers.py). TIENDA_HASHER elige el perfil preferido:
+# 'scrypt' (por defecto, solo stdlib), 'argon2' (requiere argon2-cffi) o 'pbkdf2' (el de Django).
+# Los demás quedan en la lista para verificar hashes anteriores, que se rehacen con el
+# perfil preferido en el siguiente login.
+HASHER_PERFIL = os.environ.get('TIENDA_HASHER', 'scrypt')
+
+HASHERS_POR_PERFIL = {
+    'scrypt': 'usuarios.hashers.ScryptAjustado',
+    'argon2': 'usuarios.hashers.Argon2Ajustado',
+    'pbkdf2': 'usuarios.hashers.PBKDF2Ajustado',
+}
+
+# Parámetros por perfil. scrypt: los de ScryptPasswordHasher de Django (N=2^14, r=8, p=5), una de
+# las configuraciones mínimas de OWASP; con p=1 costaría 5 veces menos que los hashes existentes y
+# must_update los reharía más débiles. argon2: el mínimo de OWASP (m=19 MiB, t=2, p=1).
+HASHER_PARAMETROS = {
+    'scrypt': {'work_factor': 2 ** 14, 'block_size': 8, 'parallelism': 5},
+    'argon2': {'time_cost': 2, 'memory_cost': 19 * 1024, 'parallelism': 1},
+    'pbkdf2': {'iterations': 1_000_000},
+}
+
+PASSWORD_HASHERS = [HASHERS_POR_PERFIL[HASHER_PERFIL]] + [
+    ruta for perfil, ruta in HASHERS_POR_PERFIL.items() if perfil != HASHER_PERFIL
+]
+
+# El usuario de la sesión se carga con su perfil en una sola consulta (usuarios/autenticacion.py).
+# ModelBackend queda para las sesiones iniciadas antes del cambio, que guardan su ruta.
+AUTHENTICATION_BACKENDS = [
+    'usuarios.autenticacion.PerfilBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Sesiones: 'db' (por defecto) o 'cached_db', que lee la sesión de la caché y solo va a
+# la base si no está. Con locmem la caché es por proceso: cada worker la llena por su cuenta.
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+}[os.environ.get('TIENDA_SESIONES', 'db')]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -141,3 +273,73 @@ LOGIN_REDIRECT_URL = 'usuarios:perfil'
 
 # A dónde ir después de cerrar sesión
 LOGOUT_REDIRECT_URL = 'usuarios:login'
+
+# Máximo de candidatos que IndiceCompacto.buscar envía a la base (los más relevantes)
+BUSQUEDA_MAX_CANDIDATOS = 1000
+
+# Filas por página en los listados paginados por cursor
+PAGINA_TAMANO = 20
+
+# Filas que cuenta como mucho el paginador de los changelists grandes del admin
+# (usuarios/paginacion.py: PaginadorEstimado); por encima se muestra una estimación.
+ADMIN_CONTEO_MAXIMO = 10_000
+
+# Filas por lote en la importación masiva de productos
+IMPORTACION_LOTE = 1000
+
+# Cola de tareas para los efectos de las compras (usuarios/tareas.py). 'cola' las guarda en la
+# tabla Tarea para el worker (manage.py procesar_tareas); 'sincrono' las ejecuta en el proceso al
+# confirmarse la transacción, sin worker (pruebas y desarrollo).
+TAREAS_EJECUTOR = os.environ.get('TIENDA_TAREAS', 'cola')
+# Intentos antes de marcar una tarea como fallida (queda en el admin para reintentarla)
+TAREAS_MAX_INTENTOS = 8
+# Espera entre reintentos, en segundos: 5, 10, 20... hasta una hora
+TAREAS_ESPERA_BASE = 5
+TAREAS_ESPERA_MAXIMA = 60 * 60
+# Segundos que un worker retiene una tarea reclamada; si no la termina, otro la retoma
+TAREAS_BLOQUEO = 5 * 60
+
+DEFAULT_FROM_EMAIL = os.environ.get('TIENDA_EMAIL_REMITENTE', 'tienda@localhost')
+
+# Vistas async (ProductosView, GET de comprar y PerfilView) para servir con ASGI/uvicorn.
+# TIENDA_VISTAS_ASYNC=1 las activa; por defecto se usan las síncronas.
+USUARIOS_VISTAS_ASYNC = os.environ.get('TIENDA_VISTAS_ASYNC', '0') == '1'
+
+# Fracción de peticiones que mide MetricasMiddleware (0 = desactivado, 1 = todas).
+# Con tráfico alto basta una fracción pequeña para que los histogramas sean representativos.
+METRICAS_MUESTREO = float(os.environ.get('TIENDA_METRICAS_MUESTREO', '0.1'))
+
+# Token para que Prometheus lea /usuarios/metricas/prometheus/ sin sesión (vacío = solo staff)
+METRICAS_TOKEN = os.environ.get('TIENDA_METRICAS_TOKEN', '')
+
+# Detector de N+1 y consultas lentas (usuarios/deteccion.py). Activo por defecto con DEBUG;
+# en staging se activa con TIENDA_DETECTOR_CONSULTAS=1.
+DETECTOR_CONSULTAS = os.environ.get('TIENDA_DETECTOR_CONSULTAS', '1' if DEBUG else '0') == '1'
+# Veces que una misma consulta normalizada se repite en una petición para considerarla N+1
+DETECTOR_REPETICIONES = 3
+# Umbral de consulta lenta, en milisegundos
+DETECTOR_LENTA_MS = 100
+# Convierte los N+1 detectados en excepción (lo activan las pruebas)
+DETECTOR_ESTRICTO = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        # Cada reporte ya es una línea JSON
+        'jsonl': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'consultas': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.environ.get('TIENDA_LOG_CONSULTAS', BASE_DIR / 'consultas.jsonl'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+            'formatter': 'jsonl',
+        },
+    },
+    'loggers': {
+        'usuarios.consultas': {'handlers': ['consultas'], 'level': 'WARNING', 'propagate': False},
+    },
+}
@@ -0,0 +1,28 @@
+"""Configuración local sin MySQL: SQLite con dos réplicas de lectura simuladas.
+
+    DJANGO_SETTINGS_MODULE=tienda.settings_sqlite python manage.py test usuarios
+
+Las réplicas apuntan al mismo archivo que default (replicación instantánea) y en
+las pruebas son espejos de la base de pruebas, así que el router de réplicas se
+ejercita con conexiones distintas sin necesitar otro servidor.
+"""
+import os
+
+# Un solo proceso: la cache por proceso alcanza (settings.py exige TIENDA_CACHE)
+os.environ.setdefault('TIENDA_CACHE', 'locmem')
+
+from .settings import *  # noqa: E402,F401,F403
+from .settings import BASE_DIR  # noqa: E402
+
+_SQLITE = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db.sqlite3',
+}
+
+DATABASES = {
+    'default': _SQLITE,
+    'replica1': {**_SQLITE, 'TEST': {'MIRROR': 'default'}},
+    'replica2': {**_SQLITE, 'TEST': {'MIRROR': 'default'}},
+}
+
+REPLICAS = ['replica1', 'replica2']
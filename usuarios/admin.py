@@ -1,5 +1,63 @@
+from django import forms
 from django.contrib import admin
-from .models import PerfilUsuario, Producto, Compra
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ERROR_FLAG, PAGE_VAR
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PerfilUsuario, Producto, Compra, EstadisticasCompras, Tarea, Auditoria
+from .paginacion import PaginadorEstimado
+
+
+class TablaGrandeAdmin(admin.ModelAdmin):
+    # tablas que crecen sin límite: ni COUNT(*) completo por página ni conteos por filtro
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+
+class ProductoAutocompletarFiltro(admin.SimpleListFilter):
+    """Filtro por producto con un select de autocompletado.
+
+    El filtro por FK de Django carga la tabla de productos entera en cada
+    página de la lista; este solo lee el producto elegido.
+    """
+    title = 'producto'
+    parameter_name = 'producto__id__exact'
+    template = 'admin/usuarios/filtro_autocompletar.html'
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        self.admin_site = model_admin.admin_site
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        valor = self.value()
+        if valor is None:
+            return queryset
+        if not valor.isdigit():
+            raise IncorrectLookupParameters(valor)
+        return queryset.filter(producto_id=valor)
+
+    def choices(self, changelist):
+        campo = forms.ModelChoiceField(
+            Producto.objects.only('nombre'), required=False,
+            widget=AutocompleteSelect(Compra._meta.get_field('producto'), self.admin_site),
+        )
+        ignorar = (self.parameter_name, PAGE_VAR, ERROR_FLAG)
+        yield {
+            'campo': campo.widget.render(self.parameter_name, self.value()),
+            'otros': [(k, v) for k, v in changelist.params.items() if k not in ignorar],
+            'activo': self.value() is not None,
+            'limpiar': changelist.get_query_string(remove=[self.parameter_name, PAGE_VAR]),
+        }
 
 @admin.register(PerfilUsuario)
 class PerfilUsuarioAdmin(admin.ModelAdmin):
@@ -8,20 +66,107 @@ class PerfilUsuarioAdmin(admin.ModelAdmin):
     list_filter = ('rol',) 
     # buscador que busca dentro de la tabla User relacionada
     search_fields = ('user__username', 'user__email', 'direccion')
+    # trae el User en la misma consulta (list_display y __str__ lo usan)
+    list_select_related = ('user',)
 
 @admin.register(Producto)
 class ProductoAdmin(admin.ModelAdmin):
-    list_display = ('nombre', 'categoria', 'costo', 'activo', 'creado_en')
+    list_display = ('nombre', 'categoria', 'costo', 'activo', 'stock', 'creado_en')
     # filtro de 'creado_en' para filtrar productos nuevos vs viejos
     list_filter = ('categoria', 'activo', 'creado_en') 
     search_fields = ('nombre', 'categoria')
     # barra de navegación por fecha 
     date_hierarchy = 'creado_en' 
+    # más nuevos primero, recorriendo el índice producto_creado_idx
+    ordering = ('-creado_en', '-id')
+
+    def get_queryset(self, request):
+        # la lista no muestra la descripción; el formulario de edición la carga aparte
+        qs = super().get_queryset(request)
+        changelist = f'{self.opts.app_label}_{self.opts.model_name}_changelist'
+        if request.resolver_match and request.resolver_match.url_name == changelist:
+            qs = qs.defer('descripcion')
+        return qs
+
+    def get_search_fields(self, request):
+        # El autocompletado de productos de CompraAdmin (una petición por tecla) busca por
+        # prefijo: recorre producto_nombre_idx / producto_categoria_idx en vez de LIKE '%x%'.
+        # La lista de productos sigue buscando por subcadena.
+        if request.resolver_match and request.resolver_match.url_name == 'autocomplete':
+            return ('^nombre', '^categoria')
+        return super().get_search_fields(request)
 
 @admin.register(Compra)
-class CompraAdmin(admin.ModelAdmin):
+class CompraAdmin(TablaGrandeAdmin):
     list_display = ('usuario', 'producto', 'cantidad', 'precio_unitario', 'total', 'fecha')
-    list_filter = ('fecha', 'producto')
+    list_filter = ('fecha', ProductoAutocompletarFiltro)
+    # por subcadena, como el resto del admin; ver get_search_results
     search_fields = ('usuario__username', 'producto__nombre')
-    # barra de navegación por fecha 
-    date_hierarchy = 'fecha'
\ No newline at end of file
+    # barra de navegación por fecha; los años/meses/días salen de los resúmenes de ventas
+    # (templates/admin/usuarios/compra/change_list.html), no de un DISTINCT sobre Compra
+    date_hierarchy = 'fecha'
+    # usuario y producto en un solo JOIN en vez de una consulta por fila
+    list_select_related = ('usuario', 'producto')
+    # el formulario de edición no carga todos los usuarios y productos en dos <select>
+    autocomplete_fields = ('usuario', 'producto')
+
+    @property
+    def media(self):
+        # el filtro de producto usa el widget de autocompletado en la lista
+        widget = AutocompleteSelect(Compra._meta.get_field('producto'), self.admin_site)
+        return super().media + widget.media
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.select_related('usuario', 'producto').defer('producto__descripcion')
+
+    def get_search_results(self, request, queryset, search_term):
+        # La búsqueda de Django hace LIKE sobre los JOIN con un OR entre tablas, que
+        # recorre Compra entera. Aquí el LIKE va en subconsultas sobre usuarios y
+        # productos (tablas chicas), sin tope de coincidencias, y Compra se filtra
+        # por sus FK (compra_usuario_*/compra_producto_*).
+        termino = search_term.strip()
+        if not termino:
+            return queryset, False
+        usuarios = User.objects.filter(username__icontains=termino).values('id')
+        productos = Producto.objects.filter(nombre__icontains=termino).values('id')
+        return queryset.filter(Q(usuario_id__in=usuarios) | Q(producto_id__in=productos)), False
+
+@admin.register(EstadisticasCompras)
+class EstadisticasComprasAdmin(admin.ModelAdmin):
+    # resumen precalculado: se lee en O(1), se mantiene desde las señales de Compra
+    list_display = ('usuario', 'num_compras', 'unidades', 'total_gastado', 'ultima_compra')
+    list_select_related = ('usuario',)
+    search_fields = ('usuario__username',)
+    ordering = ('-total_gastado',)
+    readonly_fields = ('usuario', 'total_gastado', 'num_compras', 'unidades', 'ultima_compra')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    # cola de tareas (ver tareas.py): las terminadas se borran, aquí quedan pendientes y fallidas
+    list_display = ('nombre', 'estado', 'intentos', 'disponible_en', 'creada_en')
+    list_filter = ('estado', 'nombre')
+    ordering = ('disponible_en', 'id')
+    readonly_fields = ('trabajador', 'ultimo_error', 'creada_en')
+    actions = ['reintentar']
+
+    @admin.action(description='Reintentar ahora')
+    def reintentar(self, request, queryset):
+        actualizadas = queryset.update(estado=Tarea.PENDIENTE, intentos=0, disponible_en=timezone.now())
+        self.message_user(request, f'{actualizadas} tareas reencoladas.')
+
+@admin.register(Auditoria)
+class AuditoriaAdmin(TablaGrandeAdmin):
+    list_display = ('fecha', 'accion', 'usuario')
+    list_filter = ('accion',)
+    list_select_related = ('usuario',)
+    search_fields = ('usuario__username',)
+    ordering = ('-fecha', '-id')
+    readonly_fields = ('evento', 'accion', 'usuario', 'datos', 'fecha')
+
+    def has_add_permission(self, request):
+        return False
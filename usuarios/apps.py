@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UsuariosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'usuarios'
+
+    def ready(self):
+        # Registra los receptores de señales
+        from . import signals  # noqa: F401
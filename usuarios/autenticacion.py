@@ -0,0 +1,29 @@
+"""Backend de autenticación que carga el usuario junto con su perfil.
+
+AuthenticationMiddleware pide el usuario de la sesión una vez por petición
+(get_user) y lo guarda en request.user. Con select_related('perfil') el perfil
+llega en el mismo JOIN: request.user.perfil y perfil.user no consultan más.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+
+class PerfilBackend(ModelBackend):
+    def _usuarios(self):
+        return UserModel._default_manager.select_related('perfil')
+
+    def get_user(self, user_id):
+        try:
+            user = self._usuarios().get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        try:
+            user = await self._usuarios().aget(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,196 @@
+"""Utilidades compartidas por los comandos bench_* (datos sintéticos y medición)."""
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from .models import PerfilUsuario, Producto
+
+
+CATEGORIAS = ['Bebidas', 'Tecnología', 'Electrónica', 'Hogar', 'Jardín', 'Papelería', 'Lácteos', 'Panadería']
+PALABRAS = [
+    'café', 'azúcar', 'leche', 'camión', 'teléfono', 'cámara', 'lápiz', 'cuaderno', 'mesa',
+    'silla', 'lámpara', 'pan', 'queso', 'jugo', 'agua', 'televisión', 'portátil', 'ratón',
+    'teclado', 'maceta', 'manguera', 'cepillo', 'jabón', 'galleta', 'yogur', 'refresco',
+]
+
+
+@contextmanager
+def base_temporal(en_archivo=False):
+    # Igual que `manage.py test`: entorno de pruebas (ALLOWED_HOSTS con 'testserver',
+    # correo en memoria) y una base desechable que se destruye al salir.
+    # en_archivo: con SQLite, base en un archivo temporal en vez de en memoria; hace falta
+    # para cerrar conexiones de verdad o para escrituras concurrentes desde varios hilos.
+    with tempfile.TemporaryDirectory() as directorio:
+        test = connection.settings_dict['TEST']
+        nombre_test = test['NAME']
+        if en_archivo and connection.vendor == 'sqlite' and not nombre_test:
+            test['NAME'] = os.path.join(directorio, 'bench.sqlite3')
+        setup_test_environment()
+        nombre_original = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            teardown_test_environment()
+            test['NAME'] = nombre_test
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(ordenados) - 1)
+    return ordenados[i] + (ordenados[j] - ordenados[i]) * (k - i)
+
+
+def resumir(tiempos):
+    # Tiempos en segundos -> estadísticas en milisegundos
+    ms = [t * 1000 for t in tiempos]
+    return {
+        'n': len(ms),
+        'media_ms': round(statistics.fmean(ms), 3) if ms else 0.0,
+        'p50_ms': round(percentil(ms, 50), 3),
+        'p95_ms': round(percentil(ms, 95), 3),
+        'p99_ms': round(percentil(ms, 99), 3),
+    }
+
+
+def medir(funcion, repeticiones=50, calentamiento=3):
+    for _ in range(calentamiento):
+        funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return resumir(tiempos)
+
+
+def sembrar_productos(n, lote=5000, semilla=0):
+    azar = random.Random(semilla)
+    creados = 0
+    while creados < n:
+        tam = min(lote, n - creados)
+        Producto.objects.bulk_create([
+            Producto(
+                nombre=' '.join(azar.sample(PALABRAS, 3)).capitalize() + f' {creados + i}',
+                descripcion='',
+                categoria=azar.choice(CATEGORIAS),
+                costo=Decimal(azar.randint(100, 100000)) / 100,
+                activo=azar.random() > 0.1,
+            )
+            for i in range(tam)
+        ], batch_size=lote)
+        creados += tam
+    return creados
+
+
+def sembrar_usuarios(n, lote=5000, prefijo='cliente', password='bench'):
+    # El hash se calcula una sola vez: con el hasher por defecto cada uno tarda cientos de ms
+    clave = make_password(password)
+    existentes = User.objects.filter(username__startswith=prefijo).count()
+    usuarios = User.objects.bulk_create(
+        [User(username=f'{prefijo}{existentes + i}', email=f'{prefijo}{existentes + i}@correo.com', password=clave)
+         for i in range(n)],
+        batch_size=lote,
+    )
+    if any(u.pk is None for u in usuarios):
+        # Motores sin RETURNING en bulk_create (MySQL): se releen los ids
+        usuarios = list(User.objects.filter(username__startswith=prefijo).order_by('-id')[:n])
+    PerfilUsuario.objects.bulk_create([PerfilUsuario(user=u) for u in usuarios], batch_size=lote)
+    return usuarios
+
+
+@contextmanager
+def sin_auto_now_add(modelo, campo):
+    # bulk_create pisa los campos auto_now_add con la hora actual: se apaga mientras se siembra
+    field = modelo._meta.get_field(campo)
+    original, field.auto_now_add = field.auto_now_add, False
+    try:
+        yield
+    finally:
+        field.auto_now_add = original
+
+
+def sembrar_compras(usuarios, n, lote=5000, semilla=0, dias=0):
+    """Crea n compras repartidas al azar entre `usuarios` (uno o una lista).
+
+    Con `dias`, las fechas se reparten al azar entre ahora y `dias` días atrás.
+    """
+    from .models import Compra
+    from .estadisticas import recalcular_usuarios
+    from .ventas import rango_compras, reconstruir_ventas
+
+    if not isinstance(usuarios, (list, tuple)):
+        usuarios = [usuarios]
+    ids = [u.pk for u in usuarios]
+    azar = random.Random(semilla)
+    productos = list(Producto.objects.values_list('id', 'costo')[:1000])
+    ahora = timezone.now()
+    creados = 0
+    with sin_auto_now_add(Compra, 'fecha'):
+        while creados < n:
+            tam = min(lote, n - creados)
+            filas = []
+            for _ in range(tam):
+                producto_id, costo = azar.choice(productos)
+                cantidad = azar.randint(1, 5)
+                filas.append(Compra(
+                    usuario_id=azar.choice(ids), producto_id=producto_id, cantidad=cantidad,
+                    precio_unitario=costo, total=costo * cantidad,
+                    fecha=ahora - timedelta(seconds=azar.randrange(dias * 86400)) if dias else ahora,
+                ))
+            Compra.objects.bulk_create(filas, batch_size=lote)
+            creados += tam
+    # bulk_create no pasa por las señales: los resúmenes se arman al final
+    for i in range(0, len(ids), lote):
+        recalcular_usuarios(ids[i:i + lote])
+    rango = rango_compras()
+    if rango:
+        reconstruir_ventas(*rango)
+    return creados
+
+
+async def peticion_asgi(app, ruta, cookie='', metodo='GET', cuerpo=b'', cabeceras=()):
+    """Una petición directa a la aplicación ASGI, sin servidor ni sockets; devuelve el status."""
+    ruta, _, consulta = ruta.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': metodo, 'scheme': 'http', 'path': ruta, 'raw_path': ruta.encode(),
+        'query_string': consulta.encode(), 'root_path': '',
+        'headers': [
+            (b'host', b'testserver'), (b'cookie', cookie.encode()),
+            (b'content-length', str(len(cuerpo)).encode()),
+            *[(k.lower().encode(), v.encode()) for k, v in cabeceras],
+        ],
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    estado = {}
+    mensajes = [{'type': 'http.request', 'body': cuerpo, 'more_body': False}]
+
+    async def receive():
+        # Tras el cuerpo, el servidor solo avisaría de una desconexión: se espera indefinidamente
+        if mensajes:
+            return mensajes.pop()
+        await asyncio.Future()
+
+    async def send(mensaje):
+        if mensaje['type'] == 'http.response.start':
+            estado['status'] = mensaje['status']
+
+    await app(scope, receive, send)
+    return estado.get('status')
@@ -0,0 +1,128 @@
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Case, IntegerField, Value, When
+
+
+# --- NORMALIZACIÓN ---
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def normalizar(texto):
+    # Minúsculas y sin acentos: "Camión" y "camion" deben coincidir
+    texto = unicodedata.normalize('NFKD', texto or '').lower()
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def tokenizar(texto):
+    return _TOKEN_RE.findall(normalizar(texto))
+
+
+# --- ÍNDICE ---
+
+class IndiceCompacto:
+    """Índice invertido inmutable de productos, para la foto del catálogo (catalogo.py).
+
+    Puntúa por tokens normalizados: el nombre pesa más que la categoría, el
+    último token de la búsqueda se toma como prefijo y una coincidencia exacta
+    vale el doble. En vez de un dict por token, los (id, peso) de cada token van
+    seguidos en dos arreglos planos y el vocabulario ordenado marca dónde empieza
+    cada uno: con 100k productos ocupa una fracción de la memoria. Se arma una
+    vez con las filas (id, nombre, categoria) y se lee sin lock.
+    """
+
+    PESO_NOMBRE = 2
+    PESO_CATEGORIA = 1
+
+    def __init__(self, filas):
+        por_token = defaultdict(list)
+        for producto_id, nombre, categoria in filas:
+            for token, peso in self._pesos(nombre, categoria).items():
+                por_token[token].append((producto_id, peso))
+        self._vocabulario = sorted(por_token)
+        self._inicios = array('q', [0])
+        self._ids = array('q')
+        self._pesos_de = array('H')
+        for token in self._vocabulario:
+            for producto_id, peso in por_token.pop(token):
+                self._ids.append(producto_id)
+                self._pesos_de.append(peso)
+            self._inicios.append(len(self._ids))
+
+    def _pesos(self, nombre, categoria):
+        pesos = defaultdict(int)
+        for token in tokenizar(nombre):
+            pesos[token] += self.PESO_NOMBRE
+        for token in tokenizar(categoria):
+            pesos[token] += self.PESO_CATEGORIA
+        return pesos
+
+    def _lista(self, i):
+        inicio, fin = self._inicios[i], self._inicios[i + 1]
+        return zip(self._ids[inicio:fin], self._pesos_de[inicio:fin])
+
+    def _coincidencias(self, token, prefijo):
+        vocabulario = self._vocabulario
+        i = bisect_left(vocabulario, token)
+        if not prefijo:
+            if i < len(vocabulario) and vocabulario[i] == token:
+                return dict(self._lista(i))
+            return {}
+        # El último token se trata como prefijo (búsqueda mientras se escribe)
+        resultado = {}
+        while i < len(vocabulario) and vocabulario[i].startswith(token):
+            exacto = vocabulario[i] == token
+            for producto_id, peso in self._lista(i):
+                puntos = peso * 2 if exacto else peso
+                resultado[producto_id] = max(resultado.get(producto_id, 0), puntos)
+            i += 1
+        return resultado
+
+    def puntuar(self, termino):
+        """Devuelve {producto_id: puntos}; todos los tokens deben coincidir."""
+        tokens = tokenizar(termino)
+        if not tokens:
+            return {}
+        puntos = None
+        for n, token in enumerate(tokens):
+            coincidencias = self._coincidencias(token, prefijo=n == len(tokens) - 1)
+            if puntos is None:
+                puntos = coincidencias
+            else:
+                puntos = {
+                    pid: p + coincidencias[pid]
+                    for pid, p in puntos.items() if pid in coincidencias
+                }
+            if not puntos:
+                return {}
+        return puntos
+
+    def buscar(self, queryset, termino):
+        """Filtra un queryset de Producto a las coincidencias y lo anota con `relevancia`.
+
+        Las vistas paginan la foto en memoria; esto es la misma búsqueda hecha en
+        la base, para comparar (benchmarks y pruebas).
+        """
+        puntos = self.puntuar(termino)
+        limite = getattr(settings, 'BUSQUEDA_MAX_CANDIDATOS', None)
+        if limite and len(puntos) > limite:
+            # Solo los más relevantes viajan a la base de datos en el IN (...)
+            mejores = sorted(puntos.items(), key=lambda par: (-par[1], par[0]))[:limite]
+            puntos = dict(mejores)
+        if not puntos:
+            return queryset.none().annotate(relevancia=Value(0, output_field=IntegerField()))
+        # Un When por valor de puntuación distinto, no uno por producto
+        por_puntos = defaultdict(list)
+        for producto_id, p in puntos.items():
+            por_puntos[p].append(producto_id)
+        relevancia = Case(
+            *[When(pk__in=ids, then=Value(p)) for p, ids in por_puntos.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=list(puntos)).annotate(relevancia=relevancia)
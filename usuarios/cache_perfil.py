@@ -0,0 +1,37 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _clave(usuario_id):
+    return f'perfil:version:{usuario_id}'
+
+
+def version_perfil(usuario_id):
+    # Forma parte de la clave de los fragmentos {% cache %} de perfil.html
+    version = cache.get(_clave(usuario_id))
+    if version is None:
+        cache.add(_clave(usuario_id), time.time_ns(), None)
+        version = cache.get(_clave(usuario_id))
+    return version
+
+
+async def aversion_perfil(usuario_id):
+    version = await cache.aget(_clave(usuario_id))
+    if version is None:
+        await cache.aadd(_clave(usuario_id), time.time_ns(), None)
+        version = await cache.aget(_clave(usuario_id))
+    return version
+
+
+def _subir_version(usuario_id):
+    try:
+        cache.incr(_clave(usuario_id))
+    except ValueError:
+        cache.add(_clave(usuario_id), time.time_ns(), None)
+
+
+def invalidar_perfil(usuario_id):
+    # Tras el commit: si se invalida antes, otra petición podría volver a cachear datos viejos
+    transaction.on_commit(lambda: _subir_version(usuario_id))
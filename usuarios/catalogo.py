@@ -0,0 +1,205 @@
+"""Foto del catálogo en memoria del proceso, versionada con la versión del catálogo.
+
+Cada proceso guarda una foto inmutable de los productos (id, nombre, categoria,
+costo, activo, creado_en), con los activos por categoría, sus conteos y el índice
+de búsqueda por tokens normalizados ya armados. Listar, filtrar por categoría y
+buscar no consultan la base: solo se compara la versión del catálogo (facetas.py,
+en la cache compartida) con la de la foto. Cuando un cambio de Producto la sube,
+cada proceso arma una foto nueva (una consulta a la primaria) en un hilo aparte
+y sigue sirviendo la anterior hasta que esté lista.
+
+El stock y la descripción no están en la foto (el stock cambia con cada compra):
+la página de compra los lee solo para las filas que muestra (cargar_productos).
+"""
+import sys
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from typing import NamedTuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .busqueda import IndiceCompacto
+from .facetas import aversion_catalogo, version_catalogo
+from .models import Producto
+from .paginacion import PaginaMemoria
+
+ORDEN_RECIENTES = ('-creado_en', '-id')
+ORDEN_RELEVANCIA = ('-relevancia', 'id')
+
+_EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSEGUNDO = timedelta(microseconds=1)
+
+
+class ProductoCatalogo(NamedTuple):
+    id: int
+    nombre: str
+    categoria: str
+    costo: Decimal
+    activo: bool
+    creado_en: datetime
+
+    @property
+    def pk(self):
+        return self.id
+
+
+def _valores_recientes(producto):
+    return producto.creado_en, producto.id
+
+
+def _clave_recientes(valores):
+    # (-creado_en, -id) como enteros exactos, creciente en el orden de la foto
+    creado_en, producto_id = valores
+    return -((creado_en - _EPOCA) // _MICROSEGUNDO), -producto_id
+
+
+class Catalogo:
+    def __init__(self, version, productos):
+        self.version = version
+        # Todos, más nuevos primero (ProductosView también lista los inactivos)
+        self.productos = tuple(productos)
+        self.activos = tuple(p for p in self.productos if p.activo)
+        self._por_id = {p.id: p for p in self.activos}
+        por_categoria = defaultdict(list)
+        for producto in self.activos:
+            por_categoria[producto.categoria].append(producto)
+        self.por_categoria = {categoria: tuple(lista) for categoria, lista in por_categoria.items()}
+        self.conteos = sorted((categoria, len(lista)) for categoria, lista in self.por_categoria.items())
+        self.indice = IndiceCompacto((p.id, p.nombre, p.categoria) for p in self.activos)
+
+    @classmethod
+    def construir(cls, version):
+        # De la primaria: la versión sube al confirmar, y una réplica atrasada dejaría
+        # filas viejas guardadas con la versión nueva hasta el próximo cambio
+        filas = (
+            Producto.objects.using(DEFAULT_DB_ALIAS)
+            .order_by(*ORDEN_RECIENTES)
+            .values_list(*ProductoCatalogo._fields)
+        )
+        # Las categorías se repiten: una sola copia de cada texto
+        productos = (
+            ProductoCatalogo(pid, nombre, sys.intern(categoria), costo, activo, creado_en)
+            for pid, nombre, categoria, costo, activo, creado_en in filas.iterator(chunk_size=2000)
+        )
+        return cls(version, productos)
+
+    def _puntos(self, search):
+        return {pid: p for pid, p in self.indice.puntuar(search).items() if pid in self._por_id}
+
+    def pagina(self, cursor=None, tamano=20, search='', categoria='', solo_activos=True):
+        """Página de productos (activos por defecto) filtrados por búsqueda y categoría.
+
+        Sin búsqueda, más nuevos primero; con búsqueda, por relevancia. Los
+        cursores son los de PaginaKeyset con el mismo orden.
+        """
+        if not search:
+            if not solo_activos:
+                filas = self.productos
+            elif categoria:
+                filas = self.por_categoria.get(categoria, ())
+            else:
+                filas = self.activos
+            return PaginaMemoria(filas, Producto, ORDEN_RECIENTES, _valores_recientes, _clave_recientes, cursor, tamano)
+
+        puntos = self._puntos(search)
+        candidatos = [self._por_id[pid] for pid in puntos]
+        if categoria:
+            candidatos = [p for p in candidatos if p.categoria == categoria]
+        candidatos.sort(key=lambda p: (-puntos[p.id], p.id))
+        return PaginaMemoria(
+            candidatos, Producto, ORDEN_RELEVANCIA,
+            lambda p: (puntos[p.id], p.id), lambda valores: (-valores[0], valores[1]),
+            cursor, tamano,
+        )
+
+    def conteos_categorias(self, search=''):
+        if not search:
+            return list(self.conteos)
+        conteos = Counter(self._por_id[pid].categoria for pid in self._puntos(search))
+        return sorted(conteos.items())
+
+
+_actual = None
+_hilo = None
+_lock = threading.Lock()
+
+
+def _rearmar():
+    global _actual
+    try:
+        # La versión se lee antes que los productos: si cambian mientras tanto, la foto
+        # queda con datos nuevos y versión vieja y se vuelve a armar (nunca al revés)
+        _actual = Catalogo.construir(version_catalogo())
+    finally:
+        # La conexión de este hilo no la cierra el ciclo de ninguna petición
+        connections.close_all()
+
+
+def _hilo_rearmado():
+    # Un solo rearmado a la vez por proceso
+    global _hilo
+    with _lock:
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_rearmar, name='catalogo-rearmado', daemon=True)
+            _hilo.start()
+        return _hilo
+
+
+def _armar_en_la_peticion(version):
+    global _actual
+    with _lock:
+        if _actual is None or _actual.version != version:
+            _actual = Catalogo.construir(version)
+        return _actual
+
+
+def obtener_catalogo():
+    """La foto del proceso.
+
+    Si la versión del catálogo cambió se rearma en un hilo aparte y, mientras
+    tanto, se sigue sirviendo la anterior: solo la primera foto del proceso se
+    espera. Con CATALOGO_REARMADO='sincrono' (pruebas) se arma en la petición.
+    """
+    version = version_catalogo()
+    actual = _actual
+    if actual is not None and actual.version == version:
+        return actual
+    if settings.CATALOGO_REARMADO == 'sincrono':
+        return _armar_en_la_peticion(version)
+    hilo = _hilo_rearmado()
+    if actual is None:
+        hilo.join()
+        # Si el hilo falló, se arma aquí para que el error llegue a la petición
+        return _actual or _armar_en_la_peticion(version)
+    return actual
+
+
+async def aobtener_catalogo():
+    # Igual que obtener_catalogo sin bloquear el event loop
+    version = await aversion_catalogo()
+    actual = _actual
+    if actual is not None and actual.version == version:
+        return actual
+    if settings.CATALOGO_REARMADO == 'sincrono':
+        return await sync_to_async(_armar_en_la_peticion)(version)
+    hilo = _hilo_rearmado()
+    if actual is None:
+        # Esperar al hilo no usa la base: fuera del ejecutor compartido de sync_to_async
+        await sync_to_async(hilo.join, thread_sensitive=False)()
+        return _actual or await sync_to_async(_armar_en_la_peticion)(version)
+    return actual
+
+
+def cargar_productos(filas):
+    """Los Producto completos de las filas de una página, en el mismo orden (una consulta por pk)."""
+    en_bd = Producto.objects.in_bulk([fila.id for fila in filas])
+    return [en_bd[fila.id] for fila in filas if fila.id in en_bd]
+
+
+async def acargar_productos(filas):
+    en_bd = await Producto.objects.ain_bulk([fila.id for fila in filas])
+    return [en_bd[fila.id] for fila in filas if fila.id in en_bd]
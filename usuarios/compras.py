@@ -0,0 +1,100 @@
+from collections import defaultdict
+
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .cache_perfil import invalidar_perfil
+from .estadisticas import registrar_compras
+from .models import Compra, Producto
+from .tareas import encolar_efectos_compra
+from .ventas import registrar_ventas
+
+
+class LineaInvalida(ValueError):
+    pass
+
+
+class StockInsuficiente(LineaInvalida):
+    def __init__(self, producto_ids):
+        self.producto_ids = producto_ids
+        super().__init__(f"Sin stock suficiente: {producto_ids}")
+
+
+def normalizar_lineas(lineas):
+    # Junta líneas repetidas del mismo producto y valida las cantidades
+    cantidades = defaultdict(int)
+    for producto_id, cantidad in lineas:
+        try:
+            producto_id, cantidad = int(producto_id), int(cantidad)
+        except (TypeError, ValueError):
+            raise LineaInvalida(f"Línea inválida: {producto_id!r} x {cantidad!r}")
+        if cantidad < 1:
+            raise LineaInvalida(f"Cantidad inválida para el producto {producto_id}")
+        cantidades[producto_id] += cantidad
+    if not cantidades:
+        raise LineaInvalida("El carrito está vacío")
+    return cantidades
+
+
+def descontar_stock(cantidades):
+    """Descuenta {producto_id: cantidad} con un solo UPDATE condicional.
+
+    El WHERE exige stock >= cantidad en cada fila (o stock NULL, sin control), así
+    que dos compras simultáneas nunca venden de más: la segunda espera el bloqueo
+    de fila de la primera y, si ya no alcanza, no coincide. Si alguna fila no se
+    actualiza se lanza StockInsuficiente; llamar dentro de transaction.atomic()
+    para que se deshagan también las demás.
+    """
+    pedido = Case(
+        *[When(pk=producto_id, then=Value(cantidad)) for producto_id, cantidad in cantidades.items()],
+        output_field=models.PositiveIntegerField(),
+    )
+    actualizados = (
+        Producto.objects.filter(pk__in=list(cantidades))
+        .filter(Q(stock__isnull=True) | Q(stock__gte=pedido))
+        .update(
+            stock=F('stock') - pedido,
+            # El catálogo muestra el stock: cambia su ETag (sin control de stock no cambia nada)
+            actualizado_en=Case(When(stock__isnull=False, then=Value(timezone.now())), default=F('actualizado_en')),
+        )
+    )
+    if actualizados != len(cantidades):
+        sin_stock = sorted(
+            Producto.objects.filter(pk__in=list(cantidades), stock__isnull=False)
+            .filter(stock__lt=pedido).values_list('pk', flat=True)
+        )
+        raise StockInsuficiente(sin_stock)
+
+
+def comprar_carrito(usuario, lineas):
+    """Crea una Compra por producto del carrito en una sola transacción.
+
+    `lineas` es un iterable de (producto_id, cantidad). Los productos se leen
+    con una única consulta (in_bulk), el stock se descuenta con un UPDATE
+    condicional y las compras se insertan con bulk_create. El correo, la
+    auditoría y los resúmenes de ventas se encolan como una sola compra (ver
+    tareas.py y ventas.py).
+    """
+    cantidades = normalizar_lineas(lineas)
+    productos = Producto.objects.filter(activo=True).only('id', 'costo', 'categoria').in_bulk(list(cantidades))
+    faltantes = sorted(set(cantidades) - set(productos))
+    if faltantes:
+        raise LineaInvalida(f"Productos no disponibles: {faltantes}")
+
+    compras = []
+    for producto_id, cantidad in cantidades.items():
+        producto = productos[producto_id]
+        compra = Compra(usuario=usuario, producto=producto, cantidad=cantidad, precio_unitario=producto.costo)
+        compra.calcular_total()
+        compras.append(compra)
+
+    with transaction.atomic():
+        descontar_stock(cantidades)
+        Compra.objects.bulk_create(compras)
+        # bulk_create no envía post_save: el resumen del usuario se actualiza aquí
+        registrar_compras(compras)
+        registrar_ventas(compras)
+        invalidar_perfil(usuario.pk)
+        encolar_efectos_compra(usuario.pk, compras)
+    return compras
@@ -0,0 +1,91 @@
+"""Respuestas condicionales (ETag) para las páginas del catálogo.
+
+El ETag combina la última edición de productos (una consulta sobre
+producto_actualizado_idx), la versión de la foto del catálogo que va a servir
+la página (catalogo.py; también cambia con los borrados, que no dejan fecha),
+los parámetros de la URL y lo que la página muestra del usuario. Si coincide
+con If-None-Match se responde 304 sin consultar ni renderizar el catálogo.
+
+No se envía Last-Modified: MAX(actualizado_en) en segundos no cambia con un
+borrado ni con dos ediciones en el mismo segundo, y un cliente que solo manda
+If-Modified-Since recibiría un 304 con la página vieja.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .catalogo import aobtener_catalogo, obtener_catalogo
+from .models import Producto
+
+
+def ultima_modificacion():
+    return Producto.objects.aggregate(ultima=Max('actualizado_en'))['ultima']
+
+
+async def aultima_modificacion():
+    return (await Producto.objects.aaggregate(ultima=Max('actualizado_en')))['ultima']
+
+
+def etag_catalogo(request, usuario, ultima, version):
+    partes = [
+        ultima.isoformat() if ultima else '',
+        version,
+        sorted(request.GET.lists()),
+        usuario.pk,
+        usuario.is_staff,
+        # Los formularios llevan el token CSRF: si cambia el secreto, la copia guardada no sirve
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ]
+    # Débil: el HTML cambia entre renders (token CSRF enmascarado) sin cambiar de contenido
+    return 'W/"%s"' % hashlib.md5(repr(partes).encode()).hexdigest()
+
+
+def _aplica(request):
+    # Los mensajes pendientes se muestran (y consumen) en la página: no puede ser un 304
+    return request.method in ('GET', 'HEAD') and not get_messages(request)
+
+
+def _condicional(request, usuario, ultima, version):
+    etag = etag_catalogo(request, usuario, ultima, version)
+    return get_conditional_response(request, etag=etag), etag
+
+
+def _cabeceras(response, etag):
+    if response.status_code not in (200, 304):
+        return response
+    response.headers.setdefault('ETag', etag)
+    # Páginas con sesión: el navegador las guarda pero revalida siempre; un CDN no las comparte
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def catalogo_condicional(vista):
+    """Decorador de vistas del catálogo (síncronas o async) que ya exigen sesión."""
+    if iscoroutinefunction(vista):
+        @wraps(vista)
+        async def envoltura(request, *args, **kwargs):
+            usuario = await request.auser()
+            if not usuario.is_authenticated or not _aplica(request):
+                return await vista(request, *args, **kwargs)
+            response, etag = _condicional(
+                request, usuario, await aultima_modificacion(), (await aobtener_catalogo()).version,
+            )
+            if response is None:
+                response = await vista(request, *args, **kwargs)
+            return _cabeceras(response, etag)
+        return envoltura
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if not request.user.is_authenticated or not _aplica(request):
+            return vista(request, *args, **kwargs)
+        response, etag = _condicional(request, request.user, ultima_modificacion(), obtener_catalogo().version)
+        if response is None:
+            response = vista(request, *args, **kwargs)
+        return _cabeceras(response, etag)
+    return envoltura
@@ -0,0 +1,188 @@
+import json
+import logging
+import re
+import sys
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('usuarios.consultas')
+
+# Detección de la petición en curso (ver metricas.py para el mismo patrón)
+_actual = ContextVar('deteccion_consultas', default=None)
+
+_RAIZ = Path(__file__).resolve().parent.parent
+_ESTE_ARCHIVO = str(Path(__file__).resolve())
+
+
+class ConsultasRepetidas(AssertionError):
+    """En modo estricto (pruebas), una petición con N+1 falla con esta excepción."""
+
+
+# --- HUELLAS ---
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+_VALORES = re.compile(r'(VALUES\s*\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+', re.IGNORECASE)
+_ESPACIOS = re.compile(r'\s+')
+# Control de transacciones: se repite siempre y no es un N+1
+_IGNORADAS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT', 'BEGIN', 'COMMIT', 'ROLLBACK')
+
+
+def huella(sql):
+    """SQL normalizado: sin literales y con las listas IN (...) / VALUES colapsadas."""
+    sql = _LITERALES.sub('?', sql)
+    sql = _LISTAS.sub('(...)', sql)
+    sql = _VALORES.sub(r'\1', sql)
+    return _ESPACIOS.sub(' ', sql).strip()
+
+
+# --- ORIGEN EN EL CÓDIGO ---
+
+def _pila():
+    """Frames del proyecto (no de Django ni de este módulo) y la plantilla que se renderizaba."""
+    frames, plantilla = [], None
+    frame = sys._getframe(1)
+    while frame is not None:
+        archivo = frame.f_code.co_filename
+        if plantilla is None and frame.f_code.co_name == 'render_annotated':
+            # Nodo de plantilla que disparó la consulta (p. ej. {{ compra.producto.nombre }})
+            nodo = frame.f_locals.get('self')
+            origen = getattr(nodo, 'origin', None)
+            token = getattr(nodo, 'token', None)
+            if origen is not None and token is not None:
+                plantilla = f'{origen.template_name or origen.name}:{token.lineno}'
+        if archivo.startswith(str(_RAIZ)) and archivo != _ESTE_ARCHIVO and 'site-packages' not in archivo:
+            frames.append(f'{Path(archivo).relative_to(_RAIZ)}:{frame.f_lineno} en {frame.f_code.co_name}')
+        frame = frame.f_back
+    return frames[:8], plantilla
+
+
+# --- DETECCIÓN ---
+
+class Deteccion:
+    """Acumula las consultas de una petición agrupadas por huella."""
+
+    def __init__(self, repeticiones, umbral_ms):
+        self.repeticiones = repeticiones
+        self.umbral_ms = umbral_ms
+        self.huellas = {}   # huella -> {'veces', 'ms', 'sql', 'pila', 'plantilla'}
+        self.lentas = []
+
+    def registrar(self, sql, ms):
+        if sql.lstrip().upper().startswith(_IGNORADAS):
+            return
+        clave = huella(sql)
+        datos = self.huellas.get(clave)
+        if datos is None:
+            datos = self.huellas[clave] = {'veces': 0, 'ms': 0.0, 'sql': sql, 'pila': None, 'plantilla': None}
+        datos['veces'] += 1
+        datos['ms'] += ms
+        if datos['veces'] == 2:
+            # La pila se toma en la primera repetición: apunta al bucle que la causa
+            datos['pila'], datos['plantilla'] = _pila()
+        if ms >= self.umbral_ms:
+            pila, plantilla = _pila()
+            self.lentas.append({'sql': sql, 'ms': round(ms, 2), 'pila': pila, 'plantilla': plantilla})
+
+    def repetidas(self):
+        return [
+            {'huella': clave, **datos, 'ms': round(datos['ms'], 2)}
+            for clave, datos in self.huellas.items() if datos['veces'] >= self.repeticiones
+        ]
+
+    def reporte(self, request):
+        repetidas = self.repetidas()
+        if not repetidas and not self.lentas:
+            return None
+        coincidencia = getattr(request, 'resolver_match', None)
+        return {
+            'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'vista': coincidencia.view_name if coincidencia else None,
+            'metodo': request.method,
+            'ruta': request.path,
+            'consultas': sum(d['veces'] for d in self.huellas.values()),
+            'repetidas': repetidas,
+            'lentas': self.lentas,
+        }
+
+
+def detectar_sql(execute, sql, params, many, context):
+    deteccion = _actual.get()
+    if deteccion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        deteccion.registrar(sql, (time.perf_counter() - inicio) * 1000)
+
+
+def instalar_en_conexion(connection, **kwargs):
+    if detectar_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(detectar_sql)
+
+
+class DetectorConsultasMiddleware:
+    """Registra en usuarios.consultas (JSONL rotativo) los N+1 y las consultas lentas.
+
+    Pensado para desarrollo y staging (DETECTOR_CONSULTAS). Con DETECTOR_ESTRICTO,
+    además, la petición falla con ConsultasRepetidas: así lo usan las pruebas.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            instalar_en_conexion(connection)
+
+    def _iniciar(self):
+        if not settings.DETECTOR_CONSULTAS:
+            return None, None
+        deteccion = Deteccion(settings.DETECTOR_REPETICIONES, settings.DETECTOR_LENTA_MS)
+        return deteccion, _actual.set(deteccion)
+
+    def _terminar(self, request, deteccion):
+        reporte = deteccion.reporte(request)
+        if reporte is None:
+            return
+        logger.warning(json.dumps(reporte, ensure_ascii=False, default=str))
+        if settings.DETECTOR_ESTRICTO and reporte['repetidas']:
+            detalle = '\n'.join(
+                f"{r['veces']}x {r['sql'][:200]}\n    plantilla: {r['plantilla']}\n    " + '\n    '.join(r['pila'] or [])
+                for r in reporte['repetidas']
+            )
+            raise ConsultasRepetidas(f"N+1 en {request.method} {request.path}:\n{detalle}")
+
+    def __call__(self, request):
+        if self.es_async:
+            return self.__acall__(request)
+        deteccion, token = self._iniciar()
+        if deteccion is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _actual.reset(token)
+        self._terminar(request, deteccion)
+        return response
+
+    async def __acall__(self, request):
+        deteccion, token = self._iniciar()
+        if deteccion is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _actual.reset(token)
+        self._terminar(request, deteccion)
+        return response
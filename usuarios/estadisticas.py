@@ -0,0 +1,83 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Case, Count, F, Max, Sum, Value, When
+
+from .models import Compra, EstadisticasCompras
+from .upsert import incrementar, opciones_upsert
+
+
+def _ultima_compra(fecha):
+    # Greatest() devuelve NULL si un argumento es NULL en MySQL/SQLite
+    return Case(
+        When(ultima_compra__isnull=True, then=Value(fecha)),
+        When(ultima_compra__lt=fecha, then=Value(fecha)),
+        default=F('ultima_compra'),
+    )
+
+
+def registrar_compras(compras):
+    """Suma las compras nuevas al resumen de cada usuario, con un UPDATE por usuario."""
+    por_usuario = defaultdict(lambda: {'total': Decimal('0'), 'num': 0, 'unidades': 0, 'ultima': None})
+    for compra in compras:
+        resumen = por_usuario[compra.usuario_id]
+        resumen['total'] += compra.total
+        resumen['num'] += 1
+        resumen['unidades'] += compra.cantidad
+        if resumen['ultima'] is None or compra.fecha > resumen['ultima']:
+            resumen['ultima'] = compra.fecha
+
+    for usuario_id, resumen in por_usuario.items():
+        incrementar(
+            EstadisticasCompras,
+            {'usuario_id': usuario_id},
+            {'total_gastado': resumen['total'], 'num_compras': resumen['num'], 'unidades': resumen['unidades']},
+            {'ultima_compra': (_ultima_compra(resumen['ultima']), resumen['ultima'])},
+        )
+
+
+def descontar_compra(compra):
+    # La última compra puede ser la borrada: se vuelve a leer (usa compra_usuario_fecha_idx)
+    ultima = Compra.objects.filter(usuario_id=compra.usuario_id).aggregate(m=Max('fecha'))['m']
+    EstadisticasCompras.objects.filter(usuario_id=compra.usuario_id).update(
+        total_gastado=F('total_gastado') - compra.total,
+        num_compras=F('num_compras') - 1,
+        unidades=F('unidades') - compra.cantidad,
+        ultima_compra=ultima,
+    )
+
+
+def _agregados(usuario_ids):
+    filas = (
+        Compra.objects.filter(usuario_id__in=usuario_ids)
+        .order_by()
+        .values('usuario_id')
+        .annotate(total=Sum('total'), num=Count('id'), unidades=Sum('cantidad'), ultima=Max('fecha'))
+    )
+    return {fila['usuario_id']: fila for fila in filas}
+
+
+def recalcular_usuarios(usuario_ids):
+    """Recalcula desde cero el resumen de los usuarios dados (un lote)."""
+    agregados = _agregados(usuario_ids)
+    filas = []
+    for usuario_id in usuario_ids:
+        fila = agregados.get(usuario_id, {})
+        filas.append(EstadisticasCompras(
+            usuario_id=usuario_id,
+            total_gastado=fila.get('total') or 0,
+            num_compras=fila.get('num') or 0,
+            unidades=fila.get('unidades') or 0,
+            ultima_compra=fila.get('ultima'),
+        ))
+    EstadisticasCompras.objects.bulk_create(filas, **opciones_upsert(
+        EstadisticasCompras, ['usuario'], ['total_gastado', 'num_compras', 'unidades', 'ultima_compra'],
+    ))
+    return len(filas)
+
+
+def estadisticas_de(usuario):
+    try:
+        return usuario.estadisticas
+    except EstadisticasCompras.DoesNotExist:
+        return EstadisticasCompras(usuario=usuario)
@@ -0,0 +1,72 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Compra, Producto
+from .paginacion import recorrer
+
+
+COLUMNAS = {
+    'compras': (
+        'id', 'fecha', 'usuario_id', 'usuario__username', 'usuario__email',
+        'producto_id', 'producto__nombre', 'producto__categoria',
+        'cantidad', 'precio_unitario', 'total',
+    ),
+    'productos': ('id', 'nombre', 'descripcion', 'categoria', 'costo', 'activo', 'stock', 'creado_en'),
+}
+FORMATOS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def leer_fecha(valor):
+    # parse_date devuelve None (sin excepción) si el texto no tiene forma de fecha
+    fecha = parse_date(valor)
+    if fecha is None:
+        raise ValueError(valor)
+    return fecha
+
+
+def _limites(desde, hasta):
+    # Rango de fechas inclusivo convertido a datetimes: el filtro sigue usando el índice de la columna
+    filtros = {}
+    if desde:
+        filtros['gte'] = timezone.make_aware(datetime.combine(desde, time.min))
+    if hasta:
+        filtros['lt'] = timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min))
+    return filtros
+
+
+def consulta(modelo, desde=None, hasta=None, categoria=None):
+    if modelo == 'compras':
+        queryset, campo_fecha, campo_categoria = Compra.objects.all(), 'fecha', 'producto__categoria'
+    else:
+        queryset, campo_fecha, campo_categoria = Producto.objects.all(), 'creado_en', 'categoria'
+    for operador, valor in _limites(desde, hasta).items():
+        queryset = queryset.filter(**{f'{campo_fecha}__{operador}': valor})
+    if categoria:
+        queryset = queryset.filter(**{campo_categoria: categoria})
+    return queryset.values(*COLUMNAS[modelo]), (campo_fecha, 'id')
+
+
+class _Eco:
+    # Pseudo-archivo para csv.writer: devuelve la línea en vez de guardarla
+    def write(self, valor):
+        return valor
+
+
+def exportar(modelo, formato='csv', lote=2000, **filtros):
+    """Genera el export línea a línea; nunca tiene más de `lote` filas en memoria."""
+    queryset, orden = consulta(modelo, **filtros)
+    columnas = COLUMNAS[modelo]
+    filas = recorrer(queryset, orden, lote)
+    if formato == 'csv':
+        escritor = csv.writer(_Eco())
+        yield escritor.writerow(columnas)
+        for fila in filas:
+            yield escritor.writerow([fila[c] for c in columnas])
+    else:
+        for fila in filas:
+            yield json.dumps(fila, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
@@ -0,0 +1,79 @@
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .busqueda import normalizar
+
+
+CLAVE_VERSION = 'catalogo:version'
+
+
+# --- VERSIÓN DEL CATÁLOGO ---
+
+def version_catalogo():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        # Si la clave se perdió, se arranca en un valor nuevo para no reutilizar entradas viejas
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+async def aversion_catalogo():
+    version = await cache.aget(CLAVE_VERSION)
+    if version is None:
+        await cache.aadd(CLAVE_VERSION, time.time_ns(), None)
+        version = await cache.aget(CLAVE_VERSION)
+    return version
+
+
+def _subir_version():
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+
+
+def invalidar_catalogo():
+    # Las claves de facetas y la foto en memoria (catalogo.py) llevan la versión: subirla
+    # invalida todo de una vez. Se sube al confirmar: antes, los otros procesos rearmarían
+    # la foto con los datos anteriores.
+    transaction.on_commit(_subir_version)
+
+
+# --- FACETAS ---
+
+def _clave(search, version):
+    huella = hashlib.md5(normalizar(search).strip().encode()).hexdigest()
+    return f'facetas:{version}:{huella}'
+
+
+# Desde la foto en memoria del catálogo, sin SQL. La clave lleva la versión de la foto y
+# no la de la cache: mientras se rearma, lo contado con la foto anterior no se guarda como nuevo.
+
+def conteos_categorias(search=''):
+    """Lista [(categoria, n)] de productos activos, restringida a la búsqueda si la hay."""
+    from .catalogo import obtener_catalogo
+    catalogo = obtener_catalogo()
+    clave = _clave(search, catalogo.version)
+    conteos = cache.get(clave)
+    if conteos is None:
+        conteos = catalogo.conteos_categorias(search)
+        cache.set(clave, conteos, settings.FACETAS_TIMEOUT)
+    return conteos
+
+
+async def aconteos_categorias(search=''):
+    from .catalogo import aobtener_catalogo
+    catalogo = await aobtener_catalogo()
+    clave = _clave(search, catalogo.version)
+    conteos = await cache.aget(clave)
+    if conteos is None:
+        # Con búsqueda recorre el índice: a un hilo, fuera del event loop
+        conteos = await sync_to_async(catalogo.conteos_categorias, thread_sensitive=False)(search)
+        await cache.aset(clave, conteos, settings.FACETAS_TIMEOUT)
+    return conteos
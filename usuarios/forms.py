@@ -1,5 +1,8 @@
+from datetime import timedelta
+
 from django import forms
 from django.contrib.auth.models import User
+from django.utils import timezone
 from .models import PerfilUsuario, Compra, Producto
 
 
@@ -44,7 +47,7 @@ class PerfilForm(forms.ModelForm):
 class ProductoForm(forms.ModelForm):
     class Meta:
         model = Producto
-        fields = ['nombre', 'descripcion', 'categoria', 'costo', 'activo']
+        fields = ['nombre', 'descripcion', 'categoria', 'costo', 'activo', 'stock']
 
 
 class CompraForm(forms.ModelForm):
@@ -74,8 +77,42 @@ class EditarPerfilForm(forms.ModelForm):
         perfil.user.email = self.cleaned_data['email']
 
         if commit:
-            perfil.user.save()
-            perfil.save()
+            # Solo las columnas que cambiaron; si no cambió nada, ningún UPDATE
+            cambios = self.changed_data
+            if 'email' in cambios:
+                perfil.user.save(update_fields=['email'])
+            campos = [campo for campo in self._meta.fields if campo in cambios and campo != 'email']
+            if campos:
+                perfil.save(update_fields=campos)
 
         return perfil
 
+
+class ImportarProductosForm(forms.Form):
+    archivo = forms.FileField(help_text="CSV, JSON lines (.jsonl) o arreglo JSON (.json)")
+
+
+class VentasForm(forms.Form):
+    # Filtros del tablero de ventas y de su API (todos opcionales: por defecto, los últimos 30 días)
+    desde = forms.DateField(required=False)
+    hasta = forms.DateField(required=False)
+    por = forms.ChoiceField(choices=[('categoria', 'Categoría'), ('producto', 'Producto')], required=False)
+    periodo = forms.ChoiceField(choices=[('', 'Total'), ('dia', 'Por día'), ('mes', 'Por mes')], required=False)
+    categoria = forms.CharField(max_length=100, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        hasta = cleaned_data.get('hasta') or timezone.localdate()
+        desde = cleaned_data.get('desde') or hasta - timedelta(days=29)
+        if desde > hasta:
+            raise forms.ValidationError("La fecha inicial es posterior a la final")
+        cleaned_data.update(desde=desde, hasta=hasta, por=cleaned_data.get('por') or 'categoria')
+        return cleaned_data
+
+    def consulta(self):
+        # Argumentos de ventas.consultar_ventas
+        datos = self.cleaned_data
+        return {
+            'desde': datos['desde'], 'hasta': datos['hasta'], 'por': datos['por'],
+            'periodo': datos['periodo'] or None, 'categoria': datos['categoria'] or None,
+        }
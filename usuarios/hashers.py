@@ -0,0 +1,53 @@
+"""Hashers de contraseñas con parámetros configurables (settings.HASHER_PARAMETROS).
+
+Conservan el `algorithm` de los de Django, así que sus hashes son intercambiables:
+cambiar de perfil no invalida contraseñas. Django rehace el hash en el siguiente
+login cuando el hasher no es el preferido o sus parámetros cambiaron (must_update).
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher,
+)
+
+
+def _parametro(perfil, nombre, por_defecto):
+    return settings.HASHER_PARAMETROS.get(perfil, {}).get(nombre, por_defecto)
+
+
+class ScryptAjustado(ScryptPasswordHasher):
+    # Solo stdlib (hashlib.scrypt); costo en memoria = 128 * work_factor * block_size bytes
+
+    @property
+    def work_factor(self):
+        return _parametro('scrypt', 'work_factor', ScryptPasswordHasher.work_factor)
+
+    @property
+    def block_size(self):
+        return _parametro('scrypt', 'block_size', ScryptPasswordHasher.block_size)
+
+    @property
+    def parallelism(self):
+        return _parametro('scrypt', 'parallelism', ScryptPasswordHasher.parallelism)
+
+
+class Argon2Ajustado(Argon2PasswordHasher):
+    # Requiere argon2-cffi; memory_cost en KiB
+
+    @property
+    def time_cost(self):
+        return _parametro('argon2', 'time_cost', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return _parametro('argon2', 'memory_cost', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return _parametro('argon2', 'parallelism', Argon2PasswordHasher.parallelism)
+
+
+class PBKDF2Ajustado(PBKDF2PasswordHasher):
+
+    @property
+    def iterations(self):
+        return _parametro('pbkdf2', 'iterations', PBKDF2PasswordHasher.iterations)
@@ -0,0 +1,171 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .facetas import invalidar_catalogo
+from .forms import ProductoForm
+from .models import Producto
+from .upsert import opciones_upsert
+
+
+# Mismas reglas que el formulario de alta (max_length, decimales, requeridos...)
+CAMPOS = ProductoForm._meta.fields
+REGLAS = ProductoForm.base_fields
+REQUERIDOS = [nombre for nombre in CAMPOS if REGLAS[nombre].required]
+
+
+@dataclass
+class ResultadoImportacion:
+    creados: int = 0
+    actualizados: int = 0
+    errores: list = field(default_factory=list)   # [(número de fila, {campo: [mensajes]})]
+
+    @property
+    def procesados(self):
+        return self.creados + self.actualizados
+
+
+# --- LECTURA EN STREAMING ---
+
+def _texto(archivo):
+    if isinstance(archivo, io.TextIOBase):
+        return archivo
+    return io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+
+
+def _filas_json(texto, tam_bloque=64 * 1024):
+    # Lee un arreglo JSON objeto por objeto con raw_decode, sin cargar el archivo entero
+    decodificador = json.JSONDecoder()
+    buffer, pos, inicio = '', 0, False
+    while True:
+        bloque = texto.read(tam_bloque)
+        buffer = buffer[pos:] + bloque
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if not inicio and pos < len(buffer):
+                if buffer[pos] != '[':
+                    raise ValueError("Se esperaba un arreglo JSON")
+                inicio, pos = True, pos + 1
+                continue
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                objeto, pos = decodificador.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if not bloque:
+                    raise
+                break   # objeto incompleto: se lee otro bloque
+            yield objeto
+        if not bloque:
+            return
+
+
+def leer_filas(archivo, formato):
+    texto = _texto(archivo)
+    if formato == 'csv':
+        yield from csv.DictReader(texto)
+    elif formato == 'jsonl':
+        for linea in texto:
+            if linea.strip():
+                yield json.loads(linea)
+    elif formato == 'json':
+        yield from _filas_json(texto)
+    else:
+        raise ValueError(f"Formato desconocido: {formato}")
+
+
+def formato_de(nombre):
+    extension = nombre.rsplit('.', 1)[-1].lower()
+    return extension if extension in ('csv', 'jsonl', 'json') else 'csv'
+
+
+# --- VALIDACIÓN ---
+
+def validar(fila):
+    """Limpia una fila con los campos de ProductoForm, sin instanciar el formulario."""
+    limpio, errores = {}, {}
+    identificador = fila.get('id')
+    if identificador not in (None, ''):
+        try:
+            limpio['id'] = int(identificador)
+        except (TypeError, ValueError):
+            errores['id'] = ["Debe ser un número entero."]
+    for nombre in CAMPOS:
+        if nombre not in fila:
+            continue
+        try:
+            limpio[nombre] = REGLAS[nombre].clean(fila[nombre])
+        except ValidationError as exc:
+            errores[nombre] = exc.messages
+    return limpio, errores
+
+
+def faltantes(datos):
+    # Las filas que crean un producto deben traer todos los obligatorios, aunque falte la columna
+    return {nombre: [str(REGLAS[nombre].error_messages['required'])] for nombre in REQUERIDOS if nombre not in datos}
+
+
+# --- IMPORTACIÓN ---
+
+def _guardar_lote(lote, resultado):
+    nuevos = [Producto(**datos) for _, datos in lote if 'id' not in datos]
+    con_id = [(numero, datos) for numero, datos in lote if 'id' in datos]
+    with transaction.atomic():
+        if con_id:
+            existentes = set(
+                Producto.objects.filter(id__in=[datos['id'] for _, datos in con_id]).values_list('id', flat=True)
+            )
+            # Upsert por clave primaria: actualiza si el id existe, si no lo crea con ese id.
+            # Se agrupa por las columnas de cada fila: un producto existente solo cambia en esas
+            por_columnas = defaultdict(list)
+            for numero, datos in con_id:
+                if datos['id'] in existentes:
+                    resultado.actualizados += 1
+                elif errores := faltantes(datos):
+                    resultado.errores.append((numero, errores))
+                    continue
+                else:
+                    resultado.creados += 1
+                por_columnas[tuple(c for c in CAMPOS if c in datos)].append(Producto(**datos))
+            for campos, productos in por_columnas.items():
+                # actualizado_en no viene en el archivo: bulk_create lo llena, pero hay que actualizarlo
+                Producto.objects.bulk_create(productos, **opciones_upsert(Producto, ['id'], [*campos, 'actualizado_en']))
+        if nuevos:
+            Producto.objects.bulk_create(nuevos)
+            resultado.creados += len(nuevos)
+
+
+def importar(filas, lote=1000):
+    """Valida y guarda las filas por lotes; las filas con errores se reportan y se omiten.
+
+    Un producto existente (por id) solo se actualiza en las columnas que trae su fila.
+    """
+    resultado = ResultadoImportacion()
+    pendientes = []
+    for numero, fila in enumerate(filas, start=1):
+        datos, errores = validar(fila)
+        if 'id' not in datos and 'id' not in errores:
+            errores.update(faltantes(datos))
+        if errores:
+            resultado.errores.append((numero, errores))
+            continue
+        pendientes.append((numero, datos))
+        if len(pendientes) >= lote:
+            _guardar_lote(pendientes, resultado)
+            pendientes = []
+    if pendientes:
+        _guardar_lote(pendientes, resultado)
+    # Los ids nuevos sin obligatorios se descubren al guardar su lote
+    resultado.errores.sort(key=lambda error: error[0])
+
+    if resultado.procesados:
+        # bulk_create no envía señales: la foto del catálogo y las facetas se invalidan una vez al final
+        invalidar_catalogo()
+    return resultado
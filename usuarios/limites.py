@@ -0,0 +1,127 @@
+"""Límite de peticiones por IP y por usuario: cubetas de fichas en la cache de Django.
+
+Cada regla de LIMITES (por nombre de URL) da a cada IP y a cada usuario una
+cubeta de `capacidad` fichas que se rellena sola a razón de capacidad/segundos
+fichas por segundo. La cache no tiene lectura-modificación-escritura atómica,
+así que la cubeta se lleva con contadores por ventana de `segundos` (incr, que
+sí es atómico): lo gastado en la ventana anterior se descuenta en proporción al
+tiempo ya transcurrido de la actual, que es el relleno continuo. Un intento
+rechazado no gasta fichas.
+
+Cada comprobación cuesta un get_many más un incr por cubeta, sin importar
+cuántas claves haya en la cache. LimitesMiddleware rechaza en process_view,
+antes de que la vista calcule el hash de la contraseña o abra la transacción
+de la compra.
+"""
+import hashlib
+import math
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+
+def _contar(cache, clave, timeout):
+    # incr es el camino rápido; la primera ficha de la ventana crea la clave con add
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        if cache.add(clave, 1, timeout):
+            return 1
+        return cache.incr(clave)
+
+
+def consumir(cubetas, ahora=None):
+    """Gasta una ficha de cada cubeta (clave, capacidad, segundos).
+
+    Devuelve 0 si todas tenían ficha, o los segundos a esperar si alguna estaba
+    vacía; en ese caso no gasta de ninguna.
+    """
+    cache = caches[settings.LIMITES_CACHE]
+    ahora = time.time() if ahora is None else ahora
+    ventanas = []
+    for clave, capacidad, segundos in cubetas:
+        numero, transcurrido = divmod(ahora, segundos)
+        ventanas.append((f'limite:{clave}:{int(numero)}', f'limite:{clave}:{int(numero) - 1}', transcurrido / segundos))
+    anteriores = cache.get_many([anterior for _, anterior, _ in ventanas])
+
+    espera = 0
+    for (clave, capacidad, segundos), (actual, anterior, fraccion) in zip(cubetas, ventanas):
+        # La clave vive dos ventanas: en la siguiente cuenta como la anterior
+        gastadas = _contar(cache, actual, 2 * segundos)
+        if anteriores.get(anterior, 0) * (1 - fraccion) + gastadas > capacidad:
+            espera = max(espera, math.ceil(segundos / capacidad))
+    if espera:
+        for actual, _, _ in ventanas:
+            try:
+                cache.decr(actual)
+            except ValueError:
+                pass
+    return espera
+
+
+def _huella(valor):
+    # Claves cortas y válidas en cualquier backend (memcached no admite espacios)
+    return hashlib.md5(str(valor).encode()).hexdigest()
+
+
+def cubetas_de(request, nombre, regla):
+    """Las cubetas de la petición según la regla: una por IP y otra por usuario."""
+    cubetas = []
+    if 'ip' in regla:
+        cubetas.append((f'{nombre}:ip:{_huella(request.META.get("REMOTE_ADDR", ""))}', *regla['ip']))
+    if 'usuario' in regla:
+        if request.user.is_authenticated:
+            usuario = request.user.pk
+        else:
+            # Login: el usuario que se intenta, antes de verificar la contraseña
+            usuario = request.POST.get('username', '').strip().lower()
+        if usuario:
+            cubetas.append((f'{nombre}:usuario:{_huella(usuario)}', *regla['usuario']))
+    return cubetas
+
+
+def demasiadas_peticiones(espera):
+    response = HttpResponse(
+        f'Demasiados intentos. Intenta de nuevo en {espera} segundos.\n',
+        status=429, content_type='text/plain; charset=utf-8',
+    )
+    response['Retry-After'] = str(espera)
+    return response
+
+
+class LimitesMiddleware:
+    """Aplica LIMITES a las vistas por nombre de URL ('usuarios:login', ...).
+
+    Va después de AuthenticationMiddleware: las reglas por usuario de las vistas
+    con sesión usan request.user.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.es_async:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_view(self, request, vista, args, kwargs):
+        if not settings.LIMITES_ACTIVOS:
+            return None
+        nombre = request.resolver_match.view_name
+        regla = settings.LIMITES.get(nombre)
+        if regla is None or request.method not in regla.get('metodos', ('POST',)):
+            return None
+        espera = consumir(cubetas_de(request, nombre, regla))
+        return demasiadas_peticiones(espera) if espera else None
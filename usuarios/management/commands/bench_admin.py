@@ -0,0 +1,77 @@
+import json
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from usuarios.admin import CompraAdmin
+from usuarios.bench import base_temporal, medir, sembrar_compras, sembrar_productos, sembrar_usuarios
+from usuarios.models import Compra, Producto
+
+
+class CompraAdminOriginal(admin.ModelAdmin):
+    # La configuración anterior de CompraAdmin, como referencia
+    list_display = ('usuario', 'producto', 'cantidad', 'precio_unitario', 'total', 'fecha')
+    list_filter = ('fecha', 'producto')
+    search_fields = ('usuario__username', 'producto__nombre')
+    date_hierarchy = 'fecha'
+    list_select_related = ('usuario', 'producto')
+    # sin la plantilla de usuarios/compra, que cambia la jerarquía de fechas
+    change_list_template = 'admin/change_list.html'
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia del changelist de compras del admin, antes y después de optimizarlo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, nargs='+', default=[1000000])
+        parser.add_argument('--productos', type=int, default=10000)
+        parser.add_argument('--usuarios', type=int, default=1000)
+        parser.add_argument('--dias', type=int, default=730, help='Antigüedad máxima de las compras.')
+        parser.add_argument('--repeticiones', type=int, default=10)
+
+    def handle(self, *args, **options):
+        informe = []
+        for filas in options['filas']:
+            with base_temporal():
+                sembrar_productos(options['productos'])
+                usuarios = sembrar_usuarios(options['usuarios'])
+                sembrar_compras(usuarios, filas, dias=options['dias'])
+                informe.append({'filas': filas, 'escenarios': self._medir(options['repeticiones'])})
+            self.stderr.write(f'{filas} filas medidas')
+        self.stdout.write(json.dumps(informe, indent=2))
+
+    def _medir(self, repeticiones):
+        # Las dos versiones en sitios distintos con el nombre 'admin', para que resuelvan las URLs
+        admins = {
+            'original': CompraAdminOriginal(Compra, admin.AdminSite(name='admin')),
+            'optimizado': CompraAdmin(Compra, admin.site),
+        }
+        staff = User.objects.create_superuser('bench_admin', password='bench')
+        compra = Compra.objects.order_by('-fecha').first()
+        escenarios = {
+            'lista': {},
+            'pagina_50': {'p': '50'},
+            'producto': {'producto__id__exact': str(Producto.objects.order_by('id').first().id)},
+            'busqueda': {'q': 'cliente1'},
+            'anio': {'fecha__year': str(compra.fecha.year)},
+            'mes': {'fecha__year': str(compra.fecha.year), 'fecha__month': str(compra.fecha.month)},
+        }
+        fabrica = RequestFactory()
+
+        def cargar(modelo_admin, params):
+            request = fabrica.get('/admin/usuarios/compra/', params)
+            request.user = staff
+            response = modelo_admin.changelist_view(request)
+            response.render()
+
+        resultado = {}
+        for nombre, params in escenarios.items():
+            resultado[nombre] = {
+                version: medir(lambda m=modelo_admin: cargar(m, params), repeticiones, calentamiento=1)
+                for version, modelo_admin in admins.items()
+            }
+            self.stderr.write(f"  {nombre}: {resultado[nombre]['original']['p50_ms']} ms -> "
+                              f"{resultado[nombre]['optimizado']['p50_ms']} ms")
+        return resultado
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import time
+import types
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import include, path
+
+from usuarios.bench import base_temporal, peticion_asgi, resumir, sembrar_productos
+from usuarios.models import PerfilUsuario
+from usuarios.urls import construir_urlpatterns
+
+
+def _urlconf(asincronas):
+    # ROOT_URLCONF armado en memoria para elegir vistas síncronas o async sin tocar settings
+    modulo = types.ModuleType(f'bench_urls_{"async" if asincronas else "sync"}')
+    modulo.urlpatterns = [
+        path('usuarios/', include((construir_urlpatterns(asincronas), 'usuarios'))),
+        path('admin/', admin.site.urls),
+    ]
+    return modulo
+
+
+async def _carga(app, rutas, cookie, total, concurrencia):
+    semaforo = asyncio.Semaphore(concurrencia)
+    tiempos, errores = [], 0
+
+    async def una(i):
+        nonlocal errores
+        async with semaforo:
+            inicio = time.perf_counter()
+            status = await peticion_asgi(app, rutas[i % len(rutas)], cookie)
+            tiempos.append(time.perf_counter() - inicio)
+            if status != 200:
+                errores += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(una(i) for i in range(total)))
+    duracion = time.perf_counter() - inicio
+    return {'peticiones_por_segundo': round(total / duracion, 1), 'errores': errores, **resumir(tiempos)}
+
+
+class Command(BaseCommand):
+    help = 'Compara peticiones/segundo y p99 de las vistas síncronas y async bajo la aplicación ASGI.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=10000)
+        parser.add_argument('--peticiones', type=int, default=500)
+        parser.add_argument('--concurrencia', type=int, default=50)
+
+    def handle(self, *args, **options):
+        rutas = ['/usuarios/productos/', '/usuarios/comprar/', '/usuarios/comprar/?categoria=Bebidas', '/usuarios/perfil/']
+        informe = {'peticiones': options['peticiones'], 'concurrencia': options['concurrencia']}
+        with base_temporal():
+            sembrar_productos(options['productos'])
+            usuario = User.objects.create_user('bench', password='bench')
+            PerfilUsuario.objects.create(user=usuario)
+            cliente = Client()
+            cliente.force_login(usuario)
+            cookie = f'{settings.SESSION_COOKIE_NAME}={cliente.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+            for modo, asincronas in (('sync', False), ('async', True)):
+                with override_settings(ROOT_URLCONF=_urlconf(asincronas)):
+                    app = get_asgi_application()
+                    informe[modo] = asyncio.run(
+                        _carga(app, rutas, cookie, options['peticiones'], options['concurrencia'])
+                    )
+        self.stdout.write(json.dumps(informe, indent=2))
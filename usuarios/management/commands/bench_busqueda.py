@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from usuarios.bench import base_temporal, medir, sembrar_productos
+from usuarios.busqueda import IndiceCompacto
+from usuarios.models import Producto
+
+
+class Command(BaseCommand):
+    help = 'Compara la búsqueda icontains original con el índice de tokens (IndiceCompacto).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=100000)
+        parser.add_argument('--repeticiones', type=int, default=50)
+        parser.add_argument('--terminos', nargs='+', default=['cafe', 'camion azu', 'televisión', 'lap'])
+
+    def handle(self, *args, **options):
+        with base_temporal():
+            sembrar_productos(options['productos'])
+            indice = IndiceCompacto(Producto.objects.values_list('id', 'nombre', 'categoria').iterator(chunk_size=2000))
+
+            resultados = {'productos': options['productos'], 'terminos': {}}
+            for termino in options['terminos']:
+                base = Producto.objects.filter(activo=True)
+                resultados['terminos'][termino] = {
+                    'icontains': medir(
+                        lambda: list(base.filter(nombre__icontains=termino)[:50]),
+                        options['repeticiones'],
+                    ),
+                    'indice': medir(
+                        lambda: list(indice.buscar(base, termino).order_by('-relevancia', 'id')[:50]),
+                        options['repeticiones'],
+                    ),
+                }
+        self.stdout.write(json.dumps(resultados, indent=2, ensure_ascii=False))
@@ -0,0 +1,54 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from usuarios.bench import base_temporal, resumir, sembrar_productos
+from usuarios.models import Producto
+
+
+class Command(BaseCommand):
+    help = 'Compara un pedido de N productos: N POST a comprar/ contra un solo POST a comprar/carrito/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=20)
+        parser.add_argument('--repeticiones', type=int, default=30)
+
+    def _medir(self, funcion, repeticiones):
+        tiempos, consultas = [], []
+
+        def contar(execute, sql, params, many, context):
+            consultas.append(sql)
+            return execute(sql, params, many, context)
+
+        for _ in range(repeticiones):
+            with connection.execute_wrapper(contar):
+                inicio = time.perf_counter()
+                funcion()
+                tiempos.append(time.perf_counter() - inicio)
+        return {**resumir(tiempos), 'consultas_por_pedido': len(consultas) // repeticiones}
+
+    def handle(self, *args, **options):
+        with base_temporal():
+            sembrar_productos(max(options['items'], 100))
+            ids = list(Producto.objects.filter(activo=True).values_list('id', flat=True)[:options['items']])
+            cliente = Client()
+            cliente.force_login(User.objects.create_user('bench', password='bench'))
+
+            def por_item():
+                for producto_id in ids:
+                    cliente.post(reverse('usuarios:comprar'), {'producto_id': producto_id, 'cantidad': 1})
+
+            def carrito():
+                cliente.post(reverse('usuarios:carrito'), {'producto_id': ids, 'cantidad': ['1'] * len(ids)})
+
+            informe = {
+                'items': len(ids),
+                'por_item': self._medir(por_item, options['repeticiones']),
+                'carrito': self._medir(carrito, options['repeticiones']),
+            }
+        self.stdout.write(json.dumps(informe, indent=2))
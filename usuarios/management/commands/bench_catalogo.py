@@ -0,0 +1,98 @@
+import gc
+import json
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from usuarios.bench import base_temporal, medir, resumir, sembrar_productos
+from usuarios import catalogo as foto
+from usuarios.catalogo import Catalogo, obtener_catalogo
+from usuarios.facetas import invalidar_catalogo, version_catalogo
+from usuarios.models import Producto
+from usuarios.paginacion import PaginaKeyset, codificar_cursor
+
+
+def _sql(search, categoria, cursor, tamano):
+    # El listado anterior de comprar_view: filtro, búsqueda y página en la base
+    # (las mismas puntuaciones, llevadas a un IN con CASE)
+    productos = Producto.objects.filter(activo=True)
+    if categoria:
+        productos = productos.filter(categoria=categoria)
+    orden = ('-creado_en', '-id')
+    if search:
+        productos, orden = obtener_catalogo().indice.buscar(productos, search), ('-relevancia', 'id')
+    return list(PaginaKeyset(productos, orden, cursor, tamano))
+
+
+def _memoria(search, categoria, cursor, tamano):
+    return list(obtener_catalogo().pagina(cursor, tamano, search=search, categoria=categoria))
+
+
+class Command(BaseCommand):
+    help = 'Memoria y tiempo de armado de la foto del catálogo, y latencia del listado en memoria vs SQL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, nargs='+', default=[100000])
+        parser.add_argument('--repeticiones', type=int, default=50)
+
+    def _armar(self, repeticiones):
+        # Memoria con tracemalloc (que lo hace varias veces más lento); el tiempo, sin él
+        gc.collect()
+        tracemalloc.start()
+        catalogo = Catalogo.construir(version_catalogo())
+        memoria, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return catalogo, {
+            'rearmado': medir(lambda: Catalogo.construir(version_catalogo()), repeticiones, calentamiento=0),
+            'mb': round(memoria / 2 ** 20, 1),
+            'bytes_por_producto': round(memoria / max(len(catalogo.productos), 1)),
+        }
+
+    def _tras_cambio(self, repeticiones):
+        # La primera petición después de un cambio de producto: sirve la foto anterior
+        # mientras el hilo arma la nueva, en vez de esperar el rearmado
+        tiempos = []
+        with override_settings(CATALOGO_REARMADO='hilo'):
+            for _ in range(repeticiones):
+                invalidar_catalogo()   # fuera de una transacción: sube la versión ya
+                inicio = time.perf_counter()
+                obtener_catalogo()
+                tiempos.append(time.perf_counter() - inicio)
+                foto._hilo.join()
+        return resumir(tiempos)
+
+    def handle(self, *args, **options):
+        informe = []
+        tamano = settings.PAGINA_TAMANO
+        for n in options['productos']:
+            with base_temporal():
+                sembrar_productos(n)
+                catalogo, armado = self._armar(max(options['repeticiones'] // 10, 3))
+                medio = catalogo.activos[len(catalogo.activos) // 2]
+                cursor_medio = obtener_catalogo().pagina(None, tamano).valores(medio)
+                escenarios = {
+                    'primera': ('', '', None),
+                    'categoria': ('', 'Hogar', None),
+                    'pagina_media': ('', '', codificar_cursor(cursor_medio)),
+                    'busqueda': ('cafe', '', None),
+                    'busqueda_categoria': ('cafe leche', 'Bebidas', None),
+                }
+                latencias = {
+                    'version': medir(obtener_catalogo, options['repeticiones']),
+                    'tras_cambio': self._tras_cambio(max(options['repeticiones'] // 10, 3)),
+                }
+                for nombre, (search, categoria, cursor) in escenarios.items():
+                    latencias[nombre] = {
+                        'sql': medir(lambda: _sql(search, categoria, cursor, tamano), options['repeticiones']),
+                        'memoria': medir(lambda: _memoria(search, categoria, cursor, tamano), options['repeticiones']),
+                    }
+                    self.stderr.write(
+                        f"  {nombre}: {latencias[nombre]['sql']['p50_ms']} ms -> "
+                        f"{latencias[nombre]['memoria']['p50_ms']} ms"
+                    )
+            informe.append({'productos': n, 'armado': armado, 'latencias': latencias})
+            self.stderr.write(f'{n} productos medidos')
+        self.stdout.write(json.dumps(informe, indent=2))
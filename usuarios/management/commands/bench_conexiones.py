@@ -0,0 +1,116 @@
+import http.client
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+
+from usuarios.bench import base_temporal, resumir, sembrar_productos
+from usuarios.models import PerfilUsuario
+
+# nombre -> (CONN_MAX_AGE, CONN_HEALTH_CHECKS)
+CONFIGURACIONES = {
+    'por_peticion': (0, False),
+    'persistente': (60, False),
+    'persistente_con_ping': (60, True),
+}
+RUTAS = ['perfil', 'productos', 'editar_perfil']
+
+
+class _SinLog(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def _configurar(max_age, health_checks):
+    # Ambos valores se leen al conectar; las conexiones abiertas se descartan al terminar
+    # la petición en curso del servidor, que ya las verá vencidas
+    for conexion in connections.all():
+        conexion.settings_dict['CONN_MAX_AGE'] = max_age
+        conexion.settings_dict['CONN_HEALTH_CHECKS'] = health_checks
+        conexion.close()
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo de abrir una conexión por petición contra conexiones persistentes (CONN_MAX_AGE).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=300)
+
+    def _conectar(self, n=50):
+        # Costo de la conexión sola: abrir y cerrar
+        tiempos = []
+        for _ in range(n):
+            connection.close()
+            inicio = time.perf_counter()
+            connection.ensure_connection()
+            tiempos.append(time.perf_counter() - inicio)
+        return resumir(tiempos)
+
+    def _medir(self, servidor, cookie, n):
+        abiertas = []
+        receptor = lambda sender, connection, **kwargs: abiertas.append(connection.alias)  # noqa: E731
+        connection_created.connect(receptor, weak=False)
+        host, puerto = servidor.server_address[:2]
+
+        def get(url):
+            conexion = http.client.HTTPConnection(host, puerto, timeout=30)
+            conexion.request('GET', url, headers={'Cookie': cookie, 'Host': 'testserver'})
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            conexion.close()
+            assert respuesta.status == 200, (url, respuesta.status)
+
+        resultado = {}
+        try:
+            for ruta in RUTAS:
+                url = reverse(f'usuarios:{ruta}')
+                get(url)
+                abiertas.clear()
+                tiempos = []
+                for _ in range(n):
+                    inicio = time.perf_counter()
+                    get(url)
+                    tiempos.append(time.perf_counter() - inicio)
+                resultado[ruta] = {**resumir(tiempos), 'conexiones_por_peticion': round(len(abiertas) / n, 2)}
+        finally:
+            connection_created.disconnect(receptor)
+        return resultado
+
+    def _servidor(self):
+        # Servidor WSGI de un solo hilo, como un worker: las peticiones comparten el hilo y,
+        # con CONN_MAX_AGE > 0, la conexión. (El cliente de pruebas nunca cierra conexiones.)
+        servidor = WSGIServer(('localhost', 0), _SinLog)
+        servidor.set_app(WSGIHandler())
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        return servidor
+
+    def handle(self, *args, **options):
+        informe = {'vendor': connection.vendor}
+        # Una base SQLite en memoria nunca se cierra: se usa un archivo para medir algo real
+        with base_temporal(en_archivo=True):
+            sembrar_productos(1000)
+            usuario = User.objects.create_user('bench', password='bench')
+            PerfilUsuario.objects.create(user=usuario)
+            cliente = Client()
+            cliente.force_login(usuario)
+            cookie = f'{settings.SESSION_COOKIE_NAME}={cliente.cookies[settings.SESSION_COOKIE_NAME].value}'
+            informe['conectar'] = self._conectar()
+            servidor = self._servidor()
+            try:
+                for nombre, (max_age, health_checks) in CONFIGURACIONES.items():
+                    _configurar(max_age, health_checks)
+                    informe[nombre] = self._medir(servidor, cookie, options['peticiones'])
+                    self.stderr.write(f'{nombre} medido')
+            finally:
+                servidor.shutdown()
+                servidor.server_close()
+        self.stdout.write(json.dumps(informe, indent=2))
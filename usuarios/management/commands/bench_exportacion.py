@@ -0,0 +1,45 @@
+import json
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from usuarios.bench import base_temporal, sembrar_compras, sembrar_productos
+from usuarios.exportacion import exportar
+
+
+class Command(BaseCommand):
+    help = 'Exporta N compras sintéticas y falla si el pico de memoria del export supera el techo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=1000000)
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--techo-mb', type=float, default=32.0)
+
+    def handle(self, *args, **options):
+        with base_temporal():
+            sembrar_productos(1000)
+            sembrar_compras(User.objects.create_user('bench', password='bench'), options['filas'])
+
+            tracemalloc.start()
+            inicio = time.perf_counter()
+            bytes_totales = lineas = 0
+            for linea in exportar('compras', options['formato']):
+                bytes_totales += len(linea)
+                lineas += 1
+            duracion = time.perf_counter() - inicio
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        informe = {
+            'filas': options['filas'],
+            'lineas': lineas,
+            'mb_exportados': round(bytes_totales / 2**20, 1),
+            'segundos': round(duracion, 2),
+            'filas_por_segundo': round(options['filas'] / duracion),
+            'pico_memoria_mb': round(pico / 2**20, 2),
+        }
+        self.stdout.write(json.dumps(informe, indent=2))
+        if informe['pico_memoria_mb'] > options['techo_mb']:
+            raise CommandError(f"Pico de memoria {informe['pico_memoria_mb']} MB > techo {options['techo_mb']} MB")
@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from usuarios.bench import CATEGORIAS, PALABRAS, base_temporal
+from usuarios.importacion import importar, leer_filas
+from usuarios.models import Producto
+
+
+def _csv(filas, con_id=False, semilla=0):
+    azar = random.Random(semilla)
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    columnas = ['nombre', 'descripcion', 'categoria', 'costo', 'activo']
+    escritor.writerow((['id'] if con_id else []) + columnas)
+    for i in range(filas):
+        fila = [
+            ' '.join(azar.sample(PALABRAS, 3)).capitalize(), '', azar.choice(CATEGORIAS),
+            f'{azar.randint(100, 100000) / 100:.2f}', 'True',
+        ]
+        escritor.writerow(([i + 1] if con_id else []) + fila)
+    return io.BytesIO(salida.getvalue().encode())
+
+
+class Command(BaseCommand):
+    help = 'Mide filas/segundo de la importación masiva (altas nuevas y upserts sobre ids existentes).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=50000)
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        informe = {'filas': options['filas'], 'lote': options['lote']}
+        with base_temporal():
+            for nombre, con_id in (('altas', False), ('upserts', True)):
+                archivo = _csv(options['filas'], con_id=con_id)
+                inicio = time.perf_counter()
+                resultado = importar(leer_filas(archivo, 'csv'), lote=options['lote'])
+                duracion = time.perf_counter() - inicio
+                informe[nombre] = {
+                    'creados': resultado.creados,
+                    'actualizados': resultado.actualizados,
+                    'segundos': round(duracion, 2),
+                    'filas_por_segundo': round(options['filas'] / duracion),
+                }
+            informe['productos_en_tabla'] = Producto.objects.count()
+        self.stdout.write(json.dumps(informe, indent=2))
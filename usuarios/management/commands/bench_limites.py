@@ -0,0 +1,88 @@
+import json
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from usuarios.bench import base_temporal, medir, percentil
+from usuarios.limites import consumir
+
+PASSWORD = 'bench'
+
+
+class Command(BaseCommand):
+    help = 'Costo por comprobación de las cubetas de LIMITES según cuántas claves haya, y login rechazado vs completo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--claves', type=int, nargs='+', default=[1, 1000, 100000])
+        parser.add_argument('--comprobaciones', type=int, default=20000)
+        parser.add_argument('--logins', type=int, default=20)
+        parser.add_argument(
+            '--max-ratio', type=float, default=None,
+            help='Falla si la comprobación con más claves tarda más que con menos multiplicado por este factor.',
+        )
+
+    def _comprobaciones(self, claves, n, capacidad):
+        # Cubetas ya creadas, para medir el camino rápido (incr) y no la primera ficha (add)
+        cache = caches[settings.LIMITES_CACHE]
+        cache.clear()
+        for i in range(claves):
+            consumir([(f'bench:{i}', capacidad, 60)])
+        azar = random.Random(0)
+        muestras = [azar.randrange(claves) for _ in range(n)]
+        lote = 100
+        por_comprobacion = []
+        for i in range(0, n, lote):
+            inicio = time.perf_counter()
+            for clave in muestras[i:i + lote]:
+                consumir([(f'bench:{clave}', capacidad, 60)])
+            por_comprobacion.append((time.perf_counter() - inicio) / lote * 1e6)
+        return {
+            'us_p50': round(percentil(por_comprobacion, 50), 2),
+            'us_p99': round(percentil(por_comprobacion, 99), 2),
+        }
+
+    def _logins(self, n):
+        usuario = User.objects.create_user('bench', password=PASSWORD)
+        url = reverse('usuarios:login')
+        datos = {'username': usuario.username, 'password': PASSWORD}
+        with override_settings(LIMITES_ACTIVOS=False):
+            completo = medir(lambda: Client().post(url, datos), n, calentamiento=1)
+        # Una ficha por hora: después de la primera, todas se rechazan en el middleware
+        reglas = {'usuarios:login': {'metodos': ('POST',), 'ip': (1, 3600)}}
+        with override_settings(LIMITES=reglas):
+            caches[settings.LIMITES_CACHE].clear()
+            Client().post(url, datos)
+
+            def rechazado():
+                assert Client().post(url, datos).status_code == 429
+            return {'completo': completo, 'rechazado': medir(rechazado, n, calentamiento=1)}
+
+    def handle(self, *args, **options):
+        informe = {'comprobaciones': []}
+        for claves in options['claves']:
+            informe['comprobaciones'].append({
+                'claves': claves,
+                # capacidad enorme: siempre pasa; capacidad 1: siempre se rechaza (incr + decr)
+                'pasa': self._comprobaciones(claves, options['comprobaciones'], 10 ** 9),
+                'rechaza': self._comprobaciones(claves, options['comprobaciones'], 1),
+            })
+            self.stderr.write(f'{claves} claves medidas')
+        with base_temporal():
+            informe['login'] = self._logins(options['logins'])
+
+        self.stdout.write(json.dumps(informe, indent=2))
+
+        if options['max_ratio']:
+            primera, ultima = informe['comprobaciones'][0], informe['comprobaciones'][-1]
+            for caso in ('pasa', 'rechaza'):
+                ratio = ultima[caso]['us_p50'] / max(primera[caso]['us_p50'], 1e-6)
+                if ratio > options['max_ratio']:
+                    raise CommandError(
+                        f"{caso}: con {ultima['claves']} claves la comprobación es {ratio:.1f}x más lenta"
+                    )
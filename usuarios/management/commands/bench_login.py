@@ -0,0 +1,92 @@
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from usuarios.bench import base_temporal, medir
+from usuarios.models import PerfilUsuario
+
+PASSWORD = 'clave-de-prueba-123'
+
+
+def _hashers(perfil):
+    preferido = settings.HASHERS_POR_PERFIL[perfil]
+    return [preferido] + [ruta for ruta in settings.HASHERS_POR_PERFIL.values() if ruta != preferido]
+
+
+def _disponible(perfil):
+    try:
+        with override_settings(PASSWORD_HASHERS=_hashers(perfil)):
+            make_password('x')
+    except (ValueError, ImportError):
+        # p. ej. argon2 sin argon2-cffi instalado
+        return False
+    return True
+
+
+class Command(BaseCommand):
+    help = 'Logins por segundo por núcleo con cada perfil de hasher, y consultas por petición con sesiones db y cached_db.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=30)
+        parser.add_argument('--peticiones', type=int, default=200)
+
+    def _logins(self, usuario, n):
+        # Secuencial en un proceso: logins/s de un núcleo, vista completa (hash + sesión)
+        cliente = Client()
+        url = reverse('usuarios:login')
+        inicio = time.perf_counter()
+        for _ in range(n):
+            response = cliente.post(url, {'username': usuario.username, 'password': PASSWORD})
+            assert response.status_code == 302, response.status_code
+        return round(n / (time.perf_counter() - inicio), 1)
+
+    def _sesiones(self, usuario, engine, n):
+        consultas = []
+
+        def contar(execute, sql, params, many, context):
+            consultas.append(sql)
+            return execute(sql, params, many, context)
+
+        with override_settings(SESSION_ENGINE=engine):
+            cliente = Client()
+            cliente.force_login(usuario)
+            url = reverse('usuarios:editar_perfil')
+            cliente.get(url)
+            with connection.execute_wrapper(contar):
+                tiempos = medir(lambda: cliente.get(url), n, calentamiento=0)
+        return {**tiempos, 'consultas_por_peticion': round(len(consultas) / n, 2)}
+
+    def handle(self, *args, **options):
+        informe = {'hashers': {}, 'sesiones': {}}
+        # Los logins seguidos del mismo usuario agotarían su cubeta de LIMITES
+        with base_temporal(), override_settings(LIMITES_ACTIVOS=False):
+            for perfil in settings.HASHERS_POR_PERFIL:
+                if not _disponible(perfil):
+                    informe['hashers'][perfil] = 'no disponible'
+                    continue
+                with override_settings(PASSWORD_HASHERS=_hashers(perfil)):
+                    usuario = User.objects.create_user(f'login_{perfil}', password=PASSWORD)
+                    PerfilUsuario.objects.create(user=usuario)
+                    encoded = usuario.password
+                    informe['hashers'][perfil] = {
+                        'parametros': settings.HASHER_PARAMETROS.get(perfil, {}),
+                        'hash': medir(lambda: make_password(PASSWORD), 10, calentamiento=1),
+                        'verificacion': medir(lambda: check_password(PASSWORD, encoded), 10, calentamiento=1),
+                        'logins_por_segundo': self._logins(usuario, options['logins']),
+                    }
+                self.stderr.write(f'{perfil} medido')
+
+            usuario = User.objects.create_user('sesiones', password=PASSWORD)
+            PerfilUsuario.objects.create(user=usuario)
+            for nombre in ('db', 'cached_db'):
+                informe['sesiones'][nombre] = self._sesiones(
+                    usuario, f'django.contrib.sessions.backends.{nombre}', options['peticiones'],
+                )
+        self.stdout.write(json.dumps(informe, indent=2))
@@ -0,0 +1,64 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from usuarios.bench import base_temporal, medir, sembrar_compras, sembrar_productos
+from usuarios.models import Compra, Producto
+from usuarios.paginacion import PaginaKeyset, codificar_cursor
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia por página (primera, media y última) de la paginación por cursor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--tamano', type=int, default=20)
+        parser.add_argument('--repeticiones', type=int, default=30)
+        parser.add_argument(
+            '--max-ratio', type=float, default=None,
+            help='Falla si la página más profunda tarda más que la primera multiplicado por este factor.',
+        )
+
+    def _medir_posiciones(self, queryset, orden, filas, tamano, repeticiones):
+        campos = [o.lstrip('-') for o in orden]
+        resultado = {}
+        for nombre, posicion in (('primera', None), ('media', filas // 2), ('ultima', filas - tamano - 1)):
+            cursor = None
+            if posicion:
+                valores = queryset.order_by(*orden).values_list(*campos)[posicion]
+                cursor = codificar_cursor(valores)
+            resultado[nombre] = medir(
+                lambda: list(PaginaKeyset(queryset, orden, cursor, tamano)), repeticiones,
+            )
+        return resultado
+
+    def handle(self, *args, **options):
+        informe = []
+        for filas in options['filas']:
+            with base_temporal():
+                sembrar_productos(filas)
+                usuario = User.objects.create_user('bench', password='bench')
+                sembrar_compras(usuario, filas)
+                productos = self._medir_posiciones(
+                    Producto.objects.filter(activo=True), ('-creado_en', '-id'),
+                    Producto.objects.filter(activo=True).count(), options['tamano'], options['repeticiones'],
+                )
+                compras = self._medir_posiciones(
+                    Compra.objects.filter(usuario=usuario), ('-fecha', '-id'),
+                    filas, options['tamano'], options['repeticiones'],
+                )
+            informe.append({'filas': filas, 'productos': productos, 'compras': compras})
+            self.stderr.write(f'{filas} filas medidas')
+
+        self.stdout.write(json.dumps(informe, indent=2))
+
+        if options['max_ratio']:
+            for medicion in informe:
+                for listado in ('productos', 'compras'):
+                    tiempos = medicion[listado]
+                    ratio = tiempos['ultima']['p50_ms'] / max(tiempos['primera']['p50_ms'], 1e-6)
+                    if ratio > options['max_ratio']:
+                        raise CommandError(
+                            f"{listado} con {medicion['filas']} filas: la última página es {ratio:.1f}x más lenta"
+                        )
@@ -0,0 +1,86 @@
+import json
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+
+from usuarios.bench import base_temporal
+from usuarios.compras import StockInsuficiente, comprar_carrito
+from usuarios.models import Compra, Producto
+
+
+def comprar_con_reintentos(usuario, producto_id, cantidad, intentos=50):
+    """Una compra con reintentos ante bloqueos (SQLite) o deadlocks (MySQL).
+
+    Devuelve True si compró y False si no había stock.
+    """
+    for intento in range(intentos):
+        try:
+            comprar_carrito(usuario, [(producto_id, cantidad)])
+            return True
+        except StockInsuficiente:
+            return False
+        except OperationalError:
+            time.sleep(0.001 * (intento + 1))
+    raise RuntimeError('Demasiados reintentos')
+
+
+def estresar(usuarios, producto_id, compras_por_hilo, cantidad=1):
+    """Un hilo por usuario comprando el mismo producto a la vez; devuelve (vendidas, rechazadas, segundos)."""
+    resultados = {'vendidas': 0, 'rechazadas': 0}
+    lock = threading.Lock()
+    barrera = threading.Barrier(len(usuarios))
+
+    def trabajar(usuario):
+        try:
+            barrera.wait()
+            for _ in range(compras_por_hilo):
+                compro = comprar_con_reintentos(usuario, producto_id, cantidad)
+                with lock:
+                    resultados['vendidas' if compro else 'rechazadas'] += 1
+        finally:
+            connections.close_all()
+
+    hilos = [threading.Thread(target=trabajar, args=(u,)) for u in usuarios]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resultados['vendidas'], resultados['rechazadas'], time.perf_counter() - inicio
+
+
+class Command(BaseCommand):
+    help = 'Compras concurrentes de un mismo producto: comprueba que no se venda de más y mide compras/segundo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=32)
+        parser.add_argument('--compras-por-hilo', type=int, default=20)
+        parser.add_argument('--stock', type=int, default=400)
+
+    def handle(self, *args, **options):
+        # Con SQLite, base en archivo: en memoria los hilos no esperan el bloqueo, fallan
+        with base_temporal(en_archivo=True):
+            usuarios = [User.objects.create_user(f'estres{i}', password='x') for i in range(options['hilos'])]
+            producto = Producto.objects.create(nombre='Oferta', categoria='Varios', costo=10, stock=options['stock'])
+            vendidas, rechazadas, segundos = estresar(usuarios, producto.id, options['compras_por_hilo'])
+            producto.refresh_from_db()
+            compras = Compra.objects.filter(producto=producto).count()
+
+        informe = {
+            'hilos': options['hilos'],
+            'intentos': options['hilos'] * options['compras_por_hilo'],
+            'stock_inicial': options['stock'],
+            'vendidas': vendidas,
+            'rechazadas': rechazadas,
+            'stock_final': producto.stock,
+            'compras_en_base': compras,
+            'compras_por_segundo': round((vendidas + rechazadas) / segundos, 1),
+        }
+        self.stdout.write(json.dumps(informe, indent=2))
+        if vendidas != compras or producto.stock != options['stock'] - vendidas or producto.stock < 0:
+            raise CommandError('Inventario inconsistente')
+        if vendidas > options['stock']:
+            raise CommandError('Se vendió de más')
@@ -0,0 +1,326 @@
+import asyncio
+import http.client
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.client import MULTIPART_CONTENT, encode_multipart
+from django.test.testcases import LiveServerThread
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from usuarios.bench import (
+    base_temporal, peticion_asgi, resumir, sembrar_compras, sembrar_productos, sembrar_usuarios,
+)
+from usuarios.models import PerfilUsuario, Producto
+from usuarios.urls import construir_urlpatterns
+
+BOUNDARY = 'BenchBoundary'
+PASSWORD = 'bench'
+
+
+def _csv_importacion(i):
+    return SimpleUploadedFile(f'bench{i}.csv', f'nombre,categoria,costo\nImportado {i},Varios,10\n'.encode())
+
+
+# (ruta, método, datos). `datos` puede ser una función del número de petición para
+# generar valores únicos (usuarios nuevos, archivos). Todas las rutas de usuarios/urls.py
+# deben tener al menos un escenario: el comando falla si aparece una ruta sin medir.
+ESCENARIOS = [
+    ('raiz', 'get', None),
+    ('login', 'get', None),
+    ('login', 'post', lambda i: {'username': 'bench', 'password': PASSWORD}),
+    ('logout', 'post', None),
+    ('registro', 'get', None),
+    ('registro', 'post', lambda i: {
+        'username': f'nuevo{i}_{get_random_string(6)}', 'email': f'nuevo{i}@correo.com',
+        'password': 'clave-segura', 'confirm_password': 'clave-segura',
+    }),
+    ('perfil', 'get', None),
+    ('editar_perfil', 'get', None),
+    ('editar_perfil', 'post', lambda i: {'email': f'bench{i}@correo.com', 'direccion': f'Calle {i}'}),
+    ('productos', 'get', None),
+    ('crear_producto', 'get', None),
+    ('crear_producto', 'post', lambda i: {
+        'nombre': f'Nuevo {i}', 'descripcion': '', 'categoria': 'Varios', 'costo': '10', 'activo': 'on',
+    }),
+    ('importar_productos', 'get', None),
+    ('importar_productos', 'post', lambda i: {'archivo': _csv_importacion(i)}),
+    ('comprar', 'get', None),
+    ('comprar', 'post', 'compra'),
+    ('carrito', 'post', 'carrito'),
+    ('exportar_compras', 'get', None),
+    ('exportar_productos', 'get', None),
+    ('metricas', 'get', None),
+    ('metricas_prometheus', 'get', None),
+    ('ventas', 'get', None),
+    ('ventas_api', 'get', lambda i: {'por': 'producto', 'periodo': 'dia'}),
+]
+
+# Cada petición necesita una sesión propia (logout la destruye)
+SESION_NUEVA = {'logout'}
+
+
+def _rutas_sin_escenario():
+    nombres = {patron.name or 'raiz' for patron in construir_urlpatterns()}
+    return nombres - {nombre for nombre, _, _ in ESCENARIOS}
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide todas las rutas de usuarios con el cliente de pruebas, un servidor WSGI local y la '
+        'aplicación ASGI: peticiones/segundo, p50/p95/p99 y consultas. Compara contra una línea base.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=1000)
+        parser.add_argument('--productos', type=int, default=10000)
+        parser.add_argument('--compras', type=int, default=50000)
+        parser.add_argument('--repeticiones', type=int, default=30)
+        parser.add_argument('--concurrencia', type=int, default=8, help='Para los modos wsgi y asgi')
+        parser.add_argument('--modos', nargs='+', choices=['cliente', 'wsgi', 'asgi'], default=['cliente', 'wsgi', 'asgi'])
+        parser.add_argument('--solo', nargs='+', default=None, help='Limita a estas rutas (nombres de URL)')
+        parser.add_argument('--salida', help='Guarda los resultados en este archivo JSON')
+        parser.add_argument('--base', help='Resultados anteriores (JSON) contra los que comparar')
+        parser.add_argument('--tolerancia', type=float, default=0.25, help='Aumento relativo de p95 permitido')
+        parser.add_argument('--holgura-ms', type=float, default=2.0, help='Aumento absoluto de p95 que se ignora')
+
+    # --- DATOS ---
+
+    def _sembrar(self, options):
+        sembrar_productos(options['productos'])
+        usuarios = sembrar_usuarios(options['usuarios'])
+        # Usuario medido: staff, para cubrir también las rutas de exportación e importación
+        self.usuario = User.objects.create_user('bench', password=PASSWORD, is_staff=True)
+        PerfilUsuario.objects.create(user=self.usuario)
+        # El usuario medido tiene un historial proporcional a la escala pedida
+        sembrar_compras(usuarios, options['compras'])
+        sembrar_compras(self.usuario, max(options['compras'] // max(options['usuarios'], 1), 50), semilla=1)
+        self.productos = list(Producto.objects.filter(activo=True).values_list('id', flat=True)[:10])
+
+    def _datos(self, datos, i):
+        if datos == 'compra':
+            return {'producto_id': self.productos[i % len(self.productos)], 'cantidad': 1}
+        if datos == 'carrito':
+            return {'producto_id': self.productos, 'cantidad': ['1'] * len(self.productos)}
+        return datos(i) if callable(datos) else datos
+
+    def _url(self, nombre):
+        return '/usuarios/' if nombre == 'raiz' else reverse(f'usuarios:{nombre}')
+
+    def _sesion(self):
+        cliente = Client()
+        cliente.force_login(self.usuario)
+        return cliente
+
+    def _cookie(self, cliente, csrf):
+        return f'{settings.SESSION_COOKIE_NAME}={cliente.cookies[settings.SESSION_COOKIE_NAME].value}; csrftoken={csrf}'
+
+    def _peticiones(self, nombre, metodo, datos, repeticiones):
+        # Peticiones ya codificadas para los modos con servidor: (método, url, cuerpo, cabeceras)
+        cliente = None if nombre in SESION_NUEVA else self._sesion()
+        csrf = get_random_string(32)
+        peticiones = []
+        for i in range(repeticiones):
+            cookie = self._cookie(cliente or self._sesion(), csrf)
+            cabeceras = {'Cookie': cookie, 'X-CSRFToken': csrf, 'Host': 'testserver'}
+            cuerpo = b''
+            valores = self._datos(datos, i)
+            if metodo == 'post':
+                cuerpo = encode_multipart(BOUNDARY, valores or {})
+                cabeceras['Content-Type'] = MULTIPART_CONTENT.replace('BoUnDaRyStRiNg', BOUNDARY)
+            peticiones.append((metodo.upper(), self._url(nombre), cuerpo, cabeceras))
+        return peticiones
+
+    # --- MODOS ---
+
+    def _cliente(self, nombre, metodo, datos, repeticiones):
+        # En proceso y secuencial: el único modo que cuenta consultas por petición
+        cliente = self._sesion()
+        url = self._url(nombre)
+        tiempos, consultas, errores = [], 0, 0
+
+        def contar(execute, sql, params, many, context):
+            nonlocal consultas
+            consultas += 1
+            return execute(sql, params, many, context)
+
+        inicio_total = time.perf_counter()
+        for i in range(repeticiones):
+            if nombre in SESION_NUEVA:
+                cliente.force_login(self.usuario)
+            valores = self._datos(datos, i)
+            with connection.execute_wrapper(contar):
+                inicio = time.perf_counter()
+                response = getattr(cliente, metodo)(url, valores)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                tiempos.append(time.perf_counter() - inicio)
+            errores += response.status_code >= 400
+        duracion = time.perf_counter() - inicio_total
+        return {
+            'peticiones_por_segundo': round(repeticiones / duracion, 1),
+            'consultas_por_peticion': round(consultas / repeticiones, 2),
+            'errores': errores,
+            **resumir(tiempos),
+        }
+
+    def _wsgi(self, servidor, peticiones, concurrencia):
+        def una(peticion):
+            metodo, url, cuerpo, cabeceras = peticion
+            conexion = http.client.HTTPConnection(servidor.host, servidor.port, timeout=60)
+            inicio = time.perf_counter()
+            conexion.request(metodo, url, body=cuerpo, headers=cabeceras)
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            conexion.close()
+            return time.perf_counter() - inicio, respuesta.status
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(concurrencia) as pool:
+            resultados = list(pool.map(una, peticiones))
+        duracion = time.perf_counter() - inicio
+        return {
+            'peticiones_por_segundo': round(len(peticiones) / duracion, 1),
+            'errores': sum(status >= 400 for _, status in resultados),
+            **resumir([t for t, _ in resultados]),
+        }
+
+    async def _asgi(self, app, peticiones, concurrencia):
+        semaforo = asyncio.Semaphore(concurrencia)
+
+        async def una(peticion):
+            metodo, url, cuerpo, cabeceras = peticion
+            otras = [(k, v) for k, v in cabeceras.items() if k not in ('Cookie', 'Host')]
+            async with semaforo:
+                inicio = time.perf_counter()
+                status = await peticion_asgi(app, url, cabeceras['Cookie'], metodo, cuerpo, otras)
+                return time.perf_counter() - inicio, status
+
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(*(una(p) for p in peticiones))
+        duracion = time.perf_counter() - inicio
+        return {
+            'peticiones_por_segundo': round(len(peticiones) / duracion, 1),
+            'errores': sum(status >= 400 for _, status in resultados),
+            **resumir([t for t, _ in resultados]),
+        }
+
+    def _servidor_wsgi(self):
+        # El mismo servidor que LiveServerTestCase (ThreadedWSGIServer sobre un socket local).
+        # Una base SQLite en memoria solo existe en esta conexión: se comparte con los hilos.
+        compartidas = {}
+        for conexion in connections.all():
+            if conexion.vendor == 'sqlite' and conexion.is_in_memory_db():
+                conexion.inc_thread_sharing()
+                compartidas[conexion.alias] = conexion
+        servidor = LiveServerThread('localhost', lambda handler: handler, compartidas, port=0)
+        servidor.daemon = True
+        servidor.start()
+        servidor.is_ready.wait()
+        if servidor.error:
+            raise servidor.error
+        return servidor, compartidas
+
+    # --- COMPARACIÓN ---
+
+    def _regresiones(self, actual, base, tolerancia, holgura_ms):
+        regresiones = []
+        for modo, escenarios in actual.items():
+            for escenario, medida in escenarios.items():
+                anterior = base.get(modo, {}).get(escenario)
+                if anterior is None:
+                    continue
+                limite = max(anterior['p95_ms'] * (1 + tolerancia), anterior['p95_ms'] + holgura_ms)
+                if medida['p95_ms'] > limite:
+                    regresiones.append(
+                        f"{modo} {escenario}: p95 {medida['p95_ms']:.1f} ms (base {anterior['p95_ms']:.1f} ms)"
+                    )
+                if medida.get('consultas_por_peticion', 0) > anterior.get('consultas_por_peticion', float('inf')):
+                    regresiones.append(
+                        f"{modo} {escenario}: {medida['consultas_por_peticion']} consultas "
+                        f"(base {anterior['consultas_por_peticion']})"
+                    )
+                if medida['errores'] > anterior['errores']:
+                    regresiones.append(f"{modo} {escenario}: {medida['errores']} errores")
+        return regresiones
+
+    def handle(self, *args, **options):
+        faltantes = _rutas_sin_escenario()
+        if faltantes:
+            raise CommandError(f"Rutas sin escenario en bench_urls: {', '.join(sorted(faltantes))}")
+        escenarios = [e for e in ESCENARIOS if not options['solo'] or e[0] in options['solo']]
+        repeticiones = options['repeticiones']
+        resultados = {modo: {} for modo in options['modos']}
+        concurrencia = options['concurrencia']
+
+        # Se mide la configuración de producción: sin el detector de N+1 de desarrollo.
+        # Sin límite de peticiones: todas salen del mismo cliente y lo agotarían en segundos.
+        with base_temporal(), override_settings(DETECTOR_CONSULTAS=False, LIMITES_ACTIVOS=False):
+            self._sembrar(options)
+            self.stderr.write('Datos sembrados')
+            en_memoria = any(c.vendor == 'sqlite' and c.is_in_memory_db() for c in connections.all())
+            if en_memoria and concurrencia > 1:
+                # SQLite en memoria (p. ej. settings de pruebas): las escrituras simultáneas
+                # chocan con los bloqueos de tabla; los modos con servidor se miden en serie
+                self.stderr.write('Aviso: SQLite en memoria, wsgi y asgi se miden sin concurrencia')
+                concurrencia = 1
+
+            if 'cliente' in options['modos']:
+                for nombre, metodo, datos in escenarios:
+                    resultados['cliente'][f'{metodo.upper()} {nombre}'] = self._cliente(nombre, metodo, datos, repeticiones)
+                self.stderr.write('cliente medido')
+
+            if 'wsgi' in options['modos']:
+                servidor, compartidas = self._servidor_wsgi()
+                try:
+                    for nombre, metodo, datos in escenarios:
+                        peticiones = self._peticiones(nombre, metodo, datos, repeticiones)
+                        resultados['wsgi'][f'{metodo.upper()} {nombre}'] = self._wsgi(
+                            servidor, peticiones, concurrencia,
+                        )
+                finally:
+                    servidor.terminate()
+                    for conexion in compartidas.values():
+                        conexion.dec_thread_sharing()
+                self.stderr.write('wsgi medido')
+
+            if 'asgi' in options['modos']:
+                app = get_asgi_application()
+                for nombre, metodo, datos in escenarios:
+                    peticiones = self._peticiones(nombre, metodo, datos, repeticiones)
+                    resultados['asgi'][f'{metodo.upper()} {nombre}'] = asyncio.run(
+                        self._asgi(app, peticiones, concurrencia)
+                    )
+                self.stderr.write('asgi medido')
+
+        informe = {
+            'escala': {k: options[k] for k in ('usuarios', 'productos', 'compras', 'repeticiones', 'concurrencia')},
+            'vendor': connection.vendor,
+            'concurrencia_efectiva': concurrencia,
+            'resultados': resultados,
+        }
+        texto = json.dumps(informe, indent=2)
+        if options['salida']:
+            with open(options['salida'], 'w') as archivo:
+                archivo.write(texto)
+        self.stdout.write(texto)
+
+        if options['base']:
+            with open(options['base']) as archivo:
+                base = json.load(archivo)
+            if base.get('escala') != informe['escala']:
+                self.stderr.write('Aviso: la línea base se midió con otra escala')
+            regresiones = self._regresiones(
+                resultados, base['resultados'], options['tolerancia'], options['holgura_ms'],
+            )
+            if regresiones:
+                raise CommandError('Regresiones respecto a la línea base:\n' + '\n'.join(regresiones))
+            self.stderr.write(self.style.SUCCESS('Sin regresiones respecto a la línea base'))
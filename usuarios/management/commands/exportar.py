@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from usuarios.exportacion import COLUMNAS, FORMATOS, exportar, leer_fecha
+
+
+class Command(BaseCommand):
+    help = 'Exporta compras o productos en CSV/JSON lines sin cargar todas las filas en memoria.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modelo', choices=sorted(COLUMNAS))
+        parser.add_argument('--formato', choices=sorted(FORMATOS), default='csv')
+        parser.add_argument('--desde', type=leer_fecha, help='AAAA-MM-DD (inclusive)')
+        parser.add_argument('--hasta', type=leer_fecha, help='AAAA-MM-DD (inclusive)')
+        parser.add_argument('--categoria')
+        parser.add_argument('--lote', type=int, default=2000)
+        parser.add_argument('--salida', help='Archivo de destino (por defecto, la salida estándar)')
+
+    def handle(self, *args, **options):
+        lineas = exportar(
+            options['modelo'], options['formato'], options['lote'],
+            desde=options['desde'], hasta=options['hasta'], categoria=options['categoria'],
+        )
+        try:
+            destino = open(options['salida'], 'w', encoding='utf-8', newline='') if options['salida'] else sys.stdout
+        except OSError as exc:
+            raise CommandError(exc)
+        try:
+            for linea in lineas:
+                destino.write(linea)
+        finally:
+            if destino is not sys.stdout:
+                destino.close()
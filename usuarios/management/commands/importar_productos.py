@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from usuarios.importacion import formato_de, importar, leer_filas
+
+
+class Command(BaseCommand):
+    help = 'Importa productos desde CSV, JSON lines o un arreglo JSON, con upserts por lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument('--formato', choices=['csv', 'jsonl', 'json'], help='Por defecto, según la extensión')
+        parser.add_argument('--lote', type=int, default=settings.IMPORTACION_LOTE)
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or formato_de(options['archivo'])
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                resultado = importar(leer_filas(archivo, formato), lote=options['lote'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+
+        for fila, errores in resultado.errores:
+            detalle = '; '.join(f"{campo}: {' '.join(mensajes)}" for campo, mensajes in errores.items())
+            self.stderr.write(f'Fila {fila}: {detalle}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.creados} creados, {resultado.actualizados} actualizados, '
+            f'{len(resultado.errores)} filas con errores.'
+        ))
@@ -0,0 +1,38 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from usuarios.tareas import nuevo_trabajador, procesar_lote
+
+
+class Command(BaseCommand):
+    help = 'Worker de la cola de tareas: reclama lotes de la tabla Tarea y los ejecuta en un pool de hilos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=4)
+        parser.add_argument('--lote', type=int, default=100, help='Tareas reclamadas por vuelta')
+        parser.add_argument('--espera', type=float, default=1.0, help='Segundos entre consultas con la cola vacía')
+        parser.add_argument('--una-vez', action='store_true', help='Vacía la cola y termina')
+
+    def handle(self, *args, **options):
+        trabajador = nuevo_trabajador()
+        hilos = options['hilos']
+        total = fallidas = 0
+        self.stdout.write(f'Worker {trabajador} con {hilos} hilos')
+        with ThreadPoolExecutor(hilos, thread_name_prefix='tareas') as pool:
+            try:
+                while True:
+                    reclamadas, terminadas = procesar_lote(trabajador, options['lote'], pool, hilos)
+                    total += terminadas
+                    fallidas += reclamadas - terminadas
+                    if reclamadas:
+                        self.stdout.write(f'{terminadas}/{reclamadas} tareas terminadas')
+                        continue
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['espera'])
+            except KeyboardInterrupt:
+                # Las tareas del lote en curso que no terminen se retoman al vencer el bloqueo
+                self.stdout.write('Deteniendo...')
+        self.stdout.write(self.style.SUCCESS(f'{total} tareas terminadas, {fallidas} con error.'))
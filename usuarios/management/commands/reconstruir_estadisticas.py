@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from usuarios.estadisticas import recalcular_usuarios
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde cero las estadísticas de compras de todos los usuarios, por lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total, ultimo_id = 0, 0
+        while True:
+            # Recorrido por clave (id > último) para no usar OFFSET en tablas grandes
+            ids = list(
+                User.objects.filter(id__gt=ultimo_id).order_by('id').values_list('id', flat=True)[:options['lote']]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                total += recalcular_usuarios(ids)
+            ultimo_id = ids[-1]
+            self.stdout.write(f'{total} usuarios procesados')
+        self.stdout.write(self.style.SUCCESS(f'Estadísticas reconstruidas para {total} usuarios.'))
@@ -0,0 +1,32 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from usuarios.ventas import inicio_mes, mes_siguiente, rango_compras, reconstruir_ventas
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde Compra los resúmenes de ventas diarios y mensuales, un mes por transacción.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=date.fromisoformat, help='AAAA-MM-DD; por defecto, la primera compra')
+        parser.add_argument('--hasta', type=date.fromisoformat, help='AAAA-MM-DD; por defecto, la última compra')
+
+    def handle(self, *args, **options):
+        rango = rango_compras()
+        desde = options['desde'] or (rango and rango[0])
+        hasta = options['hasta'] or (rango and rango[1])
+        if not desde or not hasta:
+            self.stdout.write('No hay compras.')
+            return
+        if desde > hasta:
+            raise CommandError('--desde es posterior a --hasta')
+
+        # Por meses: cada transacción lee un mes de Compra (compra_fecha_idx)
+        mes = inicio_mes(desde)
+        while mes <= hasta:
+            ultimo_dia = mes_siguiente(mes) - timedelta(days=1)
+            reconstruir_ventas(max(mes, desde), min(ultimo_dia, hasta))
+            self.stdout.write(f'{mes:%Y-%m} reconstruido')
+            mes = mes_siguiente(mes)
+        self.stdout.write(self.style.SUCCESS(f'Ventas reconstruidas del {desde} al {hasta}.'))
@@ -0,0 +1,248 @@
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+
+# Medición de la petición en curso; None si no se muestrea. Con ContextVar también la
+# ven los hilos de sync_to_async, donde el ORM async ejecuta las consultas.
+_actual = ContextVar('medicion_peticion', default=None)
+
+
+# --- HISTOGRAMAS ---
+
+class Histograma:
+    """Cubetas acumulativas al estilo Prometheus (le = "menor o igual que")."""
+
+    def __init__(self, limites):
+        self.limites = tuple(limites)
+        self.cubetas = [0] * (len(self.limites) + 1)   # la última es +Inf
+        self.suma = 0
+        self.n = 0
+
+    def observar(self, valor):
+        self.cubetas[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.n += 1
+
+    def acumuladas(self):
+        total = 0
+        for limite, cuenta in zip(self.limites + (float('inf'),), self.cubetas):
+            total += cuenta
+            yield limite, total
+
+    def percentil(self, p):
+        # Aproximado: límite superior de la cubeta donde cae el percentil
+        if not self.n:
+            return None
+        objetivo = self.n * p / 100
+        for limite, total in self.acumuladas():
+            if total >= objetivo:
+                return limite
+        return float('inf')
+
+    def resumen(self):
+        return {
+            'n': self.n,
+            'media': self.suma / self.n if self.n else None,
+            'p50': self.percentil(50),
+            'p95': self.percentil(95),
+            'p99': self.percentil(99),
+        }
+
+
+SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONSULTAS = (0, 1, 2, 5, 10, 20, 50, 100)
+BYTES = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# nombre de la métrica -> (límites de las cubetas, ayuda para Prometheus)
+METRICAS = {
+    'duracion_segundos': (SEGUNDOS, 'Tiempo total de la petición'),
+    'sql_segundos': (SEGUNDOS, 'Tiempo en consultas SQL'),
+    'sql_consultas': (CONSULTAS, 'Consultas SQL por petición'),
+    'render_segundos': (SEGUNDOS, 'Tiempo de renderizado de plantillas'),
+    'respuesta_bytes': (BYTES, 'Tamaño de la respuesta (no incluye respuestas en streaming)'),
+}
+
+
+class Registro:
+    """Histogramas por vista, en memoria del proceso (cada worker lleva los suyos)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vistas = {}
+
+    def registrar(self, vista, valores):
+        with self._lock:
+            histogramas = self._vistas.get(vista)
+            if histogramas is None:
+                histogramas = self._vistas[vista] = {
+                    nombre: Histograma(limites) for nombre, (limites, _) in METRICAS.items()
+                }
+            for nombre, valor in valores.items():
+                if valor is not None:
+                    histogramas[nombre].observar(valor)
+
+    def resumen(self):
+        with self._lock:
+            return {
+                vista: {nombre: h.resumen() for nombre, h in histogramas.items()}
+                for vista, histogramas in sorted(self._vistas.items())
+            }
+
+    def prometheus(self):
+        lineas = []
+        with self._lock:
+            for nombre, (_, ayuda) in METRICAS.items():
+                metrica = f'tienda_{nombre}'
+                lineas += [f'# HELP {metrica} {ayuda}', f'# TYPE {metrica} histogram']
+                for vista, histogramas in sorted(self._vistas.items()):
+                    h = histogramas[nombre]
+                    for limite, total in h.acumuladas():
+                        le = '+Inf' if limite == float('inf') else f'{limite:g}'
+                        lineas.append(f'{metrica}_bucket{{vista="{vista}",le="{le}"}} {total}')
+                    lineas.append(f'{metrica}_sum{{vista="{vista}"}} {h.suma:g}')
+                    lineas.append(f'{metrica}_count{{vista="{vista}"}} {h.n}')
+        return '\n'.join(lineas) + '\n'
+
+    def limpiar(self):
+        with self._lock:
+            self._vistas.clear()
+
+
+registro = Registro()
+
+
+# --- MEDICIÓN ---
+
+class Medicion:
+    __slots__ = ('consultas', 'sql', 'render', 'profundidad')
+
+    def __init__(self):
+        self.consultas = 0
+        self.sql = 0.0
+        self.render = 0.0
+        self.profundidad = 0
+
+
+def medir_sql(execute, sql, params, many, context):
+    medicion = _actual.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.sql += time.perf_counter() - inicio
+        medicion.consultas += 1
+
+
+def instalar_en_conexion(connection, **kwargs):
+    # Se engancha a cada conexión una sola vez (señal connection_created)
+    if medir_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(medir_sql)
+
+
+def instalar_en_conexiones():
+    for connection in connections.all(initialized_only=True):
+        instalar_en_conexion(connection)
+
+
+class _PlantillaMedida:
+    def __init__(self, plantilla):
+        self.plantilla = plantilla
+
+    def __getattr__(self, nombre):
+        return getattr(self.plantilla, nombre)
+
+    def render(self, context=None, request=None):
+        medicion = _actual.get()
+        if medicion is None:
+            return self.plantilla.render(context, request)
+        # Solo se mide el render exterior; un render_to_string anidado ya está incluido
+        medicion.profundidad += 1
+        inicio = time.perf_counter()
+        try:
+            return self.plantilla.render(context, request)
+        finally:
+            medicion.profundidad -= 1
+            if not medicion.profundidad:
+                medicion.render += time.perf_counter() - inicio
+
+
+class PlantillasMedidas(DjangoTemplates):
+    """Backend DjangoTemplates que suma el tiempo de render a la petición muestreada."""
+
+    def from_string(self, template_code):
+        return _PlantillaMedida(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _PlantillaMedida(super().get_template(template_name))
+
+
+class MetricasMiddleware:
+    """Mide tiempo, SQL, render y tamaño de respuesta por vista (nombre de la ruta).
+
+    Solo se mide una fracción METRICAS_MUESTREO de las peticiones; las demás
+    pasan sin más costo que un random().
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+        instalar_en_conexiones()
+
+    def _muestrear(self):
+        muestreo = settings.METRICAS_MUESTREO
+        return muestreo >= 1 or (muestreo > 0 and random.random() < muestreo)
+
+    def _registrar(self, request, response, medicion, inicio):
+        duracion = time.perf_counter() - inicio
+        coincidencia = getattr(request, 'resolver_match', None)
+        vista = coincidencia.view_name if coincidencia else 'sin_ruta'
+        registro.registrar(vista, {
+            'duracion_segundos': duracion,
+            'sql_segundos': medicion.sql,
+            'sql_consultas': medicion.consultas,
+            'render_segundos': medicion.render,
+            'respuesta_bytes': None if response.streaming else len(response.content),
+        })
+
+    def __call__(self, request):
+        if self.es_async:
+            return self.__acall__(request)
+        if not self._muestrear():
+            return self.get_response(request)
+        medicion = Medicion()
+        token = _actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _actual.reset(token)
+        self._registrar(request, response, medicion, inicio)
+        return response
+
+    async def __acall__(self, request):
+        if not self._muestrear():
+            return await self.get_response(request)
+        medicion = Medicion()
+        token = _actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _actual.reset(token)
+        self._registrar(request, response, medicion, inicio)
+        return response
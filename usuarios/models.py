@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class PerfilUsuario(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='perfil')
@@ -15,7 +16,28 @@ class Producto(models.Model):
     categoria = models.CharField(max_length=100)
     costo = models.DecimalField(max_digits=10, decimal_places=2)
     activo = models.BooleanField(default=True)
+    # Unidades disponibles; None = sin control de inventario (se puede comprar siempre)
+    stock = models.PositiveIntegerField(null=True, blank=True)
     creado_en = models.DateTimeField(auto_now_add=True)
+    # Última edición (alta incluida); parte del ETag del catálogo (condicional.py).
+    # Los UPDATE masivos y bulk_update no lo tocan solos: hay que incluirlo explícitamente.
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # catálogo: activos por categoría, más nuevos primero (comprar_view, facetas)
+            models.Index(fields=['activo', 'categoria', '-creado_en', '-id'], name='producto_activo_cat_idx'),
+            # catálogo sin filtro de categoría
+            models.Index(fields=['activo', '-creado_en', '-id'], name='producto_activo_creado_idx'),
+            # ProductosView y date_hierarchy del admin
+            models.Index(fields=['-creado_en', '-id'], name='producto_creado_idx'),
+            # list_filter por categoría del admin (DISTINCT categoria)
+            models.Index(fields=['categoria'], name='producto_categoria_idx'),
+            # MAX(actualizado_en) de las respuestas condicionales: lee un extremo del índice
+            models.Index(fields=['actualizado_en'], name='producto_actualizado_idx'),
+            # búsqueda por prefijo del admin (^nombre) y autocompletado de productos
+            models.Index(fields=['nombre'], name='producto_nombre_idx'),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -30,10 +52,153 @@ class Compra(models.Model):
 
     class Meta:
         ordering = ['-fecha']
+        indexes = [
+            # historial del perfil: compras de un usuario, más recientes primero
+            models.Index(fields=['usuario', '-fecha', '-id'], name='compra_usuario_fecha_idx'),
+            # changelist del admin (orden por fecha) y date_hierarchy
+            models.Index(fields=['-fecha', '-id'], name='compra_fecha_idx'),
+            # list_filter por producto del admin, conservando el orden por fecha
+            models.Index(fields=['producto', '-fecha', '-id'], name='compra_producto_fecha_idx'),
+        ]
 
-    def save(self, *args, **kwargs):
+    def calcular_total(self):
+        # También lo usa el carrito, que inserta con bulk_create y no pasa por save()
         self.total = self.cantidad * self.precio_unitario
+        return self.total
+
+    def save(self, *args, **kwargs):
+        self.calcular_total()
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Compra {self.id} - {self.usuario.username} - {self.producto.nombre}"
+
+
+class EstadisticasCompras(models.Model):
+    # Resumen desnormalizado de las compras de cada usuario (ver estadisticas.py)
+    usuario = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='estadisticas')
+    total_gastado = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    num_compras = models.PositiveIntegerField(default=0)
+    unidades = models.PositiveIntegerField(default=0)
+    ultima_compra = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'estadísticas de compras'
+        verbose_name_plural = 'estadísticas de compras'
+
+    def __str__(self):
+        return f"{self.usuario.username} - {self.num_compras} compras"
+
+
+class Tarea(models.Model):
+    # Cola de tareas en la base (ver tareas.py); las terminadas se borran
+    PENDIENTE, EN_CURSO, FALLIDA = 'pendiente', 'en_curso', 'fallida'
+
+    nombre = models.CharField(max_length=100)
+    datos = models.JSONField(default=dict)
+    estado = models.CharField(
+        max_length=10, default=PENDIENTE,
+        choices=[(PENDIENTE, 'Pendiente'), (EN_CURSO, 'En curso'), (FALLIDA, 'Fallida')],
+    )
+    intentos = models.PositiveSmallIntegerField(default=0)
+    # Pendiente: cuándo puede ejecutarse (reintentos con espera); en curso: fin del bloqueo
+    disponible_en = models.DateTimeField(default=timezone.now)
+    # Worker que la reclamó por última vez
+    trabajador = models.CharField(max_length=32, blank=True)
+    ultimo_error = models.TextField(blank=True)
+    creada_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # reclamar: no fallidas con disponible_en vencido, las más antiguas primero
+            models.Index(fields=['estado', 'disponible_en'], name='tarea_disponible_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.nombre} #{self.pk} ({self.estado})"
+
+
+class Auditoria(models.Model):
+    # Registro de acciones de los usuarios; lo escribe la tarea 'auditar'
+    evento = models.CharField(max_length=32, unique=True)  # idempotencia ante reentregas
+    accion = models.CharField(max_length=50)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    datos = models.JSONField(default=dict)
+    fecha = models.DateTimeField()  # la de la acción, no la del procesamiento
+
+    class Meta:
+        verbose_name_plural = 'auditoría'
+        indexes = [
+            models.Index(fields=['-fecha', '-id'], name='auditoria_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.accion} - {self.usuario_id} - {self.fecha:%Y-%m-%d %H:%M}"
+
+
+# --- RESÚMENES DE VENTAS (ver ventas.py) ---
+
+class VentaResumen(models.Model):
+    # Una fila por período: el día o el mes (inicio = primer día) de las compras
+    DIA, MES = 'dia', 'mes'
+
+    periodo = models.CharField(max_length=3, choices=[(DIA, 'Día'), (MES, 'Mes')])
+    inicio = models.DateField()
+    # Con signo: un borrado resta y, si la categoría del producto cambió, puede dejar la vieja en negativo
+    unidades = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    num_compras = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class VentaProducto(VentaResumen):
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='+')
+    # Categoría del producto al vender (para filtrar sin JOIN)
+    categoria = models.CharField(max_length=100)
+
+    class Meta:
+        verbose_name = 'venta por producto'
+        verbose_name_plural = 'ventas por producto'
+        constraints = [
+            # También sirve a las consultas de un producto en un rango
+            models.UniqueConstraint(fields=['periodo', 'producto', 'inicio'], name='venta_producto_unica'),
+        ]
+        indexes = [
+            # productos más vendidos en un rango
+            models.Index(fields=['periodo', 'inicio'], name='venta_producto_rango_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id} {self.periodo} {self.inicio}"
+
+
+class VentaCategoria(VentaResumen):
+    categoria = models.CharField(max_length=100)
+
+    class Meta:
+        verbose_name = 'venta por categoría'
+        verbose_name_plural = 'ventas por categoría'
+        constraints = [
+            models.UniqueConstraint(fields=['periodo', 'categoria', 'inicio'], name='venta_categoria_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['periodo', 'inicio'], name='venta_categoria_rango_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.categoria} {self.periodo} {self.inicio}"
+
+
+class VentaAplicada(models.Model):
+    # Deltas de la tarea 'registrar_ventas' ya sumados a los resúmenes
+    evento = models.CharField(max_length=32, unique=True)  # idempotencia ante reentregas
+    creada_en = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'venta aplicada'
+        verbose_name_plural = 'ventas aplicadas'
+
+    def __str__(self):
+        return self.evento
@@ -0,0 +1,245 @@
+import base64
+import binascii
+import json
+from bisect import bisect_right
+from datetime import date, datetime
+from decimal import Decimal
+from functools import cached_property
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+# --- CURSORES ---
+# El cursor es opaco para el cliente: JSON con los valores de orden de la última fila, en base64
+
+def _serializar(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def codificar_cursor(valores):
+    crudo = json.dumps([_serializar(v) for v in valores], separators=(',', ':'))
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, modelo, campos):
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (binascii.Error, ValueError) as exc:
+        raise CursorInvalido(cursor) from exc
+    if not isinstance(valores, list) or len(valores) != len(campos):
+        raise CursorInvalido(cursor)
+
+    resultado = []
+    for nombre, valor in zip(campos, valores):
+        try:
+            campo = modelo._meta.get_field(nombre)
+        except FieldDoesNotExist:
+            # Anotaciones (p. ej. relevancia): se usa el valor tal cual
+            resultado.append(valor)
+            continue
+        try:
+            resultado.append(campo.to_python(valor))
+        except (ValidationError, TypeError, ValueError) as exc:
+            # TypeError: valores de otro tipo JSON (p. ej. un número donde va una fecha)
+            raise CursorInvalido(cursor) from exc
+    return resultado
+
+
+# --- PÁGINA ---
+
+class PaginaKeyset:
+    """Página "después de la fila X" sin OFFSET.
+
+    `orden` es una tupla al estilo order_by, p. ej. ('-creado_en', '-id'); el
+    último campo debe ser único para que el orden sea total y estable aunque
+    se inserten filas entre página y página. La consulta es perezosa: no toca
+    la base hasta que se itera o se pide el cursor siguiente.
+    """
+
+    def __init__(self, queryset, orden, cursor=None, tamano=20):
+        self.queryset = queryset
+        self.orden = tuple(orden)
+        self.campos = [o.lstrip('-') for o in self.orden]
+        self.tamano = tamano
+        self.cursor = cursor or None
+        self.valores_cursor = None
+        if self.cursor:
+            try:
+                self.valores_cursor = decodificar_cursor(self.cursor, queryset.model, self.campos)
+            except CursorInvalido:
+                # Un cursor manipulado o viejo vuelve a la primera página
+                self.cursor = None
+
+    def _filtro(self):
+        # (a, b) > (x, y)  ==>  a > x  OR  (a = x AND b > y), respetando la dirección de cada campo
+        filtro = Q()
+        iguales = {}
+        for orden, campo, valor in zip(self.orden, self.campos, self.valores_cursor):
+            operador = 'lt' if orden.startswith('-') else 'gt'
+            filtro |= Q(**iguales, **{f'{campo}__{operador}': valor})
+            iguales[campo] = valor
+        # Cota redundante sobre el primer campo: sin ella el OR impide un rango en el índice
+        primero = self.orden[0]
+        cota = 'lte' if primero.startswith('-') else 'gte'
+        return Q(**{f'{self.campos[0]}__{cota}': self.valores_cursor[0]}) & filtro
+
+    def consulta(self):
+        queryset = self.queryset
+        if self.valores_cursor is not None:
+            queryset = queryset.filter(self._filtro())
+        return queryset.order_by(*self.orden)[:self.tamano + 1]
+
+    @cached_property
+    def _filas(self):
+        return list(self.consulta())
+
+    async def acargar(self):
+        # Versión async: carga las filas con aiterator() para que la plantilla no toque la base
+        if '_filas' not in self.__dict__:
+            self.__dict__['_filas'] = [fila async for fila in self.consulta().aiterator()]
+        return self
+
+    @property
+    def objetos(self):
+        return self._filas[:self.tamano]
+
+    @property
+    def hay_siguiente(self):
+        return len(self._filas) > self.tamano
+
+    @property
+    def cursor_siguiente(self):
+        if not self.hay_siguiente:
+            return None
+        ultimo = self.objetos[-1]
+        if isinstance(ultimo, dict):
+            # querysets con .values()
+            return codificar_cursor([ultimo[campo] for campo in self.campos])
+        return codificar_cursor([getattr(ultimo, campo) for campo in self.campos])
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+    def __bool__(self):
+        return bool(self.objetos)
+
+
+class PaginaMemoria:
+    """Como PaginaKeyset, pero sobre filas ya ordenadas en memoria (catalogo.py).
+
+    Los cursores son los mismos que los de PaginaKeyset para `orden`.
+    `valores(fila)` da los valores de `orden` de una fila y `clave(valores)` los
+    convierte en una clave creciente en el orden de `filas`, para ubicar el
+    cursor con búsqueda binaria.
+    """
+
+    def __init__(self, filas, modelo, orden, valores, clave, cursor=None, tamano=20):
+        self.orden = tuple(orden)
+        self.valores = valores
+        self.tamano = tamano
+        self.cursor = cursor or None
+        inicio = 0
+        if self.cursor:
+            try:
+                ultimos = decodificar_cursor(self.cursor, modelo, [o.lstrip('-') for o in self.orden])
+                inicio = bisect_right(filas, clave(ultimos), key=lambda fila: clave(valores(fila)))
+            except (CursorInvalido, TypeError):
+                # Cursor manipulado o viejo: primera página
+                self.cursor = None
+        self._filas = list(filas[inicio:inicio + tamano + 1])
+        # Asignable: la vista puede reemplazar las filas por los objetos completos
+        self.objetos = self._filas[:tamano]
+
+    @property
+    def hay_siguiente(self):
+        return len(self._filas) > self.tamano
+
+    @property
+    def cursor_siguiente(self):
+        if not self.hay_siguiente:
+            return None
+        return codificar_cursor(self.valores(self._filas[self.tamano - 1]))
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+    def __bool__(self):
+        return bool(self.objetos)
+
+
+def recorrer(queryset, orden, lote=2000):
+    """Itera todo el queryset en lotes por cursor, con memoria constante.
+
+    A diferencia de QuerySet.iterator(), también es constante en MySQL, donde
+    mysqlclient trae el resultado completo al cliente antes de entregar filas.
+    """
+    cursor = None
+    while True:
+        pagina = PaginaKeyset(queryset, orden, cursor, lote)
+        yield from pagina
+        cursor = pagina.cursor_siguiente
+        if cursor is None:
+            return
+
+
+# --- CONTEO ESTIMADO (ADMIN) ---
+
+def estimar_filas(modelo, using=DEFAULT_DB_ALIAS):
+    """Filas de la tabla según las estadísticas del motor, sin recorrerla; None si no hay."""
+    connection = connections[using]
+    tabla = modelo._meta.db_table
+    if connection.vendor == 'mysql':
+        sql = (
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s"
+        )
+    elif connection.vendor == 'postgresql':
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)"
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [tabla])
+        fila = cursor.fetchone()
+    # PostgreSQL da -1 en tablas que nunca se analizaron
+    return fila[0] if fila and fila[0] is not None and fila[0] >= 0 else None
+
+
+class PaginadorEstimado(Paginator):
+    """Paginator del admin que no hace COUNT(*) sobre tablas grandes.
+
+    Sin filtros usa la estimación del motor si pasa de ADMIN_CONTEO_MAXIMO; con
+    filtros (o sin estimación) cuenta como mucho ADMIN_CONTEO_MAXIMO filas. El
+    ChangeList rechaza las páginas posteriores a num_pages, así que con el
+    conteo acotado las filas que pasan del máximo no se alcanzan paginando (hay
+    que filtrar más); con la estimación pueden faltar o sobrar últimas páginas.
+    """
+
+    @cached_property
+    def count(self):
+        maximo = settings.ADMIN_CONTEO_MAXIMO
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimado = estimar_filas(queryset.model, queryset.db)
+            if estimado is not None and estimado >= maximo:
+                return estimado
+        # COUNT sobre una subconsulta con LIMIT: se detiene al llegar al máximo
+        return queryset.order_by()[:maximo].count()
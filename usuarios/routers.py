@@ -0,0 +1,106 @@
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Cookie con la que un usuario que acaba de escribir lee de la primaria durante la ventana
+COOKIE_PRIMARIA = 'leer_primaria'
+
+# Estado de la petición en curso; None fuera de una petición (comandos, shell, pruebas)
+_peticion = ContextVar('replicas_peticion', default=None)
+
+
+class EstadoPeticion:
+    __slots__ = ('fijada', 'escribio')
+
+    def __init__(self, fijada):
+        self.fijada = fijada      # llegó con la cookie: lee de la primaria
+        self.escribio = False     # escribió en esta petición: lee de la primaria desde ahí
+
+
+def replicas():
+    # Solo las que existen: unas settings de pruebas pueden reemplazar DATABASES entero
+    return [alias for alias in settings.REPLICAS if alias in settings.DATABASES]
+
+
+class RouterReplicas:
+    """Escrituras a la primaria; lecturas de una petición a una réplica al azar.
+
+    Lee de la primaria si la petición ya escribió o llegó fijada por una escritura
+    reciente, si hay una transacción abierta en la primaria (sus cambios aún no
+    están en las réplicas) y fuera de una petición (comandos de gestión).
+    """
+
+    def db_for_read(self, model, **hints):
+        estado = _peticion.get()
+        if estado is None or estado.fijada or estado.escribio:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        disponibles = replicas()
+        return random.choice(disponibles) if disponibles else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        estado = _peticion.get()
+        if estado is not None:
+            estado.escribio = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Todas las bases tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las réplicas reciben el esquema por la replicación
+        return db not in settings.REPLICAS
+
+
+class ReplicasMiddleware:
+    """Marca la petición para el router y fija a la primaria a quien acaba de escribir.
+
+    Va antes de SessionMiddleware para ver también la escritura de la sesión (login).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+
+    def _iniciar(self, request):
+        estado = EstadoPeticion(fijada=COOKIE_PRIMARIA in request.COOKIES)
+        return estado, _peticion.set(estado)
+
+    def _terminar(self, response, estado):
+        if estado.escribio and replicas():
+            # La ventana cubre el retraso de replicación: el valor es solo informativo
+            ventana = settings.REPLICA_VENTANA_SEGUNDOS
+            response.set_cookie(
+                COOKIE_PRIMARIA, str(int(time.time()) + ventana), max_age=ventana,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def __call__(self, request):
+        if self.es_async:
+            return self.__acall__(request)
+        estado, token = self._iniciar(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _peticion.reset(token)
+        return self._terminar(response, estado)
+
+    async def __acall__(self, request):
+        estado, token = self._iniciar(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _peticion.reset(token)
+        return self._terminar(response, estado)
@@ -0,0 +1,88 @@
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache_perfil import invalidar_perfil
+from .estadisticas import descontar_compra, recalcular_usuarios, registrar_compras
+from .facetas import invalidar_catalogo
+from . import deteccion, metricas
+from .models import Compra, PerfilUsuario, Producto
+from .tareas import encolar_efectos_compra
+from .ventas import registrar_ventas
+
+
+# --- PRODUCTOS ---
+
+@receiver(post_save, sender=Producto)
+def producto_guardado(sender, instance, **kwargs):
+    # Foto del catálogo (búsqueda incluida) y facetas se rearman con la nueva versión
+    invalidar_catalogo()
+
+
+@receiver(post_delete, sender=Producto)
+def producto_eliminado(sender, instance, **kwargs):
+    invalidar_catalogo()
+
+
+# --- COMPRAS ---
+
+@receiver(pre_save, sender=Compra)
+def compra_por_guardar(sender, instance, using, **kwargs):
+    # Edición (admin): la fila anterior, por si la compra cambia de usuario, de producto o de día
+    instance._anterior = None
+    if instance.pk is not None:
+        instance._anterior = (
+            Compra.objects.using(using).filter(pk=instance.pk).select_related('producto')
+            .only('usuario', 'fecha', 'cantidad', 'total', 'producto__categoria').first()
+        )
+
+
+@receiver(post_save, sender=Compra)
+def compra_guardada(sender, instance, created, **kwargs):
+    # Alta: incremento atómico y el resto (correo, auditoría) a la cola de tareas;
+    # edición (admin): se recalculan ese usuario y el anterior
+    if created:
+        registrar_compras([instance])
+        registrar_ventas([instance])
+        encolar_efectos_compra(instance.usuario_id, [instance])
+        invalidar_perfil(instance.usuario_id)
+        return
+
+    anterior = getattr(instance, '_anterior', None)
+    usuario_anterior = anterior.usuario_id if anterior else instance.usuario_id
+    usuarios = list(dict.fromkeys([instance.usuario_id, usuario_anterior]))
+    recalcular_usuarios(usuarios)
+    # Resúmenes de ventas: se resta la fila anterior y se suma la nueva
+    if anterior is not None:
+        registrar_ventas([anterior], signo=-1)
+        registrar_ventas([instance])
+    for usuario_id in usuarios:
+        invalidar_perfil(usuario_id)
+
+
+@receiver(post_delete, sender=Compra)
+def compra_eliminada(sender, instance, **kwargs):
+    descontar_compra(instance)
+    registrar_ventas([instance], signo=-1)
+    invalidar_perfil(instance.usuario_id)
+
+
+# --- PERFIL ---
+
+@receiver(post_save, sender=PerfilUsuario)
+def perfil_guardado(sender, instance, **kwargs):
+    # Los fragmentos cacheados de perfil.html usan la versión del usuario en la clave
+    invalidar_perfil(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def usuario_guardado(sender, instance, **kwargs):
+    invalidar_perfil(instance.pk)
+
+
+# --- MÉTRICAS ---
+
+# Mide el SQL de cada conexión nueva (también las de los hilos de sync_to_async)
+connection_created.connect(metricas.instalar_en_conexion, dispatch_uid='usuarios_metricas_sql')
+connection_created.connect(deteccion.instalar_en_conexion, dispatch_uid='usuarios_deteccion_sql')
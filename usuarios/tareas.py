@@ -0,0 +1,183 @@
+"""Cola de tareas en la base para los efectos secundarios de las compras.
+
+`encolar` inserta las tareas en la transacción en curso: se confirman junto con
+la compra o se descartan con ella. El worker (manage.py procesar_tareas) las
+reclama por lotes con un UPDATE condicional, ejecuta cada grupo del mismo nombre
+con una sola llamada y borra las que terminan. Entrega al menos una vez: si un
+worker muere, sus tareas vuelven a estar disponibles al vencer el bloqueo, así
+que las funciones registradas deben tolerar repeticiones.
+
+Con TAREAS_EJECUTOR = 'sincrono' (pruebas) no se usa la tabla: cada tarea se
+ejecuta en el proceso al confirmarse la transacción.
+"""
+import logging
+import math
+import traceback
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Auditoria, Producto, Tarea
+
+logger = logging.getLogger('usuarios.tareas')
+
+# nombre -> función que recibe la lista de `datos` de un lote
+TAREAS = {}
+
+
+def tarea(nombre):
+    def registrar(funcion):
+        TAREAS[nombre] = funcion
+        return funcion
+    return registrar
+
+
+def encolar(*tareas):
+    """Encola pares (nombre, datos) con un solo INSERT."""
+    if settings.TAREAS_EJECUTOR == 'sincrono':
+        for nombre, datos in tareas:
+            transaction.on_commit(lambda nombre=nombre, datos=datos: TAREAS[nombre]([datos]))
+        return
+    Tarea.objects.bulk_create([Tarea(nombre=nombre, datos=datos) for nombre, datos in tareas])
+
+
+def espera_reintento(intentos):
+    # Exponencial: base, 2*base, 4*base... hasta TAREAS_ESPERA_MAXIMA
+    return min(settings.TAREAS_ESPERA_BASE * 2 ** (intentos - 1), settings.TAREAS_ESPERA_MAXIMA)
+
+
+# --- WORKER ---
+
+def reclamar(trabajador, lote):
+    """Bloquea hasta `lote` tareas disponibles para `trabajador` y las devuelve.
+
+    El UPDATE repite la condición de disponibilidad: si dos workers eligen las
+    mismas filas, el segundo no las actualiza (el primero ya movió disponible_en).
+    """
+    ahora = timezone.now()
+    disponibles = Tarea.objects.filter(disponible_en__lte=ahora).exclude(estado=Tarea.FALLIDA)
+    ids = list(disponibles.order_by('disponible_en', 'id').values_list('id', flat=True)[:lote])
+    if not ids:
+        return []
+    disponibles.filter(id__in=ids).update(
+        estado=Tarea.EN_CURSO, trabajador=trabajador, intentos=F('intentos') + 1,
+        disponible_en=ahora + timedelta(seconds=settings.TAREAS_BLOQUEO),
+    )
+    return list(Tarea.objects.filter(id__in=ids, trabajador=trabajador, estado=Tarea.EN_CURSO).order_by('id'))
+
+
+def ejecutar_grupo(trabajador, nombre, tareas):
+    """Ejecuta un lote del mismo nombre; si falla, se reintenta el lote entero."""
+    ids = [t.id for t in tareas]
+    try:
+        funcion = TAREAS.get(nombre)
+        if funcion is None:
+            raise LookupError(f"Tarea no registrada: {nombre}")
+        funcion([t.datos for t in tareas])
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Falló la tarea %s (%d en el lote)', nombre, len(tareas))
+        ahora = timezone.now()
+        for intentos in {t.intentos for t in tareas}:
+            agotada = intentos >= settings.TAREAS_MAX_INTENTOS
+            Tarea.objects.filter(id__in=ids, intentos=intentos, trabajador=trabajador).update(
+                estado=Tarea.FALLIDA if agotada else Tarea.PENDIENTE,
+                disponible_en=ahora + timedelta(seconds=espera_reintento(intentos)),
+                ultimo_error=error,
+            )
+        return 0
+    # Si el bloqueo venció y otro worker la retomó, la borra ese worker
+    Tarea.objects.filter(id__in=ids, trabajador=trabajador).delete()
+    return len(tareas)
+
+
+def _en_hilo(trabajador, nombre, tareas):
+    # Cada hilo del pool tiene su conexión: se recicla como al final de una petición
+    close_old_connections()
+    try:
+        return ejecutar_grupo(trabajador, nombre, tareas)
+    finally:
+        close_old_connections()
+
+
+def procesar_lote(trabajador, lote, pool=None, hilos=1):
+    """Reclama un lote, lo agrupa por nombre y lo ejecuta; devuelve (reclamadas, terminadas).
+
+    Cada grupo se parte en trozos para repartirlo entre los `hilos` del pool;
+    sin pool se ejecuta en este hilo.
+    """
+    tareas = reclamar(trabajador, lote)
+    grupos = defaultdict(list)
+    for t in tareas:
+        grupos[t.nombre].append(t)
+    trozos = []
+    for nombre, grupo in grupos.items():
+        tamano = math.ceil(len(grupo) / hilos)
+        trozos.extend((nombre, grupo[i:i + tamano]) for i in range(0, len(grupo), tamano))
+    if pool is None:
+        terminadas = sum(ejecutar_grupo(trabajador, nombre, trozo) for nombre, trozo in trozos)
+    else:
+        futuros = [pool.submit(_en_hilo, trabajador, nombre, trozo) for nombre, trozo in trozos]
+        terminadas = sum(f.result() for f in futuros)
+    return len(tareas), terminadas
+
+
+def nuevo_trabajador():
+    return uuid.uuid4().hex
+
+
+# --- TAREAS DE COMPRAS ---
+
+def encolar_efectos_compra(usuario_id, compras):
+    """Confirmación por correo y auditoría de una compra (una o varias líneas)."""
+    datos = {
+        'usuario_id': usuario_id,
+        'fecha': max(c.fecha for c in compras).isoformat(),
+        'lineas': [[c.producto_id, c.cantidad, str(c.total)] for c in compras],
+    }
+    encolar(
+        ('confirmar_compra', datos),
+        ('auditar', {**datos, 'accion': 'compra', 'evento': uuid.uuid4().hex}),
+    )
+
+
+@tarea('confirmar_compra')
+def confirmar_compras(lote):
+    # Usuarios y productos de todo el lote en dos consultas; los correos por una conexión
+    usuarios = User.objects.only('username', 'email').in_bulk({d['usuario_id'] for d in lote})
+    productos = Producto.objects.only('nombre').in_bulk(
+        {producto_id for d in lote for producto_id, _, _ in d['lineas']}
+    )
+    mensajes = []
+    for datos in lote:
+        usuario = usuarios.get(datos['usuario_id'])
+        if usuario is None or not usuario.email:
+            continue
+        lineas = []
+        for producto_id, cantidad, total in datos['lineas']:
+            nombre = productos[producto_id].nombre if producto_id in productos else f"Producto {producto_id}"
+            lineas.append(f"- {cantidad} x {nombre}: ${Decimal(total):.2f}")
+        cuerpo = f"Hola {usuario.username}, recibimos tu compra:\n\n" + '\n'.join(lineas)
+        mensajes.append(EmailMessage('Confirmación de compra', cuerpo, None, [usuario.email]))
+    if mensajes:
+        get_connection().send_messages(mensajes)
+
+
+@tarea('auditar')
+def auditar(lote):
+    # `evento` es único: una reentrega del mismo lote no duplica filas
+    Auditoria.objects.bulk_create([
+        Auditoria(
+            evento=datos['evento'], accion=datos['accion'], usuario_id=datos.get('usuario_id'),
+            fecha=datos['fecha'], datos={'lineas': datos.get('lineas', [])},
+        )
+        for datos in lote
+    ], ignore_conflicts=True)
@@ -0,0 +1,78 @@
+import datetime
+
+from django import template
+from django.utils import formats
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+
+from usuarios.ventas import fechas_con_ventas, limites_ventas
+
+register = template.Library()
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def jerarquia_ventas(cl):
+    """date_hierarchy del admin de Compra leído de los resúmenes de ventas.
+
+    El de Django saca los años, meses y días con SELECT DISTINCT sobre Compra;
+    aquí salen de VentaCategoria (o de VentaProducto si se filtra un producto).
+    Mismo contexto que la etiqueta original, así que usa su plantilla.
+    """
+    campo = cl.date_hierarchy
+    anio_campo, mes_campo, dia_campo = f'{campo}__year', f'{campo}__month', f'{campo}__day'
+    anio, mes, dia = (cl.params.get(c) for c in (anio_campo, mes_campo, dia_campo))
+    producto_id = cl.params.get('producto__id__exact')
+
+    def link(filtros):
+        return cl.get_query_string(filtros, [f'{campo}__'])
+
+    if not (anio or mes or dia):
+        # Como en Django: si todo cae en un año (o un mes) se empieza por ahí
+        primero, ultimo = limites_ventas(producto_id)
+        if primero and ultimo and primero.year == ultimo.year:
+            anio = primero.year
+            if primero.month == ultimo.month:
+                mes = primero.month
+
+    if anio and mes and dia:
+        fecha = datetime.date(int(anio), int(mes), int(dia))
+        return {
+            'show': True,
+            'back': {
+                'link': link({anio_campo: anio, mes_campo: mes}),
+                'title': capfirst(formats.date_format(fecha, 'YEAR_MONTH_FORMAT')),
+            },
+            'choices': [{'title': capfirst(formats.date_format(fecha, 'MONTH_DAY_FORMAT'))}],
+        }
+    if anio and mes:
+        return {
+            'show': True,
+            'back': {'link': link({anio_campo: anio}), 'title': str(anio)},
+            'choices': [
+                {
+                    'link': link({anio_campo: anio, mes_campo: mes, dia_campo: d.day}),
+                    'title': capfirst(formats.date_format(d, 'MONTH_DAY_FORMAT')),
+                }
+                for d in fechas_con_ventas(int(anio), int(mes), producto_id)
+            ],
+        }
+    if anio:
+        return {
+            'show': True,
+            'back': {'link': link({}), 'title': _('All dates')},
+            'choices': [
+                {
+                    'link': link({anio_campo: anio, mes_campo: m.month}),
+                    'title': capfirst(formats.date_format(m, 'YEAR_MONTH_FORMAT')),
+                }
+                for m in fechas_con_ventas(int(anio), producto_id=producto_id)
+            ],
+        }
+    return {
+        'show': True,
+        'back': None,
+        'choices': [
+            {'link': link({anio_campo: str(a.year)}), 'title': str(a.year)}
+            for a in fechas_con_ventas(producto_id=producto_id)
+        ],
+    }
@@ -1,10 +1,59 @@
-from django.test import TestCase
-from django.urls import reverse
+import os
+from contextlib import contextmanager
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.template import engines
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils.http import http_date
 from django.contrib.auth.models import User
 from .models import PerfilUsuario, Producto, Compra
+from .urls import construir_urlpatterns
+
+
+# ROOT_URLCONF de las pruebas que lo piden (override_settings(ROOT_URLCONF=URLS_PRUEBAS)):
+# las vistas async activadas y una vista con N+1 a propósito. Solo existe en las pruebas.
+URLS_PRUEBAS = 'usuarios.tests'
+
+
+def vista_n1(request):
+    # N+1 a propósito: la plantilla pide el producto de cada compra
+    plantilla = engines['django'].from_string("{% for c in compras %}{{ c.producto.nombre }}{% endfor %}")
+    return HttpResponse(plantilla.render({'compras': Compra.objects.all()}))
+
+
+urlpatterns = [
+    path('usuarios/', include((construir_urlpatterns(asincronas=True), 'usuarios'))),
+    path('n1/', vista_n1),
+]
+
+
+class PresupuestoConsultasMixin:
+    # Como assertNumQueries, pero falla solo si se pasa del máximo declarado
+    @contextmanager
+    def assertPresupuestoConsultas(self, maximo, etiqueta=''):
+        with CaptureQueriesContext(connection) as capturadas:
+            yield capturadas
+        if len(capturadas) > maximo:
+            detalle = '\n'.join(f"{n}. {q['sql']}" for n, q in enumerate(capturadas.captured_queries, 1))
+            self.fail(f"{etiqueta}: {len(capturadas)} consultas, presupuesto {maximo}\n{detalle}")
+
 
+# Cualquier N+1 en una petición de las pruebas hace fallar el test (ver usuarios/deteccion.py).
+# Las tareas se ejecutan en el proceso al confirmar la transacción (ver usuarios/tareas.py).
+# La foto del catálogo se arma en la petición: un hilo no vería los datos del test (catalogo.py).
+@override_settings(
+    DETECTOR_CONSULTAS=True, DETECTOR_ESTRICTO=True, TAREAS_EJECUTOR='sincrono', CATALOGO_REARMADO='sincrono',
+)
 class BaseTestCase(TestCase):
     def setUp(self):
+        # Los fragmentos y versiones cacheados no se deshacen con el rollback de cada test
+        cache.clear()
         self.user = User.objects.create_user(
             username='TestUser', 
             email='test@correo.com', 
@@ -138,4 +187,1580 @@ class ComprarTestCase(BaseTestCase):
     def test_busqueda_productos(self):
         response = self.client.get(self.url, {'search': 'Coca'})
         self.assertEqual(response.status_code, 200)
-        self.assertContains(response, "Coca Cola")
\ No newline at end of file
+        self.assertContains(response, "Coca Cola")
+
+# PRUEBA 6: Búsqueda con índice invertido
+class BusquedaTestCase(TestCase):
+    def setUp(self):
+        from .busqueda import IndiceCompacto
+        self.camion = Producto.objects.create(nombre="Camión de juguete", costo=10, categoria="Juguetes")
+        self.cafe = Producto.objects.create(nombre="Café molido", costo=5, categoria="Bebidas")
+        self.taza = Producto.objects.create(nombre="Taza", costo=3, categoria="Café y té")
+        self.indice = IndiceCompacto(Producto.objects.values_list('id', 'nombre', 'categoria'))
+
+    def buscar(self, termino):
+        qs = self.indice.buscar(Producto.objects.all(), termino).order_by('-relevancia', 'id')
+        return list(qs)
+
+    def test_sin_acentos(self):
+        self.assertEqual(self.buscar("camion"), [self.camion])
+
+    def test_prefijo_y_relevancia(self):
+        # El nombre pesa más que la categoría
+        self.assertEqual(self.buscar("caf"), [self.cafe, self.taza])
+
+    def test_puntuaciones(self):
+        # Nombre 2, categoría 1; el último token es prefijo y exacto vale el doble
+        self.assertEqual(self.indice.puntuar("cafe"), {self.cafe.pk: 4, self.taza.pk: 2})
+        self.assertEqual(self.indice.puntuar("camion jug"), {self.camion.pk: 4})
+        self.assertEqual(self.indice.puntuar("te"), {self.taza.pk: 2})
+        self.assertEqual(self.indice.puntuar("nada"), {})
+        self.assertEqual(self.indice.puntuar("¿?"), {})
+
+
+# PRUEBA 7: Facetas de categorías cacheadas
+@override_settings(CATALOGO_REARMADO='sincrono')
+class FacetasTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.cafe = Producto.objects.create(nombre="Café", costo=5, categoria="Bebidas")
+        Producto.objects.create(nombre="Jugo", costo=4, categoria="Bebidas")
+        Producto.objects.create(nombre="Mesa de café", costo=50, categoria="Hogar")
+        Producto.objects.create(nombre="Silla", costo=30, categoria="Hogar", activo=False)
+
+    def test_conteos_activos(self):
+        from .facetas import conteos_categorias
+        self.assertEqual(conteos_categorias(), [("Bebidas", 2), ("Hogar", 1)])
+
+    def test_conteos_de_la_busqueda(self):
+        from .facetas import conteos_categorias
+        self.assertEqual(conteos_categorias("cafe"), [("Bebidas", 1), ("Hogar", 1)])
+
+    def test_segunda_lectura_sin_consultas(self):
+        from .facetas import conteos_categorias
+        conteos_categorias()
+        with self.assertNumQueries(0):
+            conteos_categorias()
+
+    def test_desactivar_invalida(self):
+        from .facetas import conteos_categorias
+        conteos_categorias()
+        # La versión sube al confirmar la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cafe.activo = False
+            self.cafe.save()
+        self.assertEqual(conteos_categorias(), [("Bebidas", 1), ("Hogar", 1)])
+
+
+# PRUEBA 8: Paginación por cursor
+@override_settings(CATALOGO_REARMADO='sincrono')
+class PaginacionTestCase(TestCase):
+    def setUp(self):
+        # La versión del catálogo (y su foto) no se deshace con el rollback
+        cache.clear()
+        for i in range(5):
+            Producto.objects.create(nombre=f"Producto {i}", costo=1, categoria="Varios")
+
+    def recorrer(self, tamano=2):
+        from .paginacion import PaginaKeyset
+        vistos, cursor = [], None
+        while True:
+            pagina = PaginaKeyset(Producto.objects.all(), ('-creado_en', '-id'), cursor, tamano)
+            vistos.extend(p.nombre for p in pagina)
+            cursor = pagina.cursor_siguiente
+            if not cursor:
+                return vistos
+
+    def test_recorre_todo_sin_repetir(self):
+        self.assertEqual(self.recorrer(), [f"Producto {i}" for i in reversed(range(5))])
+
+    def test_insercion_concurrente_no_duplica(self):
+        from .paginacion import PaginaKeyset
+        primera = PaginaKeyset(Producto.objects.all(), ('-creado_en', '-id'), None, 2)
+        cursor = primera.cursor_siguiente
+        Producto.objects.create(nombre="Nuevo", costo=1, categoria="Varios")
+        segunda = PaginaKeyset(Producto.objects.all(), ('-creado_en', '-id'), cursor, 2)
+        self.assertEqual([p.nombre for p in segunda], ["Producto 2", "Producto 1"])
+
+    def test_cursor_invalido_vuelve_al_inicio(self):
+        from .paginacion import PaginaKeyset
+        pagina = PaginaKeyset(Producto.objects.all(), ('-creado_en', '-id'), "basura!", 2)
+        self.assertEqual([p.nombre for p in pagina], ["Producto 4", "Producto 3"])
+
+    # base64 de [123, 1] y de [[], {}]: tipos JSON que no son los del orden
+    CURSORES_MAL_TIPADOS = ('WzEyMywxXQ', 'W1tdLHt9XQ')
+
+    def test_cursor_mal_tipado_vuelve_al_inicio(self):
+        from .paginacion import PaginaKeyset
+        for cursor in self.CURSORES_MAL_TIPADOS:
+            pagina = PaginaKeyset(Producto.objects.all(), ('-creado_en', '-id'), cursor, 2)
+            self.assertEqual([p.nombre for p in pagina], ["Producto 4", "Producto 3"], cursor)
+
+    def test_vistas_con_cursor_mal_tipado(self):
+        user = User.objects.create_user('lector', 'l@l.com', '123')
+        self.client.force_login(user)
+        for nombre in ('perfil', 'productos', 'comprar'):
+            for cursor in self.CURSORES_MAL_TIPADOS:
+                response = self.client.get(reverse(f'usuarios:{nombre}'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 200, (nombre, cursor))
+
+    @override_settings(ROOT_URLCONF=URLS_PRUEBAS)
+    async def test_vistas_async_con_cursor_mal_tipado(self):
+        user = await User.objects.acreate_user('lector', 'l@l.com', '123')
+        await self.async_client.aforce_login(user)
+        for nombre in ('perfil', 'productos', 'comprar'):
+            for cursor in self.CURSORES_MAL_TIPADOS:
+                response = await self.async_client.get(reverse(f'usuarios:{nombre}'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 200, (nombre, cursor))
+
+    def test_vista_productos_paginada(self):
+        user = User.objects.create_user('lector', 'l@l.com', '123')
+        self.client.force_login(user)
+        with self.settings(PAGINA_TAMANO=3):
+            response = self.client.get(reverse('usuarios:productos'))
+            self.assertEqual(len(response.context['productos']), 3)
+            siguiente = response.context['productos'].cursor_siguiente
+            response = self.client.get(reverse('usuarios:productos'), {'cursor': siguiente})
+        self.assertEqual([p.nombre for p in response.context['productos']], ["Producto 1", "Producto 0"])
+
+
+# PRUEBA 9: Presupuesto de consultas por vista (independiente del número de filas)
+# Con la cola de producción: el INSERT de las tareas cuenta
+@override_settings(TAREAS_EJECUTOR='cola')
+class PresupuestoConsultasTestCase(PresupuestoConsultasMixin, BaseTestCase):
+    # (nombre de la URL, método, datos, máximo de consultas); la sesión y el User cuentan 2,
+    # y dentro del test cada atomic() anidado suma SAVEPOINT/RELEASE
+    PRESUPUESTOS = [
+        ('login', 'get', None, 0),
+        ('registro', 'get', None, 0),
+        ('perfil', 'get', None, 4),
+        ('editar_perfil', 'get', None, 2),
+        ('editar_perfil', 'post', {'email': 'otro@correo.com', 'direccion': 'Otra'}, 4),
+        # +1 por el MAX(actualizado_en) del ETag (ver condicional.py)
+        ('productos', 'get', None, 4),
+        ('crear_producto', 'get', None, 2),
+        ('importar_productos', 'get', None, 2),
+        ('comprar', 'get', None, 5),
+        # +1 por el UPDATE condicional de stock, +1 por el INSERT de las tareas y
+        # +2 por los UPDATE de los resúmenes de ventas (por producto y por categoría)
+        ('comprar', 'post', 'compra', 13),
+        ('carrito', 'post', 'carrito', 13),
+        ('exportar_compras', 'get', None, 3),
+        ('exportar_productos', 'get', None, 3),
+        ('metricas', 'get', None, 2),
+        # Meses completos y días de los bordes: dos consultas a los resúmenes
+        ('ventas', 'get', None, 4),
+        ('ventas_api', 'get', None, 4),
+        ('logout', 'post', None, 4),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+        self.user.save()
+        self.productos = [
+            Producto.objects.create(nombre=f"Producto {i}", costo=10, categoria=f"Cat {i % 3}")
+            for i in range(10)
+        ]
+        for producto in self.productos:
+            Compra.objects.create(usuario=self.user, producto=producto, cantidad=2, precio_unitario=producto.costo)
+
+    def test_presupuestos(self):
+        from django.core.cache import cache
+        for nombre, metodo, datos, maximo in self.PRESUPUESTOS:
+            with self.subTest(vista=nombre, metodo=metodo):
+                cache.clear()
+                self.client.force_login(self.user)
+                if datos == 'compra':
+                    datos = {'producto_id': self.productos[0].id, 'cantidad': 1}
+                elif datos == 'carrito':
+                    datos = {'producto_id': [p.id for p in self.productos], 'cantidad': ['1'] * len(self.productos)}
+                url = reverse(f'usuarios:{nombre}')
+                if nombre in ('login', 'registro'):
+                    self.client.logout()
+                with self.assertPresupuestoConsultas(maximo, f'{metodo.upper()} {url}'):
+                    response = getattr(self.client, metodo)(url, datos)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.assertLess(response.status_code, 400)
+
+    def test_redireccion_raiz_sin_consultas(self):
+        with self.assertNumQueries(0):
+            self.client.get('/usuarios/')
+
+    def test_admin_compras_sin_n_mas_1(self):
+        self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        url = reverse('admin:usuarios_compra_changelist')
+        with self.assertPresupuestoConsultas(8, 'admin compras'):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+
+# PRUEBA 10: Plan de índices (EXPLAIN de las consultas reales de views.py y admin.py)
+class PlanIndicesTestCase(BaseTestCase):
+    PLAN = {
+        'usuarios_compra': {'compra_usuario_fecha_idx', 'compra_fecha_idx', 'compra_producto_fecha_idx'},
+        'usuarios_producto': {
+            'producto_activo_cat_idx', 'producto_activo_creado_idx',
+            'producto_creado_idx', 'producto_categoria_idx',
+            'producto_actualizado_idx', 'producto_nombre_idx',
+        },
+        'usuarios_ventaproducto': {'venta_producto_rango_idx'},
+        'usuarios_ventacategoria': {'venta_categoria_rango_idx'},
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.producto = Producto.objects.create(nombre="Café", costo=5, categoria="Bebidas")
+        Compra.objects.create(usuario=self.user, producto=self.producto, cantidad=1, precio_unitario=5)
+
+    def recorridos_completos(self, sql):
+        # Devuelve las líneas del plan que recorren una tabla usuarios_* completa
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute('EXPLAIN FORMAT=TRADITIONAL ' + sql)
+                columnas = [c[0] for c in cursor.description]
+                filas = [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+                return [f for f in filas if f['type'] == 'ALL' and str(f['table']).startswith('usuarios_')]
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [
+                fila[-1] for fila in cursor.fetchall()
+                if fila[-1].startswith('SCAN usuarios_') and 'INDEX' not in fila[-1]
+            ]
+
+    def test_indices_existen_en_el_esquema(self):
+        with connection.cursor() as cursor:
+            for tabla, esperados in self.PLAN.items():
+                existentes = set(connection.introspection.get_constraints(cursor, tabla))
+                self.assertLessEqual(esperados, existentes, tabla)
+
+    def test_consultas_calientes_usan_indices(self):
+        urls = [
+            reverse('usuarios:perfil'),
+            reverse('usuarios:productos'),
+            reverse('usuarios:comprar'),
+            reverse('usuarios:comprar') + '?categoria=Bebidas',
+            reverse('usuarios:comprar') + '?search=cafe',
+            reverse('admin:usuarios_compra_changelist'),
+            reverse('admin:usuarios_compra_changelist') + f'?producto__id__exact={self.producto.id}',
+            reverse('admin:usuarios_compra_changelist') + '?fecha__year=2026',
+            reverse('admin:usuarios_compra_changelist') + f'?fecha__year=2026&producto__id__exact={self.producto.id}',
+            reverse('admin:usuarios_producto_changelist'),
+            reverse('admin:usuarios_producto_changelist') + '?categoria=Bebidas',
+        ]
+        from django.core.cache import cache
+        for url in urls:
+            cache.clear()
+            with CaptureQueriesContext(connection) as capturadas:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            for consulta in capturadas.captured_queries:
+                sql = consulta['sql']
+                if not sql.startswith('SELECT') or 'usuarios_' not in sql:
+                    continue
+                with self.subTest(url=url, sql=sql[:120]):
+                    self.assertEqual(self.recorridos_completos(sql), [])
+
+
+# PRUEBA 11: Carrito (varias compras en una transacción)
+class CarritoTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('usuarios:carrito')
+        self.client.force_login(self.user)
+        self.cola = Producto.objects.create(nombre="Coca Cola", costo=20, categoria="Bebidas")
+        self.pan = Producto.objects.create(nombre="Pan", costo=5, categoria="Panadería")
+
+    def test_formulario(self):
+        data = {'producto_id': [self.cola.id, self.pan.id, self.cola.id], 'cantidad': ['2', '3', '1']}
+        response = self.client.post(self.url, data)
+        self.assertRedirects(response, reverse('usuarios:perfil'))
+        compras = {c.producto_id: c for c in Compra.objects.filter(usuario=self.user)}
+        self.assertEqual(compras[self.cola.id].cantidad, 3)
+        self.assertEqual(compras[self.cola.id].total, 60)
+        self.assertEqual(compras[self.pan.id].total, 15)
+
+    def test_json(self):
+        cuerpo = {'lineas': [{'producto_id': self.cola.id, 'cantidad': 2}, {'producto_id': self.pan.id}]}
+        response = self.client.post(self.url, cuerpo, content_type='application/json')
+        self.assertEqual(response.json(), {'compras': 2, 'unidades': 3, 'total': '45.00'})
+
+    def test_producto_invalido_no_crea_nada(self):
+        self.pan.activo = False
+        self.pan.save()
+        cuerpo = {'lineas': [{'producto_id': self.cola.id, 'cantidad': 1}, {'producto_id': self.pan.id, 'cantidad': 1}]}
+        response = self.client.post(self.url, cuerpo, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Compra.objects.exists())
+
+
+# PRUEBA 12: Estadísticas de compras por usuario
+class EstadisticasTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.cola = Producto.objects.create(nombre="Coca Cola", costo=20, categoria="Bebidas")
+        self.pan = Producto.objects.create(nombre="Pan", costo=5, categoria="Panadería")
+
+    def estadisticas(self):
+        from .models import EstadisticasCompras
+        return EstadisticasCompras.objects.get(usuario=self.user)
+
+    def test_compra_y_carrito_actualizan(self):
+        self.client.post(reverse('usuarios:comprar'), {'producto_id': self.cola.id, 'cantidad': 2})
+        self.client.post(reverse('usuarios:carrito'), {'producto_id': [self.pan.id], 'cantidad': ['3']})
+        est = self.estadisticas()
+        self.assertEqual((est.num_compras, est.unidades, est.total_gastado), (2, 5, 55))
+        self.assertEqual(est.ultima_compra, Compra.objects.filter(usuario=self.user).latest('fecha').fecha)
+
+    def test_eliminar_descuenta(self):
+        primera = Compra.objects.create(usuario=self.user, producto=self.cola, cantidad=1, precio_unitario=20)
+        segunda = Compra.objects.create(usuario=self.user, producto=self.pan, cantidad=1, precio_unitario=5)
+        segunda.delete()
+        est = self.estadisticas()
+        self.assertEqual((est.num_compras, est.total_gastado, est.ultima_compra), (1, 20, primera.fecha))
+
+    def test_editar_cambia_de_usuario(self):
+        otro = User.objects.create_user(username='Otro', password='password123')
+        compra = Compra.objects.create(usuario=self.user, producto=self.cola, cantidad=2, precio_unitario=20)
+        compra.usuario = otro
+        compra.save()
+        from .models import EstadisticasCompras
+        est_otro = EstadisticasCompras.objects.get(usuario=otro)
+        self.assertEqual((self.estadisticas().num_compras, self.estadisticas().total_gastado), (0, 0))
+        self.assertEqual((est_otro.num_compras, est_otro.total_gastado), (1, 40))
+
+    def test_reconstruir_coincide(self):
+        from django.core.management import call_command
+        from .models import EstadisticasCompras
+        Compra.objects.create(usuario=self.user, producto=self.cola, cantidad=4, precio_unitario=20)
+        esperado = self.estadisticas()
+        EstadisticasCompras.objects.all().delete()
+        call_command('reconstruir_estadisticas', lote=1, stdout=open(os.devnull, 'w'))
+        est = self.estadisticas()
+        self.assertEqual(
+            (est.num_compras, est.unidades, est.total_gastado, est.ultima_compra),
+            (esperado.num_compras, esperado.unidades, esperado.total_gastado, esperado.ultima_compra),
+        )
+
+    def test_perfil_muestra_resumen(self):
+        Compra.objects.create(usuario=self.user, producto=self.cola, cantidad=1, precio_unitario=20)
+        response = self.client.get(reverse('usuarios:perfil'))
+        self.assertEqual(response.context['estadisticas'].total_gastado, 20)
+        self.assertContains(response, "1 (1 unidades)")
+
+
+# PRUEBA 13: Fragmentos cacheados del perfil
+class PerfilCacheTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('usuarios:perfil')
+        self.client.force_login(self.user)
+        self.producto = Producto.objects.create(nombre="Coca Cola", costo=20, categoria="Bebidas")
+
+    def test_acierto_sin_consultas_a_usuarios(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as capturadas:
+            response = self.client.get(self.url)
+        self.assertContains(response, "Calle Prueba")
+        # Solo quedan la sesión y el User de la autenticación (con el perfil en su JOIN)
+        usuario = f"FROM {connection.ops.quote_name('auth_user')}"
+        self.assertEqual([q['sql'] for q in capturadas if 'usuarios_' in q['sql'] and usuario not in q['sql']], [])
+
+    def test_edicion_se_ve_inmediatamente(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('usuarios:editar_perfil'), {'email': 'x@correo.com', 'direccion': 'Calle Nueva'})
+        self.assertContains(self.client.get(self.url), "Calle Nueva")
+
+    def test_compra_se_ve_inmediatamente(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('usuarios:comprar'), {'producto_id': self.producto.id, 'cantidad': 1})
+        self.assertContains(self.client.get(self.url), "Coca Cola")
+
+    def test_carrito_se_ve_inmediatamente(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('usuarios:carrito'), {'producto_id': [self.producto.id], 'cantidad': ['2']})
+        self.assertContains(self.client.get(self.url), "Coca Cola")
+
+
+# PRUEBA 14: Vistas async (mismo HTML que las síncronas)
+@override_settings(ROOT_URLCONF=URLS_PRUEBAS)
+class VistasAsyncTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.producto = Producto.objects.create(nombre="Coca Cola", costo=20, categoria="Bebidas")
+        Compra.objects.create(usuario=self.user, producto=self.producto, cantidad=2, precio_unitario=20)
+        self.async_client.force_login(self.user)
+
+    async def test_productos(self):
+        response = await self.async_client.get(reverse('usuarios:productos'))
+        self.assertContains(response, "Coca Cola")
+
+    async def test_comprar_get_con_busqueda(self):
+        response = await self.async_client.get(reverse('usuarios:comprar'), {'search': 'coca'})
+        self.assertContains(response, "Coca Cola")
+        self.assertContains(response, "Bebidas (1)")
+
+    async def test_comprar_post_delegado(self):
+        response = await self.async_client.post(
+            reverse('usuarios:comprar'), {'producto_id': self.producto.id, 'cantidad': 1},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(await Compra.objects.filter(usuario=self.user).acount(), 2)
+
+    async def test_perfil_y_acierto_de_cache(self):
+        response = await self.async_client.get(reverse('usuarios:perfil'))
+        self.assertContains(response, "Calle Prueba")
+        self.assertContains(response, "Coca Cola")
+        response = await self.async_client.get(reverse('usuarios:perfil'))
+        self.assertContains(response, "Calle Prueba")
+
+    async def test_sin_login_redirige(self):
+        await self.async_client.alogout()
+        response = await self.async_client.get(reverse('usuarios:perfil'))
+        self.assertEqual(response.status_code, 302)
+
+
+# PRUEBA 15: Exportación en streaming
+class ExportacionTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cola = Producto.objects.create(nombre="Coca Cola", costo=20, categoria="Bebidas")
+        self.pan = Producto.objects.create(nombre="Pan", costo=5, categoria="Panadería")
+        Compra.objects.create(usuario=self.user, producto=self.cola, cantidad=2, precio_unitario=20)
+        Compra.objects.create(usuario=self.user, producto=self.pan, cantidad=1, precio_unitario=5)
+
+    def test_solo_staff(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('usuarios:exportar_compras')).status_code, 403)
+
+    def test_csv_con_filtro_de_categoria(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('usuarios:exportar_compras'), {'categoria': 'Bebidas', 'desde': '2000-01-01'})
+        lineas = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lineas), 2)
+        self.assertTrue(lineas[0].startswith('id,fecha,usuario_id'))
+        self.assertIn('Coca Cola', lineas[1])
+
+    def test_fecha_invalida_es_400(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        for params in ({'desde': 'abc'}, {'hasta': '2024-13-01'}):
+            self.assertEqual(self.client.get(reverse('usuarios:exportar_compras'), params).status_code, 400)
+
+    def test_jsonl_productos(self):
+        import json
+        from .exportacion import exportar
+        filas = [json.loads(linea) for linea in exportar('productos', 'jsonl', lote=1)]
+        self.assertEqual([f['nombre'] for f in filas], ["Coca Cola", "Pan"])
+
+    def test_memoria_constante(self):
+        # El pico de memoria no crece con el número de filas (lotes de tamaño fijo)
+        import tracemalloc
+        from .bench import sembrar_compras
+        from .exportacion import exportar
+
+        def pico(filas):
+            sembrar_compras(self.user, filas)
+            tracemalloc.start()
+            for _ in exportar('compras', lote=200):
+                pass
+            _, maximo = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return maximo
+
+        pequeno, grande = pico(500), pico(5000)
+        self.assertLess(grande, pequeno * 1.5)
+        self.assertLess(grande, 4 * 2**20)
+
+
+# PRUEBA 16: Importación masiva de productos
+class ImportacionTestCase(BaseTestCase):
+    CSV = (
+        "id,nombre,descripcion,categoria,costo,activo\n"
+        "{id},Coca Cola Light,,Bebidas,22.50,True\n"
+        ",Pan integral,,Panadería,7,True\n"
+        ",,,Panadería,abc,True\n"
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.cola = Producto.objects.create(nombre="Coca Cola", costo=20, categoria="Bebidas")
+
+    def test_csv_upsert_y_errores(self):
+        import io
+        from .importacion import importar, leer_filas
+        archivo = io.BytesIO(self.CSV.format(id=self.cola.id).encode())
+        resultado = importar(leer_filas(archivo, 'csv'), lote=1)
+        self.assertEqual((resultado.creados, resultado.actualizados), (1, 1))
+        self.assertEqual(resultado.errores[0][0], 3)
+        self.assertEqual(set(resultado.errores[0][1]), {'nombre', 'costo'})
+        self.cola.refresh_from_db()
+        self.assertEqual(self.cola.nombre, "Coca Cola Light")
+
+    def test_obligatorios_ausentes_son_errores_de_fila(self):
+        import io
+        from .importacion import importar, leer_filas
+        sin_costo = io.BytesIO("nombre,categoria\nLeche,Lacteos\n".encode())
+        resultado = importar(leer_filas(sin_costo, 'csv'))
+        self.assertEqual((resultado.creados, resultado.errores), (0, [(1, {'costo': ["Este campo es obligatorio."]})]))
+        # Un id nuevo crea el producto: también necesita los obligatorios
+        id_nuevo = io.BytesIO(f'{{"id": {self.cola.id + 100}, "nombre": "Agua"}}\n'.encode())
+        resultado = importar(leer_filas(id_nuevo, 'jsonl'))
+        self.assertEqual([numero for numero, _ in resultado.errores], [1])
+        self.assertEqual(set(resultado.errores[0][1]), {'categoria', 'costo'})
+        self.assertFalse(Producto.objects.filter(nombre="Agua").exists())
+
+    def test_actualiza_solo_las_columnas_de_cada_fila(self):
+        import io
+        from .importacion import importar, leer_filas
+        pan = Producto.objects.create(nombre="Pan", costo=5, categoria="Panadería", activo=False, stock=3)
+        lineas = (
+            f'{{"id": {self.cola.id}, "nombre": "Coca Cola", "categoria": "Bebidas", "costo": "21", "activo": true}}\n'
+            f'{{"id": {pan.id}, "costo": "6"}}\n'
+        )
+        resultado = importar(leer_filas(io.BytesIO(lineas.encode()), 'jsonl'))
+        self.assertEqual((resultado.actualizados, resultado.errores), (2, []))
+        pan.refresh_from_db()
+        self.assertEqual((pan.nombre, pan.costo, pan.activo, pan.stock), ("Pan", 6, False, 3))
+
+    def test_json_por_bloques(self):
+        import io
+        import json
+        from .importacion import _filas_json
+        filas = [{'nombre': f"Producto {i}", 'categoria': "Varios", 'costo': i} for i in range(50)]
+        texto = io.StringIO(json.dumps(filas))
+        self.assertEqual(list(_filas_json(texto, tam_bloque=7)), filas)
+
+    def test_invalida_cache_una_vez(self):
+        import io
+        from unittest import mock
+        from .importacion import importar, leer_filas
+        filas = "nombre,categoria,costo\n" + "".join(f"P{i},Varios,1\n" for i in range(30))
+        with mock.patch('usuarios.importacion.invalidar_catalogo') as invalidar:
+            importar(leer_filas(io.BytesIO(filas.encode()), 'csv'), lote=10)
+        invalidar.assert_called_once()
+        self.assertEqual(Producto.objects.filter(categoria="Varios").count(), 30)
+
+    def test_vista_solo_staff(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        url = reverse('usuarios:importar_productos')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        archivo = SimpleUploadedFile("productos.jsonl", b'{"nombre": "Leche", "categoria": "Lacteos", "costo": "18"}\n')
+        response = self.client.post(url, {'archivo': archivo})
+        self.assertEqual(response.context['resultado'].creados, 1)
+        self.assertTrue(Producto.objects.filter(nombre="Leche").exists())
+
+
+# PRUEBA 17: Métricas por vista
+@override_settings(METRICAS_MUESTREO=1)
+class MetricasTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        from .metricas import registro
+        self.registro = registro
+        self.registro.limpiar()
+        Producto.objects.create(nombre="Coca Cola", costo=20, categoria="Bebidas")
+
+    def test_mide_sql_render_y_tamano_por_vista(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('usuarios:comprar'))
+        resumen = self.registro.resumen()['usuarios:comprar']
+        self.assertEqual(resumen['duracion_segundos']['n'], 1)
+        self.assertGreater(resumen['sql_consultas']['media'], 0)
+        self.assertGreater(resumen['render_segundos']['media'], 0)
+        self.assertEqual(resumen['respuesta_bytes']['media'], len(response.content))
+
+    def test_sin_muestreo_no_registra(self):
+        self.client.force_login(self.user)
+        with self.settings(METRICAS_MUESTREO=0):
+            self.client.get(reverse('usuarios:productos'))
+        self.assertEqual(self.registro.resumen(), {})
+
+    def test_endpoints_solo_staff(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('usuarios:metricas')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('usuarios:metricas_prometheus')).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get(reverse('usuarios:productos'))
+        datos = self.client.get(reverse('usuarios:metricas')).json()
+        self.assertIn('usuarios:productos', datos['vistas'])
+        texto = self.client.get(reverse('usuarios:metricas_prometheus')).content.decode()
+        self.assertIn('tienda_duracion_segundos_bucket{vista="usuarios:productos",le="+Inf"}', texto)
+
+    @override_settings(METRICAS_TOKEN='secreto')
+    def test_prometheus_con_token(self):
+        response = self.client.get(reverse('usuarios:metricas_prometheus'), HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        for cabecera in ('Bearer otro', 'Bearer secretó', ''):
+            response = self.client.get(reverse('usuarios:metricas_prometheus'), HTTP_AUTHORIZATION=cabecera)
+            self.assertEqual(response.status_code, 403, cabecera)
+
+
+# PRUEBA 18: Detector de N+1 y consultas lentas (vista_n1 al inicio del módulo)
+@override_settings(ROOT_URLCONF=URLS_PRUEBAS)
+class DetectorConsultasTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(4):
+            producto = Producto.objects.create(nombre=f"Producto {i}", costo=10, categoria="Varios")
+            Compra.objects.create(usuario=self.user, producto=producto, cantidad=1, precio_unitario=10)
+
+    def test_huella_normaliza_literales_y_listas(self):
+        from .deteccion import huella
+        self.assertEqual(
+            huella('SELECT * FROM t WHERE id IN (%s, %s, %s) AND x = 5'),
+            huella('SELECT * FROM t WHERE id IN (%s, %s) AND x = 7'),
+        )
+
+    def test_estricto_falla_con_n1(self):
+        from .deteccion import ConsultasRepetidas
+        with self.assertLogs('usuarios.consultas', 'WARNING'):
+            with self.assertRaisesMessage(ConsultasRepetidas, 'N+1 en GET /n1/'):
+                self.client.get('/n1/')
+
+    @override_settings(DETECTOR_ESTRICTO=False)
+    def test_reporte_jsonl_con_pila_y_plantilla(self):
+        import json
+        with self.assertLogs('usuarios.consultas', 'WARNING') as logs:
+            self.client.get('/n1/')
+        reporte = json.loads(logs.records[0].getMessage())
+        repetida = reporte['repetidas'][0]
+        self.assertEqual(repetida['veces'], 4)
+        self.assertIn('usuarios_producto', repetida['sql'])
+        self.assertIsNotNone(repetida['plantilla'])
+        self.assertTrue(any(frame.startswith('usuarios/tests.py') for frame in repetida['pila']))
+
+    @override_settings(DETECTOR_ESTRICTO=False, DETECTOR_LENTA_MS=0)
+    def test_consultas_lentas(self):
+        import json
+        self.client.force_login(self.user)
+        with self.assertLogs('usuarios.consultas', 'WARNING') as logs:
+            self.client.get(reverse('usuarios:productos'))
+        self.assertTrue(json.loads(logs.records[0].getMessage())['lentas'])
+
+    def test_vista_sin_n1_no_reporta(self):
+        self.client.force_login(self.user)
+        with self.assertNoLogs('usuarios.consultas', 'WARNING'):
+            self.client.get('/usuarios/perfil/')
+
+
+# PRUEBA 19: Benchmark de rutas (bench_urls)
+class BenchUrlsTestCase(TestCase):
+    def test_todas_las_rutas_tienen_escenario(self):
+        from .management.commands.bench_urls import _rutas_sin_escenario
+        self.assertEqual(_rutas_sin_escenario(), set())
+
+    def test_sembrar_usuarios_y_compras_repartidas(self):
+        from .bench import sembrar_compras, sembrar_productos, sembrar_usuarios
+        from .models import EstadisticasCompras
+        sembrar_productos(20)
+        usuarios = sembrar_usuarios(5)
+        self.assertEqual(PerfilUsuario.objects.filter(user__in=usuarios).count(), 5)
+        self.assertTrue(usuarios[0].check_password('bench'))
+        sembrar_compras(usuarios, 40)
+        self.assertEqual(sum(e.num_compras for e in EstadisticasCompras.objects.all()), 40)
+
+    def test_regresiones_contra_base(self):
+        from .management.commands.bench_urls import Command
+        base = {'cliente': {'GET perfil': {'p95_ms': 10.0, 'consultas_por_peticion': 3, 'errores': 0}}}
+        igual = {'cliente': {'GET perfil': {'p95_ms': 11.0, 'consultas_por_peticion': 3, 'errores': 0}}}
+        peor = {'cliente': {'GET perfil': {'p95_ms': 30.0, 'consultas_por_peticion': 4, 'errores': 0}}}
+        self.assertEqual(Command()._regresiones(igual, base, 0.25, 2.0), [])
+        self.assertEqual(len(Command()._regresiones(peor, base, 0.25, 2.0)), 2)
+
+
+# PRUEBA 20: Hashers configurables, sesiones cacheadas y perfil memorizado
+class LoginTestCase(BaseTestCase):
+    def test_rehash_al_iniciar_sesion(self):
+        from django.conf import settings
+        from django.contrib.auth.hashers import make_password
+        # Contraseña guardada con el hasher de Django: el login la rehace con el perfil preferido
+        with self.settings(PASSWORD_HASHERS=['usuarios.hashers.PBKDF2Ajustado']):
+            self.user.password = make_password('password123')
+        self.user.save()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.client.post(reverse('usuarios:login'), {'username': 'TestUser', 'password': 'password123'})
+        self.user.refresh_from_db()
+        algoritmo = settings.PASSWORD_HASHERS[0].rsplit('.', 1)[-1]
+        self.assertTrue(self.user.check_password('password123'))
+        self.assertEqual(self.user.password.split('$')[0], {
+            'ScryptAjustado': 'scrypt', 'Argon2Ajustado': 'argon2', 'PBKDF2Ajustado': 'pbkdf2_sha256',
+        }[algoritmo])
+
+    def test_parametros_cambiados_rehacen_el_hash(self):
+        from django.contrib.auth.hashers import get_hasher
+        hasher = get_hasher('pbkdf2_sha256')
+        encoded = hasher.encode('password123', hasher.salt())
+        with self.settings(HASHER_PARAMETROS={'pbkdf2': {'iterations': 1000}}):
+            self.assertTrue(hasher.must_update(encoded))
+            self.assertTrue(hasher.verify('password123', encoded))
+
+    def test_scrypt_no_rebaja_los_hashes_de_django(self):
+        # Un hash con los parámetros por defecto de Django no se rehace más débil
+        from django.contrib.auth.hashers import ScryptPasswordHasher
+        from .hashers import ScryptAjustado
+        encoded = ScryptPasswordHasher().encode('password123', ScryptPasswordHasher().salt())
+        self.assertFalse(ScryptAjustado().must_update(encoded))
+
+    def test_sesion_cacheada_ahorra_una_consulta(self):
+        url = reverse('usuarios:editar_perfil')
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db'):
+            self.client.force_login(self.user)
+            self.client.get(url)
+            # La sesión sale de la caché; queda el User con su perfil (un JOIN)
+            with self.assertNumQueries(1):
+                self.client.get(url)
+
+    def test_perfil_faltante_se_crea(self):
+        sin_perfil = User.objects.create_user('admin2', password='x')
+        self.client.force_login(sin_perfil)
+        response = self.client.get(reverse('usuarios:editar_perfil'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(PerfilUsuario.objects.filter(user=sin_perfil).exists())
+
+
+# PRUEBA 21: Réplicas de lectura (correr con tienda.settings_sqlite para tener réplicas)
+class RouterReplicasTestCase(BaseTestCase):
+    def test_fuera_de_peticion_y_en_transaccion_lee_de_primaria(self):
+        from .routers import RouterReplicas
+        # Fuera de una petición (comandos) y con una transacción abierta (todo TestCase)
+        self.assertEqual(RouterReplicas().db_for_read(Producto), 'default')
+        self.assertEqual(RouterReplicas().db_for_write(Producto), 'default')
+
+
+@skipUnless(settings.REPLICAS and all(a in settings.DATABASES for a in settings.REPLICAS), "sin réplicas configuradas")
+class ReplicasTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('replicas', password='password123')
+        PerfilUsuario.objects.create(user=self.user)
+        self.producto = Producto.objects.create(nombre="Coca Cola", costo=20, categoria="Bebidas")
+        self.client.force_login(self.user)
+
+    @contextmanager
+    def consultas_por_base(self):
+        capturas = {alias: CaptureQueriesContext(connections[alias]) for alias in ['default', *settings.REPLICAS]}
+        for captura in capturas.values():
+            captura.__enter__()
+        conteos = {}
+        try:
+            yield conteos
+        finally:
+            for alias, captura in capturas.items():
+                captura.__exit__(None, None, None)
+                conteos[alias] = len(captura)
+
+    def test_lecturas_a_replicas_y_escritura_fija_a_primaria(self):
+        from .routers import COOKIE_PRIMARIA
+        with self.consultas_por_base() as conteos:
+            self.client.get(reverse('usuarios:productos'))
+        self.assertEqual(conteos['default'], 0)
+        self.assertGreater(sum(conteos[a] for a in settings.REPLICAS), 0)
+
+        response = self.client.post(reverse('usuarios:comprar'), {'producto_id': self.producto.id, 'cantidad': 1})
+        self.assertIn(COOKIE_PRIMARIA, response.cookies)
+
+        # Dentro de la ventana: el perfil se lee de la primaria y muestra la compra nueva
+        with self.consultas_por_base() as conteos:
+            response = self.client.get(reverse('usuarios:perfil'))
+        self.assertContains(response, "Coca Cola")
+        self.assertEqual(sum(conteos[a] for a in settings.REPLICAS), 0)
+
+        # Vencida la ventana (la cookie expira) vuelve a las réplicas
+        del self.client.cookies[COOKIE_PRIMARIA]
+        with self.consultas_por_base() as conteos:
+            self.client.get(reverse('usuarios:perfil'))
+        self.assertGreater(sum(conteos[a] for a in settings.REPLICAS), 0)
+
+
+# PRUEBA 22: Stock y compras concurrentes
+class StockTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.limitado = Producto.objects.create(nombre="Edición limitada", costo=100, categoria="Varios", stock=3)
+        self.libre = Producto.objects.create(nombre="Pan", costo=5, categoria="Panadería")
+
+    def test_descuenta_stock_y_sin_control_no_cambia(self):
+        from .compras import comprar_carrito
+        comprar_carrito(self.user, [(self.limitado.id, 2), (self.libre.id, 10)])
+        self.limitado.refresh_from_db()
+        self.libre.refresh_from_db()
+        self.assertEqual(self.limitado.stock, 1)
+        self.assertIsNone(self.libre.stock)
+
+    def test_sin_stock_deshace_todo_el_carrito(self):
+        from .compras import StockInsuficiente, comprar_carrito
+        with self.assertRaises(StockInsuficiente) as error:
+            comprar_carrito(self.user, [(self.libre.id, 1), (self.limitado.id, 4)])
+        self.assertEqual(error.exception.producto_ids, [self.limitado.id])
+        self.limitado.refresh_from_db()
+        self.assertEqual(self.limitado.stock, 3)
+        self.assertFalse(Compra.objects.exists())
+
+    def test_comprar_sin_stock_muestra_error(self):
+        response = self.client.post(
+            reverse('usuarios:comprar'), {'producto_id': self.limitado.id, 'cantidad': 5}, follow=True,
+        )
+        self.assertContains(response, "No hay stock suficiente")
+        self.assertFalse(Compra.objects.exists())
+
+    def test_comprar_cantidad_invalida_muestra_error(self):
+        for cantidad in (0, -2, 'abc'):
+            response = self.client.post(
+                reverse('usuarios:comprar'), {'producto_id': self.limitado.id, 'cantidad': cantidad}, follow=True,
+            )
+            self.assertRedirects(response, reverse('usuarios:comprar'))
+            self.assertContains(response, "inválida")
+        self.limitado.refresh_from_db()
+        self.assertEqual(self.limitado.stock, 3)
+        self.assertFalse(Compra.objects.exists())
+
+
+class StockConcurrenteTestCase(TransactionTestCase):
+    def test_sin_sobreventa_con_hilos(self):
+        from .management.commands.bench_stock import estresar
+        usuarios = [User.objects.create_user(f'hilo{i}', password='x') for i in range(8)]
+        producto = Producto.objects.create(nombre="Oferta", costo=10, categoria="Varios", stock=20)
+        vendidas, rechazadas, _ = estresar(usuarios, producto.id, compras_por_hilo=5)
+        producto.refresh_from_db()
+        self.assertEqual((vendidas, rechazadas), (20, 20))
+        self.assertEqual(producto.stock, 0)
+        self.assertEqual(Compra.objects.filter(producto=producto).count(), 20)
+
+
+# PRUEBA 23: Cola de tareas para los efectos de las compras
+class TareasTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.producto = Producto.objects.create(nombre="Libro", costo=20, categoria="Libros")
+
+    def comprar(self, cantidad=1):
+        return Compra.objects.create(usuario=self.user, producto=self.producto, cantidad=cantidad, precio_unitario=20)
+
+    def test_ejecutor_sincrono_al_confirmar(self):
+        from django.core import mail
+        from .models import Auditoria, Tarea
+        with self.captureOnCommitCallbacks(execute=True):
+            self.comprar(cantidad=2)
+            # Nada se ejecuta antes de confirmar la transacción
+            self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['test@correo.com'])
+        self.assertIn('2 x Libro: $40.00', mail.outbox[0].body)
+        self.assertEqual(Auditoria.objects.get().usuario, self.user)
+        self.assertFalse(Tarea.objects.exists())
+
+    def test_carrito_encola_una_sola_compra(self):
+        from django.core import mail
+        from .compras import comprar_carrito
+        otro = Producto.objects.create(nombre="Cuaderno", costo=5, categoria="Papelería")
+        with self.captureOnCommitCallbacks(execute=True):
+            comprar_carrito(self.user, [(self.producto.id, 1), (otro.id, 3)])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('3 x Cuaderno', mail.outbox[0].body)
+
+    @override_settings(TAREAS_EJECUTOR='cola')
+    def test_cola_agrupa_por_nombre(self):
+        from unittest import mock
+        from django.core import mail
+        from . import tareas
+        from .models import Auditoria, Tarea
+        for _ in range(3):
+            self.comprar()
+        self.assertEqual(Tarea.objects.count(), 9)
+        self.assertEqual(len(mail.outbox), 0)
+
+        original = tareas.TAREAS['confirmar_compra']
+        with mock.patch.dict(tareas.TAREAS, {'confirmar_compra': mock.Mock(side_effect=original)}):
+            reclamadas, terminadas = tareas.procesar_lote(tareas.nuevo_trabajador(), lote=100)
+            # Un solo llamado con las tres confirmaciones
+            tareas.TAREAS['confirmar_compra'].assert_called_once()
+            self.assertEqual(len(tareas.TAREAS['confirmar_compra'].call_args.args[0]), 3)
+        self.assertEqual((reclamadas, terminadas), (9, 9))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(Auditoria.objects.count(), 3)
+        self.assertFalse(Tarea.objects.exists())
+
+    @override_settings(TAREAS_EJECUTOR='cola', TAREAS_MAX_INTENTOS=2)
+    def test_reintentos_con_espera_y_fallida(self):
+        from datetime import timedelta
+        from unittest import mock
+        from django.utils import timezone
+        from . import tareas
+        from .models import Tarea
+        tareas.encolar(('falla', {'n': 1}))
+        trabajador = tareas.nuevo_trabajador()
+        falla = mock.Mock(side_effect=RuntimeError('sin red'))
+        with mock.patch.dict(tareas.TAREAS, {'falla': falla}), self.assertLogs('usuarios.tareas', 'ERROR'):
+            self.assertEqual(tareas.procesar_lote(trabajador, 10), (1, 0))
+            tarea = Tarea.objects.get()
+            self.assertEqual((tarea.estado, tarea.intentos), (Tarea.PENDIENTE, 1))
+            self.assertIn('sin red', tarea.ultimo_error)
+            self.assertGreater(tarea.disponible_en, timezone.now())
+            # Durante la espera no se reclama
+            self.assertEqual(tareas.procesar_lote(trabajador, 10), (0, 0))
+
+            Tarea.objects.update(disponible_en=timezone.now() - timedelta(seconds=1))
+            self.assertEqual(tareas.procesar_lote(trabajador, 10), (1, 0))
+            tarea.refresh_from_db()
+            self.assertEqual((tarea.estado, tarea.intentos), (Tarea.FALLIDA, 2))
+            Tarea.objects.update(disponible_en=timezone.now() - timedelta(seconds=1))
+            self.assertEqual(tareas.procesar_lote(trabajador, 10), (0, 0))
+        self.assertEqual([tareas.espera_reintento(n) for n in (1, 2, 3)], [5, 10, 20])
+
+    @override_settings(TAREAS_EJECUTOR='cola')
+    def test_bloqueo_vencido_se_reentrega_sin_duplicar(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from . import tareas
+        from .models import Auditoria, Tarea, VentaCategoria
+        from .ventas import aplicar_ventas
+        self.comprar()
+        # Un worker reclama y muere sin terminar: nadie más la toma hasta que vence el bloqueo
+        muerto = tareas.nuevo_trabajador()
+        self.assertEqual(len(tareas.reclamar(muerto, 10)), 3)
+        self.assertEqual(tareas.reclamar(tareas.nuevo_trabajador(), 10), [])
+
+        # Ya procesada una vez (p. ej. murió tras escribir la auditoría y antes de borrar)
+        tareas.auditar([Tarea.objects.get(nombre='auditar').datos])
+        aplicar_ventas([Tarea.objects.get(nombre='registrar_ventas').datos])
+        Tarea.objects.update(disponible_en=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(tareas.procesar_lote(tareas.nuevo_trabajador(), 10), (3, 3))
+        self.assertEqual(Auditoria.objects.count(), 1)
+        self.assertEqual(
+            sorted(VentaCategoria.objects.values_list('periodo', 'num_compras')), [('dia', 1), ('mes', 1)],
+        )
+        self.assertFalse(Tarea.objects.exists())
+
+
+# Los hilos del pool usan sus propias conexiones: los datos tienen que estar confirmados
+@override_settings(TAREAS_EJECUTOR='cola')
+class ProcesarTareasTestCase(TransactionTestCase):
+    def test_comando_vacia_la_cola(self):
+        from io import StringIO
+        from django.core import mail
+        from django.core.management import call_command
+        from .models import Auditoria, Tarea
+        usuario = User.objects.create_user('worker', email='worker@correo.com', password='x')
+        producto = Producto.objects.create(nombre="Libro", costo=20, categoria="Libros")
+        for _ in range(4):
+            Compra.objects.create(usuario=usuario, producto=producto, cantidad=1, precio_unitario=20)
+        salida = StringIO()
+        # Un hilo: SQLite en memoria no admite escrituras concurrentes
+        call_command('procesar_tareas', '--una-vez', '--hilos', '1', stdout=salida)
+        self.assertIn('12 tareas terminadas, 0 con error', salida.getvalue())
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(Auditoria.objects.count(), 4)
+        self.assertFalse(Tarea.objects.exists())
+
+
+# PRUEBA 24: Respuestas condicionales del catálogo (ETag)
+class CatalogoCondicionalTestCase(PresupuestoConsultasMixin, BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.producto = Producto.objects.create(nombre="Lámpara", costo=30, categoria="Hogar", stock=5)
+
+    def revalidar(self, nombre, etag, **params):
+        return self.client.get(reverse(f'usuarios:{nombre}'), params, HTTP_IF_NONE_MATCH=etag)
+
+    def test_304_con_una_consulta_barata(self):
+        for nombre in ('productos', 'comprar'):
+            with self.subTest(vista=nombre):
+                # La primera visita a comprar fija la cookie CSRF, que forma parte del ETag
+                self.client.get(reverse(f'usuarios:{nombre}'))
+                primera = self.client.get(reverse(f'usuarios:{nombre}'))
+                self.assertEqual(primera.status_code, 200)
+                self.assertIn('private', primera['Cache-Control'])
+                self.assertFalse(primera.has_header('Last-Modified'))
+                # Sesión y usuario (2) más el MAX(actualizado_en)
+                with self.assertPresupuestoConsultas(3, nombre) as capturadas:
+                    response = self.revalidar(nombre, primera['ETag'])
+                self.assertEqual(response.status_code, 304)
+                self.assertIn('MAX', capturadas.captured_queries[-1]['sql'].upper())
+
+    def test_etag_cambia_con_parametros_y_ediciones(self):
+        self.client.get(reverse('usuarios:comprar'))
+        etag = self.client.get(reverse('usuarios:comprar'))['ETag']
+        self.assertEqual(self.revalidar('comprar', etag).status_code, 304)
+        self.assertEqual(self.revalidar('comprar', etag, categoria='Hogar').status_code, 200)
+
+        self.producto.costo = 25
+        self.producto.save()
+        self.assertEqual(self.revalidar('comprar', etag).status_code, 200)
+
+    def test_etag_cambia_con_stock_importacion_y_borrado(self):
+        from .compras import descontar_stock
+        from .importacion import importar
+        url = reverse('usuarios:productos')
+        etag = self.client.get(url)['ETag']
+        descontar_stock({self.producto.id: 1})
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+        etag = self.client.get(url)['ETag']
+        importar([{'id': str(self.producto.id), 'nombre': "Lámpara LED", 'costo': '30', 'categoria': 'Hogar'}])
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+        otro = Producto.objects.create(nombre="Viejo", costo=1, categoria="Hogar")
+        etag = self.client.get(url)['ETag']
+        otro.delete()
+        self.assertEqual(self.revalidar('productos', etag).status_code, 200)
+
+    def test_if_modified_since_solo_no_da_304(self):
+        # Un borrado no mueve MAX(actualizado_en): sin Last-Modified no hay 304 viejo
+        url = reverse('usuarios:productos')
+        otro = Producto.objects.create(nombre="Viejo", costo=1, categoria="Hogar")
+        fecha = http_date(otro.actualizado_en.timestamp() + 60)
+        otro.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=fecha)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "Viejo")
+
+    def test_mensajes_pendientes_no_dan_304(self):
+        self.client.get(reverse('usuarios:comprar'))
+        etag = self.client.get(reverse('usuarios:comprar'))['ETag']
+        response = self.client.post(
+            reverse('usuarios:comprar'), {'producto_id': self.producto.id, 'cantidad': 50}, follow=True,
+            HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertContains(response, "No hay stock suficiente")
+
+
+@override_settings(ROOT_URLCONF=URLS_PRUEBAS)
+class CatalogoCondicionalAsyncTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        Producto.objects.create(nombre="Lámpara", costo=30, categoria="Hogar")
+        self.async_client.force_login(self.user)
+
+    async def test_304_en_vistas_async(self):
+        for nombre in ('productos', 'comprar'):
+            url = reverse(f'usuarios:{nombre}')
+            await self.async_client.get(url)
+            etag = (await self.async_client.get(url))['ETag']
+            response = await self.async_client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304, nombre)
+
+    async def test_version_sin_bloquear_el_event_loop(self):
+        from unittest import mock
+        url = reverse('usuarios:productos')
+        etag = (await self.async_client.get(url))['ETag']
+        # La versión sale de cache.aget: la lectura síncrona no se usa en el camino async
+        with mock.patch('usuarios.catalogo.version_catalogo', side_effect=AssertionError('sync')):
+            response = await self.async_client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+
+# PRUEBA 25: Resúmenes de ventas por día y por mes
+class VentasTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        from datetime import datetime, timezone as tz
+        from unittest import mock
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.productos = [
+            Producto.objects.create(nombre=f"P{i}", costo=10 + i, categoria=f"Cat {i % 2}") for i in range(3)
+        ]
+        # Compras repartidas entre enero y marzo, creadas por las vías normales (señal y carrito)
+        from .compras import comprar_carrito
+        self.dias = [(1, 5), (1, 31), (2, 1), (2, 14), (2, 28), (3, 1), (3, 20)]
+        for n, (mes, dia) in enumerate(self.dias):
+            fecha = datetime(2025, mes, dia, 15, tzinfo=tz.utc)
+            with mock.patch('django.utils.timezone.now', return_value=fecha), \
+                    self.captureOnCommitCallbacks(execute=True):
+                producto = self.productos[n % 3]
+                Compra.objects.create(usuario=self.user, producto=producto, cantidad=n + 1, precio_unitario=producto.costo)
+                comprar_carrito(self.user, [(p.id, 1) for p in self.productos[:2]])
+
+    def crudo(self, desde, hasta, por):
+        from django.db.models import Count, Sum
+        from .ventas import _limites
+        inicio, fin = _limites(desde, hasta)
+        campo = 'producto__categoria' if por == 'categoria' else 'producto_id'
+        filas = (
+            Compra.objects.filter(fecha__gte=inicio, fecha__lt=fin).order_by().values(campo)
+            .annotate(u=Sum('cantidad'), i=Sum('total'), n=Count('id'))
+        )
+        return {f[campo]: (f['u'], f['i'], f['n']) for f in filas}
+
+    def resumido(self, desde, hasta, por):
+        from .ventas import consultar_ventas
+        clave = 'categoria' if por == 'categoria' else 'producto_id'
+        return {
+            f[clave]: (f['unidades'], f['ingresos'], f['num_compras'])
+            for f in consultar_ventas(desde, hasta, por=por)
+        }
+
+    def test_rangos_coinciden_con_compra(self):
+        from datetime import date
+        rangos = [
+            (date(2025, 1, 1), date(2025, 12, 31)),   # meses completos
+            (date(2025, 1, 31), date(2025, 3, 1)),    # bordes diarios y febrero completo
+            (date(2025, 2, 2), date(2025, 2, 27)),    # dentro de un mes
+            (date(2025, 2, 14), date(2025, 2, 14)),
+            (date(2025, 4, 1), date(2025, 4, 30)),    # sin ventas
+        ]
+        for desde, hasta in rangos:
+            for por in ('categoria', 'producto'):
+                with self.subTest(desde=desde, hasta=hasta, por=por):
+                    self.assertEqual(self.resumido(desde, hasta, por), self.crudo(desde, hasta, por))
+
+    def test_por_periodo(self):
+        from datetime import date
+        from .ventas import consultar_ventas
+        filas = consultar_ventas(date(2025, 1, 15), date(2025, 3, 31), periodo='mes')
+        por_mes = {}
+        for fila in filas:
+            por_mes[fila['inicio']] = por_mes.get(fila['inicio'], 0) + fila['num_compras']
+        # El 15 de enero cae en un mes incompleto: enero solo suma el día 31
+        self.assertEqual(por_mes, {date(2025, 1, 1): 3, date(2025, 2, 1): 9, date(2025, 3, 1): 6})
+        dias = consultar_ventas(date(2025, 2, 1), date(2025, 2, 28), por='producto', periodo='dia')
+        self.assertEqual(sorted({f['inicio'].day for f in dias}), [1, 14, 28])
+
+    def test_borrado_y_reconstruccion(self):
+        from datetime import date
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import VentaCategoria, VentaProducto
+        with self.captureOnCommitCallbacks(execute=True):
+            Compra.objects.filter(fecha__month=2).first().delete()
+        anio = (date(2025, 1, 1), date(2025, 12, 31))
+        self.assertEqual(self.resumido(*anio, 'producto'), self.crudo(*anio, 'producto'))
+
+        incrementales = {
+            modelo: sorted(modelo.objects.values_list('periodo', 'inicio', 'unidades', 'ingresos', 'num_compras'))
+            for modelo in (VentaProducto, VentaCategoria)
+        }
+        VentaProducto.objects.update(unidades=0)
+        call_command('reconstruir_ventas', stdout=StringIO())
+        for modelo, filas in incrementales.items():
+            reconstruidas = modelo.objects.filter(num_compras__gt=0)
+            self.assertEqual(
+                sorted(reconstruidas.values_list('periodo', 'inicio', 'unidades', 'ingresos', 'num_compras')),
+                [f for f in filas if f[4] > 0],
+            )
+
+    def test_edicion_resta_la_fila_anterior(self):
+        from datetime import date
+        compra = Compra.objects.filter(fecha__month=1).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            compra.producto = self.productos[2]
+            compra.cantidad += 3
+            compra.fecha = compra.fecha.replace(month=3)
+            compra.save()
+        # Cambió de producto, de cantidad y de mes
+        for desde, hasta in ((date(2025, 1, 1), date(2025, 12, 31)), (date(2025, 3, 1), date(2025, 3, 31))):
+            for por in ('categoria', 'producto'):
+                with self.subTest(desde=desde, por=por):
+                    self.assertEqual(self.resumido(desde, hasta, por), self.crudo(desde, hasta, por))
+
+    def test_tablero_y_api(self):
+        response = self.client.get(reverse('usuarios:ventas'), {'desde': '2025-01-01', 'hasta': '2025-03-31'})
+        self.assertContains(response, "Cat 0")
+        datos = self.client.get(
+            reverse('usuarios:ventas_api'), {'desde': '2025-02-01', 'hasta': '2025-02-28', 'por': 'producto'},
+        ).json()
+        self.assertEqual({f['nombre'] for f in datos['filas']}, {"P0", "P1", "P2"})
+        self.assertEqual(self.client.get(reverse('usuarios:ventas_api'), {'desde': 'ayer'}).status_code, 400)
+
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('usuarios:ventas')).status_code, 403)
+
+
+# PRUEBA 26: Changelists grandes del admin (conteo estimado, filtro por autocompletado, jerarquía de fechas)
+class AdminTablaGrandeTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        from datetime import datetime, timezone as tz
+        from unittest import mock
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.url = reverse('admin:usuarios_compra_changelist')
+        self.cafe = Producto.objects.create(nombre="Café", costo=5, categoria="Bebidas")
+        self.pan = Producto.objects.create(nombre="Pan", costo=2, categoria="Comida")
+        self.otro = User.objects.create_user('comprador', password='x')
+        for producto, usuario, fecha in [
+            (self.cafe, self.user, datetime(2024, 11, 3, 12, tzinfo=tz.utc)),
+            (self.cafe, self.otro, datetime(2025, 2, 14, 12, tzinfo=tz.utc)),
+            (self.pan, self.otro, datetime(2025, 2, 20, 12, tzinfo=tz.utc)),
+            (self.pan, self.otro, datetime(2025, 3, 1, 12, tzinfo=tz.utc)),
+        ]:
+            # Los resúmenes de ventas (jerarquía de fechas) se suman al confirmar
+            with mock.patch('django.utils.timezone.now', return_value=fecha), \
+                    self.captureOnCommitCallbacks(execute=True):
+                Compra.objects.create(usuario=usuario, producto=producto, cantidad=1, precio_unitario=producto.costo)
+
+    def get(self, **params):
+        with CaptureQueriesContext(connection) as capturadas:
+            response = self.client.get(self.url, params)
+        return response, [q['sql'] for q in capturadas.captured_queries]
+
+    def test_conteo_acotado_y_estimado(self):
+        from unittest import mock
+        from .paginacion import PaginadorEstimado
+        with self.settings(ADMIN_CONTEO_MAXIMO=3):
+            self.assertEqual(PaginadorEstimado(Compra.objects.order_by('-fecha'), 100).count, 3)
+            filtradas = Compra.objects.filter(producto=self.cafe).order_by('-fecha')
+            self.assertEqual(PaginadorEstimado(filtradas, 100).count, 2)
+            with mock.patch('usuarios.paginacion.estimar_filas', return_value=1_000_000):
+                with self.assertNumQueries(0):
+                    self.assertEqual(PaginadorEstimado(Compra.objects.order_by('-fecha'), 100).count, 1_000_000)
+                # Con filtros la estimación de la tabla no sirve: se cuenta
+                self.assertEqual(PaginadorEstimado(filtradas, 100).count, 2)
+
+    def test_changelist_sin_conteo_completo(self):
+        response, consultas = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), 4)
+        conteos = [sql for sql in consultas if 'COUNT(' in sql and 'usuarios_compra' in sql]
+        self.assertTrue(conteos)
+        for sql in conteos:
+            self.assertIn('LIMIT', sql)
+
+    def test_filtro_producto_autocompletado(self):
+        response, consultas = self.get(producto__id__exact=self.cafe.id)
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+        self.assertContains(response, reverse('admin:autocomplete'))
+        self.assertContains(response, f'<option value="{self.cafe.id}" selected>Café</option>', html=True)
+        # Solo se lee el producto elegido, no la tabla entera
+        for sql in consultas:
+            if sql.startswith('SELECT') and f"FROM {connection.ops.quote_name('usuarios_producto')}" in sql:
+                self.assertIn('WHERE', sql)
+        response = self.client.get(self.url, {'producto__id__exact': 'x'})
+        self.assertRedirects(response, self.url + '?e=1', fetch_redirect_response=False)
+
+    def test_busqueda_por_subcadena_sin_like_sobre_el_join(self):
+        response, consultas = self.get(q='caf')
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+        # Subcadena, no prefijo: "afé" está dentro de "Café" y "PRADOR" dentro de "comprador"
+        response, _ = self.get(q='afé')
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+        response, consultas = self.get(q='PRADOR')
+        self.assertEqual(len(response.context['cl'].result_list), 3)
+        response, _ = self.get(q='nadie')
+        self.assertEqual(len(response.context['cl'].result_list), 0)
+        # El LIKE va solo dentro de las subconsultas de usuarios y productos
+        for sql in consultas:
+            if f"FROM {connection.ops.quote_name('usuarios_compra')}" in sql and 'LIKE' in sql:
+                self.assertEqual(sql.count('LIKE'), sql.count('IN (SELECT'))
+
+    def test_productos_subcadena_en_lista_y_prefijo_en_autocompletado(self):
+        Producto.objects.create(nombre="Coca Cola", costo=20, categoria="Bebidas")
+        lista = self.client.get(reverse('admin:usuarios_producto_changelist'), {'q': 'Cola'})
+        self.assertEqual([p.nombre for p in lista.context['cl'].result_list], ["Coca Cola"])
+        params = {'term': 'Cola', 'app_label': 'usuarios', 'model_name': 'compra', 'field_name': 'producto'}
+        self.assertEqual(self.client.get(reverse('admin:autocomplete'), params).json()['results'], [])
+        params['term'] = 'Coca'
+        resultados = self.client.get(reverse('admin:autocomplete'), params).json()['results']
+        self.assertEqual([r['text'] for r in resultados], ["Coca Cola"])
+
+    def test_jerarquia_de_fechas_desde_resumenes(self):
+        response, consultas = self.get()
+        self.assertContains(response, '?fecha__year=2024')
+        self.assertContains(response, '?fecha__year=2025')
+        for sql in consultas:
+            if 'DISTINCT' in sql:
+                self.assertNotIn('usuarios_compra', sql)
+
+        response, _ = self.get(fecha__year='2025')
+        self.assertContains(response, 'fecha__month=2')
+        self.assertContains(response, 'fecha__month=3')
+        self.assertNotContains(response, 'fecha__month=11')
+        response, _ = self.get(fecha__year='2025', fecha__month='2')
+        self.assertContains(response, 'fecha__day=14')
+        self.assertContains(response, 'fecha__day=20')
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+
+        # Filtrado por producto: solo los años en que se vendió
+        response, _ = self.get(producto__id__exact=self.pan.id)
+        self.assertNotContains(response, 'fecha__year=2024')
+        # Un solo año con ventas: entra directo a sus meses, como el de Django
+        self.assertContains(response, 'fecha__month=2')
+
+
+# PRUEBA 27: Límite de peticiones (cubetas por IP y por usuario)
+class LimitesTestCase(BaseTestCase):
+    REGLAS = {
+        'usuarios:login': {'metodos': ('POST',), 'ip': (4, 60), 'usuario': (2, 60)},
+        'usuarios:comprar': {'metodos': ('POST',), 'usuario': (1, 60)},
+    }
+
+    def setUp(self):
+        super().setUp()
+        ajustes = self.settings(LIMITES=self.REGLAS)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.login = reverse('usuarios:login')
+
+    def test_cubeta_se_rellena_con_el_tiempo(self):
+        from .limites import consumir
+        cubeta = [('prueba', 3, 60)]
+        self.assertEqual([consumir(cubeta, ahora=600) for _ in range(3)], [0, 0, 0])
+        self.assertEqual(consumir(cubeta, ahora=610), 20)
+        # El rechazo no gastó ficha: sigue rechazando igual, sin acumular deuda
+        self.assertEqual(consumir(cubeta, ahora=610), 20)
+        # Media ventana después quedan 1,5 fichas gastadas de la anterior: entra una más
+        self.assertEqual(consumir(cubeta, ahora=690), 0)
+        self.assertEqual(consumir(cubeta, ahora=690), 20)
+        self.assertEqual(consumir(cubeta, ahora=800), 0)
+
+    def test_login_rechaza_antes_del_hash(self):
+        from unittest import mock
+        datos = {'username': 'TestUser', 'password': 'mala'}
+        for _ in range(2):
+            self.assertEqual(self.client.post(self.login, datos).status_code, 200)
+        with mock.patch.object(User, 'check_password') as verificar:
+            response = self.client.post(self.login, {'username': ' testuser ', 'password': 'password123'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertContains(response, 'Intenta de nuevo en 30 segundos.', status_code=429)
+        verificar.assert_not_called()
+        # Otros usuarios desde la misma IP todavía entran (lleva 2 de 4: el rechazo no cuenta)...
+        otro = {'username': 'otro', 'password': 'x'}
+        self.assertEqual(self.client.post(self.login, otro).status_code, 200)
+        self.assertEqual(self.client.post(self.login, {'username': 'tercero', 'password': 'x'}).status_code, 200)
+        # ...hasta agotar la cubeta de la IP; desde otra IP sí
+        self.assertEqual(self.client.post(self.login, {'username': 'cuarto', 'password': 'x'}).status_code, 429)
+        self.assertEqual(self.client.post(self.login, otro, REMOTE_ADDR='10.0.0.2').status_code, 200)
+        # Los GET no se limitan
+        self.assertEqual(self.client.get(self.login).status_code, 200)
+
+    def test_compra_por_usuario(self):
+        producto = Producto.objects.create(nombre="Café", costo=5, categoria="Bebidas")
+        self.client.force_login(self.user)
+        url = reverse('usuarios:comprar')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(url, {'producto_id': producto.id, 'cantidad': 1}).status_code, 302)
+        with self.assertNumQueries(2):
+            # Solo la sesión y el usuario: la vista no llega a ejecutarse
+            response = self.client.post(url, {'producto_id': producto.id, 'cantidad': 1})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(Compra.objects.count(), 1)
+
+    def test_desactivado(self):
+        datos = {'username': 'TestUser', 'password': 'mala'}
+        with self.settings(LIMITES_ACTIVOS=False):
+            for _ in range(5):
+                self.assertEqual(self.client.post(self.login, datos).status_code, 200)
+
+
+# PRUEBA 28: Usuario y perfil en una consulta; el formulario de perfil solo guarda lo que cambió
+class UsuarioConPerfilTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('usuarios:editar_perfil')
+        self.client.force_login(self.user)
+
+    def post(self, datos):
+        with CaptureQueriesContext(connection) as capturadas:
+            response = self.client.post(self.url, datos)
+        self.assertRedirects(response, reverse('usuarios:perfil'), fetch_redirect_response=False)
+        return [q['sql'] for q in capturadas if q['sql'].startswith('UPDATE')]
+
+    def test_get_una_consulta_para_usuario_y_perfil(self):
+        # La sesión y el User con su perfil
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertContains(response, "Calle Prueba")
+
+    def test_sin_cambios_no_guarda(self):
+        self.assertEqual(self.post({'email': 'test@correo.com', 'direccion': 'Calle Prueba'}), [])
+
+    def test_solo_las_columnas_cambiadas(self):
+        q = connection.ops.quote_name
+        updates = self.post({'email': 'test@correo.com', 'direccion': 'Calle Nueva'})
+        self.assertEqual(len(updates), 1)
+        self.assertTrue(updates[0].startswith(f"UPDATE {q('usuarios_perfilusuario')} SET {q('direccion')} = "))
+        self.assertNotIn(q('rol'), updates[0])
+
+        updates = self.post({'email': 'nuevo@correo.com', 'direccion': 'Calle Nueva'})
+        self.assertEqual(len(updates), 1)
+        self.assertTrue(updates[0].startswith(f"UPDATE {q('auth_user')} SET {q('email')} = "))
+        self.user.refresh_from_db()
+        self.perfil.refresh_from_db()
+        self.assertEqual((self.user.email, self.perfil.direccion), ('nuevo@correo.com', 'Calle Nueva'))
+
+    def test_sesion_anterior_con_model_backend(self):
+        # Sesiones iniciadas antes del cambio guardan la ruta de ModelBackend
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertContains(self.client.get(self.url), "Calle Prueba")
+
+    async def test_async_usa_el_perfil_cargado(self):
+        from .autenticacion import PerfilBackend
+        usuario = await PerfilBackend().aget_user(self.user.pk)
+        # Ya en memoria: leerlo no consulta (en contexto async fallaría con SynchronousOnlyOperation)
+        self.assertEqual(usuario.perfil.direccion, "Calle Prueba")
+
+    @override_settings(ROOT_URLCONF=URLS_PRUEBAS)
+    async def test_async_sesion_anterior_con_model_backend(self):
+        await self.async_client.aforce_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        response = await self.async_client.get(reverse('usuarios:perfil'))
+        self.assertContains(response, "Calle Prueba")
+
+    @override_settings(ROOT_URLCONF=URLS_PRUEBAS)
+    async def test_async_usuario_sin_perfil(self):
+        # PerfilBackend deja en caché "sin perfil": la vista lo crea sin consultas síncronas
+        await PerfilUsuario.objects.filter(user=self.user).adelete()
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('usuarios:perfil'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(await PerfilUsuario.objects.filter(user=self.user).aexists())
+
+
+# PRUEBA 29: Foto del catálogo en memoria
+class CatalogoMemoriaTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        nombres = ["Café molido", "Café en grano", "Taza", "Jugo", "Mesa de café", "Silla", "Lámpara"]
+        self.productos = [
+            Producto.objects.create(nombre=nombre, costo=10 + i, categoria="Bebidas" if i % 2 else "Hogar", stock=5)
+            for i, nombre in enumerate(nombres)
+        ]
+        self.productos[3].activo = False
+        self.productos[3].save()
+
+    def paginas(self, pagina_de):
+        # Recorre todas las páginas siguiendo los cursores; devuelve los ids por página
+        paginas, cursor = [], None
+        while True:
+            pagina = pagina_de(cursor)
+            paginas.append([p.pk for p in pagina])
+            cursor = pagina.cursor_siguiente
+            if cursor is None:
+                return paginas
+
+    def test_mismas_paginas_que_sql(self):
+        from .busqueda import IndiceCompacto
+        from .catalogo import obtener_catalogo
+        from .paginacion import PaginaKeyset
+        activos = Producto.objects.filter(activo=True)
+        indice = IndiceCompacto(activos.values_list('id', 'nombre', 'categoria'))
+        casos = [
+            ('', '', activos, ('-creado_en', '-id')),
+            ('', 'Hogar', activos.filter(categoria='Hogar'), ('-creado_en', '-id')),
+            ('caf', '', indice.buscar(activos, 'caf'), ('-relevancia', 'id')),
+            ('caf', 'Bebidas', indice.buscar(activos.filter(categoria='Bebidas'), 'caf'), ('-relevancia', 'id')),
+        ]
+        for search, categoria, queryset, orden in casos:
+            with self.subTest(search=search, categoria=categoria):
+                en_memoria = self.paginas(
+                    lambda c: obtener_catalogo().pagina(c, 2, search=search, categoria=categoria)
+                )
+                self.assertEqual(en_memoria, self.paginas(lambda c: PaginaKeyset(queryset, orden, c, 2)))
+        todos = self.paginas(lambda c: obtener_catalogo().pagina(c, 3, solo_activos=False))
+        self.assertEqual(sum(todos, []), list(Producto.objects.order_by('-creado_en', '-id').values_list('id', flat=True)))
+
+    def test_cursor_invalido_vuelve_al_inicio(self):
+        from .catalogo import obtener_catalogo
+        from .paginacion import codificar_cursor
+        primera = [p.pk for p in obtener_catalogo().pagina(None, 2)]
+        for cursor in ('basura', codificar_cursor(['x', 1])):
+            self.assertEqual([p.pk for p in obtener_catalogo().pagina(cursor, 2)], primera)
+        # Relevancia no numérica
+        primera = [p.pk for p in obtener_catalogo().pagina(None, 2, search='caf')]
+        self.assertEqual([p.pk for p in obtener_catalogo().pagina(codificar_cursor(['x', 1]), 2, search='caf')], primera)
+
+    def test_listado_sin_consultas_a_productos(self):
+        q = connection.ops.quote_name
+        for url in (reverse('usuarios:productos'), reverse('usuarios:comprar') + '?search=cafe&categoria=Hogar'):
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as capturadas:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH='otro')
+            self.assertEqual(response.status_code, 200)
+            consultas = [c['sql'] for c in capturadas if q('usuarios_producto') in c['sql']]
+            with self.subTest(url=url):
+                # El MAX(actualizado_en) del ETag y, en la compra, las filas de la página por pk
+                self.assertTrue(consultas[0].startswith('SELECT MAX('))
+                self.assertLessEqual(len(consultas), 2)
+                for sql in consultas[1:]:
+                    self.assertIn(f'{q("usuarios_producto")}.{q("id")} IN', sql)
+
+    def test_stock_al_dia_sin_rearmar(self):
+        from .catalogo import obtener_catalogo
+        url = reverse('usuarios:comprar')
+        self.client.get(url)
+        catalogo = obtener_catalogo()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'producto_id': self.productos[0].id, 'cantidad': 2})
+        response = self.client.get(url)
+        self.assertIs(obtener_catalogo(), catalogo)
+        self.assertContains(response, "<strong>Disponibles:</strong> 3", html=True)
+
+    def test_foto_desde_la_primaria(self):
+        # Con una réplica atrasada, la foto guardaría filas viejas con la versión nueva
+        from unittest import mock
+        from .catalogo import Catalogo
+        from .routers import RouterReplicas
+        with mock.patch.object(RouterReplicas, 'db_for_read', return_value='replica_inexistente') as router:
+            catalogo = Catalogo.construir(1)
+        router.assert_not_called()
+        self.assertEqual(len(catalogo.productos), len(self.productos))
+
+    def test_cambios_de_producto_rearman_la_foto(self):
+        from .catalogo import obtener_catalogo
+        antes = obtener_catalogo()
+        self.assertIs(obtener_catalogo(), antes)
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo = Producto.objects.create(nombre="Cuaderno", costo=3, categoria="Papelería")
+        self.assertEqual(obtener_catalogo().pagina(None, 1).objetos[0].nombre, "Cuaderno")
+        self.assertIn(("Papelería", 1), obtener_catalogo().conteos)
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo.delete()
+        self.assertNotIn("Papelería", obtener_catalogo().por_categoria)
+        self.assertEqual([p.nombre for p in obtener_catalogo().pagina(None, 10, search='jugo')], [])
+
+
+class CatalogoRearmadoTestCase(TransactionTestCase):
+    # Rearmado en un hilo (CATALOGO_REARMADO='hilo'): con datos confirmados, que el hilo ve
+    def setUp(self):
+        from . import catalogo
+        cache.clear()
+        catalogo._actual = None
+        Producto.objects.create(nombre="Café", costo=5, categoria="Bebidas")
+
+    def test_sirve_la_anterior_mientras_rearma(self):
+        import threading
+        from unittest import mock
+        from . import catalogo
+        antes = catalogo.obtener_catalogo()
+        listo = threading.Event()
+        construir = catalogo.Catalogo.construir
+
+        def lento(version):
+            listo.wait(5)
+            return construir(version)
+
+        Producto.objects.create(nombre="Té", costo=3, categoria="Bebidas")
+        with mock.patch.object(catalogo.Catalogo, 'construir', side_effect=lento) as rearmado:
+            # La petición no espera: la foto anterior hasta que la nueva esté lista, un solo rearmado
+            self.assertIs(catalogo.obtener_catalogo(), antes)
+            self.assertIs(catalogo.obtener_catalogo(), antes)
+            listo.set()
+            catalogo._hilo.join(5)
+        rearmado.assert_called_once()
+        self.assertEqual(sorted(p.nombre for p in catalogo.obtener_catalogo().productos), ["Café", "Té"])
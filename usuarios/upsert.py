@@ -0,0 +1,85 @@
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Case, F, Q, Value, When
+
+
+def incrementar(modelo, claves, deltas, expresiones=None):
+    """UPDATE ... SET campo = campo + delta sobre la fila `claves`; si no existe, la crea.
+
+    `deltas` son los incrementos ({'unidades': 3}); también son los valores
+    iniciales de una fila nueva. `expresiones` mapea campo -> (expresión para
+    el UPDATE, valor inicial), para campos que no son sumas (p. ej. un máximo).
+    """
+    expresiones = expresiones or {}
+    actualizacion = {campo: F(campo) + delta for campo, delta in deltas.items()}
+    actualizacion.update({campo: expr for campo, (expr, _) in expresiones.items()})
+    iniciales = {**claves, **deltas, **{campo: inicial for campo, (_, inicial) in expresiones.items()}}
+
+    with transaction.atomic(using=router.db_for_write(modelo)):
+        if modelo.objects.filter(**claves).update(**actualizacion):
+            return
+        try:
+            with transaction.atomic(using=router.db_for_write(modelo)):
+                modelo.objects.create(**iniciales)
+        except IntegrityError:
+            # Otra transacción creó la fila entre el UPDATE y el INSERT
+            modelo.objects.filter(**claves).update(**actualizacion)
+
+
+def incrementar_varios(modelo, campos_clave, deltas, iniciales=None):
+    """incrementar() para muchas filas con un solo UPDATE (CASE por fila).
+
+    `deltas` mapea cada clave (tupla con los valores de `campos_clave`) a sus
+    incrementos ({'unidades': 3}); `iniciales`, a otros campos que solo se
+    escriben al crear la fila. Las filas existentes se bloquean antes en orden
+    de clave, así dos transacciones con filas en común esperan una a la otra en
+    vez de bloquearse mutuamente. Las que no existen se crean juntas; si otra
+    transacción crea alguna a la vez, esas se resuelven con incrementar().
+    """
+    iniciales = iniciales or {}
+    if not deltas:
+        return
+    condiciones = {clave: Q(**dict(zip(campos_clave, clave))) for clave in deltas}
+    campos = {campo for incrementos in deltas.values() for campo in incrementos}
+    db = router.db_for_write(modelo)
+
+    # Sin savepoint propio: si se llama dentro de otra transacción basta con ella
+    with transaction.atomic(using=db, savepoint=False):
+        existentes = set(
+            modelo.objects.filter(reduce(or_, condiciones.values()))
+            .order_by(*campos_clave).select_for_update().values_list(*campos_clave)
+        )
+        if existentes:
+            # Solo las filas bloqueadas: una creada por otra transacción después va por incrementar()
+            actualizacion = {
+                campo: F(campo) + Case(
+                    *[When(condiciones[clave], then=Value(deltas[clave].get(campo, 0))) for clave in existentes],
+                    default=Value(0), output_field=modelo._meta.get_field(campo),
+                )
+                for campo in campos
+            }
+            modelo.objects.filter(reduce(or_, [condiciones[clave] for clave in existentes])).update(**actualizacion)
+        faltantes = sorted(clave for clave in deltas if clave not in existentes)
+        if not faltantes:
+            return
+        try:
+            with transaction.atomic(using=db):
+                modelo.objects.bulk_create([
+                    modelo(**dict(zip(campos_clave, clave)), **deltas[clave], **iniciales.get(clave, {}))
+                    for clave in faltantes
+                ])
+        except IntegrityError:
+            for clave in faltantes:
+                # Asignar el campo a sí mismo no cambia la fila existente
+                fijos = {campo: (F(campo), valor) for campo, valor in iniciales.get(clave, {}).items()}
+                incrementar(modelo, dict(zip(campos_clave, clave)), deltas[clave], fijos)
+
+
+def opciones_upsert(modelo, campos_unicos, campos_actualizar):
+    # MySQL no acepta unique_fields en bulk_create(update_conflicts=True): usa la clave que choque
+    opciones = {'update_conflicts': True, 'update_fields': list(campos_actualizar)}
+    if connections[router.db_for_write(modelo)].features.supports_update_conflicts_with_target:
+        opciones['unique_fields'] = list(campos_unicos)
+    return opciones
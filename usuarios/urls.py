@@ -1,17 +1,41 @@
+from django.conf import settings
 from django.urls import path
 from django.views.generic import RedirectView
 from . import views
 
 app_name = 'usuarios'
 
-urlpatterns = [
-    path('', RedirectView.as_view(url='login/', permanent=False)),
-    path('login/', views.CustomLoginView.as_view(), name='login'),
-    path('logout/', views.CustomLogoutView.as_view(), name='logout'),
-    path('registro/', views.RegistroView.as_view(), name='registro'),
-    path('perfil/', views.PerfilView.as_view(), name='perfil'),
-    path('editar/', views.EditarPerfilView.as_view(), name='editar_perfil'),
-    path('productos/', views.ProductosView.as_view(), name='productos'),
-    path('productos/crear/', views.CrearProductoView.as_view(), name='crear_producto'),
-    path('comprar/', views.comprar_view, name='comprar'),
-]
\ No newline at end of file
+
+def construir_urlpatterns(asincronas=False):
+    # Con asincronas=True el catálogo, la compra (GET) y el perfil usan las vistas async
+    if asincronas:
+        perfil = views.PerfilAsyncView.as_view()
+        productos = views.ProductosAsyncView.as_view()
+        comprar = views.ComprarAsyncView.as_view()
+    else:
+        perfil = views.PerfilView.as_view()
+        productos = views.ProductosView.as_view()
+        comprar = views.comprar_view
+
+    return [
+        path('', RedirectView.as_view(url='login/', permanent=False)),
+        path('login/', views.CustomLoginView.as_view(), name='login'),
+        path('logout/', views.CustomLogoutView.as_view(), name='logout'),
+        path('registro/', views.RegistroView.as_view(), name='registro'),
+        path('perfil/', perfil, name='perfil'),
+        path('editar/', views.EditarPerfilView.as_view(), name='editar_perfil'),
+        path('productos/', productos, name='productos'),
+        path('productos/crear/', views.CrearProductoView.as_view(), name='crear_producto'),
+        path('productos/importar/', views.ImportarProductosView.as_view(), name='importar_productos'),
+        path('comprar/', comprar, name='comprar'),
+        path('comprar/carrito/', views.carrito_view, name='carrito'),
+        path('exportar/compras/', views.exportar_compras_view, name='exportar_compras'),
+        path('exportar/productos/', views.exportar_productos_view, name='exportar_productos'),
+        path('metricas/', views.metricas_view, name='metricas'),
+        path('metricas/prometheus/', views.metricas_prometheus_view, name='metricas_prometheus'),
+        path('ventas/', views.ventas_view, name='ventas'),
+        path('ventas/api/', views.ventas_api_view, name='ventas_api'),
+    ]
+
+
+urlpatterns = construir_urlpatterns(settings.USUARIOS_VISTAS_ASYNC)
@@ -0,0 +1,243 @@
+"""Resúmenes de ventas por día y por mes, por producto y por categoría.
+
+Cada compra (o carrito) encola sus deltas en la misma transacción
+(registrar_ventas) y la tarea 'registrar_ventas' los suma fuera del checkout:
+las filas del día y del mes de una categoría las tocan todas las compras, y
+actualizarlas dentro de cada compra serializaba los checkouts. Un delta se
+aplica una sola vez aunque la cola lo reentregue (VentaAplicada).
+
+reconstruir_ventas rehace un rango desde Compra; los deltas todavía en cola de
+ese rango se suman después otra vez, así que conviene correrlo con el worker al
+día. consultar_ventas responde rangos sin leer Compra: los meses completos
+salen de las filas mensuales y los días sueltos de los bordes, de las diarias.
+
+La categoría de una venta es la del producto al comprar; al reconstruir se
+usa la actual.
+"""
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import Compra, VentaAplicada, VentaCategoria, VentaProducto, VentaResumen
+from .tareas import encolar, tarea
+from .upsert import incrementar_varios
+
+DIA, MES = VentaResumen.DIA, VentaResumen.MES
+
+# Una reentrega llega a lo sumo TAREAS_BLOQUEO después de aplicar el delta: sobra margen
+RETENCION_EVENTOS = timedelta(days=7)
+
+
+def inicio_mes(dia):
+    return dia.replace(day=1)
+
+
+def mes_siguiente(dia):
+    return (dia.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+# --- MANTENIMIENTO INCREMENTAL ---
+
+def registrar_ventas(compras, signo=1):
+    """Encola la suma (o la resta, con signo=-1) de las compras a los resúmenes de su día y su mes."""
+    encolar(('registrar_ventas', {
+        'evento': uuid.uuid4().hex,
+        'lineas': [
+            [
+                compra.producto_id, compra.producto.categoria, timezone.localdate(compra.fecha).isoformat(),
+                signo * compra.cantidad, str(signo * compra.total), signo,
+            ]
+            for compra in compras
+        ],
+    }))
+
+
+@tarea('registrar_ventas')
+def aplicar_ventas(lote):
+    # `evento` es único: si otro worker aplica el mismo lote a la vez, el INSERT
+    # choca, se deshace todo y el lote se reintenta (ya sin esos eventos)
+    with transaction.atomic():
+        eventos = {datos['evento']: datos for datos in lote}
+        aplicados = set(VentaAplicada.objects.filter(evento__in=eventos).values_list('evento', flat=True))
+        nuevos = [datos for evento, datos in eventos.items() if evento not in aplicados]
+        if nuevos:
+            VentaAplicada.objects.bulk_create([VentaAplicada(evento=datos['evento']) for datos in nuevos])
+            _sumar_lineas([linea for datos in nuevos for linea in datos['lineas']])
+        VentaAplicada.objects.filter(creada_en__lt=timezone.now() - RETENCION_EVENTOS).delete()
+
+
+def _sumar_lineas(lineas):
+    por_producto, por_categoria, categorias = defaultdict(dict), defaultdict(dict), {}
+    for producto_id, categoria, dia, cantidad, total, num_compras in lineas:
+        dia = date.fromisoformat(dia)
+        delta = {'unidades': cantidad, 'ingresos': Decimal(total), 'num_compras': num_compras}
+        for periodo, inicio in ((DIA, dia), (MES, inicio_mes(dia))):
+            clave = (periodo, inicio, producto_id)
+            _sumar(por_producto[clave], delta)
+            categorias[clave] = {'categoria': categoria}
+            _sumar(por_categoria[(periodo, inicio, categoria)], delta)
+
+    incrementar_varios(VentaProducto, ('periodo', 'inicio', 'producto_id'), por_producto, categorias)
+    incrementar_varios(VentaCategoria, ('periodo', 'inicio', 'categoria'), por_categoria)
+
+
+def _sumar(acumulado, delta):
+    for campo, valor in delta.items():
+        acumulado[campo] = acumulado.get(campo, 0) + valor
+
+
+# --- RECONSTRUCCIÓN ---
+
+def rango_compras():
+    """(primer día, último día) con compras, o None si no hay."""
+    extremos = Compra.objects.aggregate(primera=Min('fecha'), ultima=Max('fecha'))
+    if extremos['primera'] is None:
+        return None
+    return timezone.localdate(extremos['primera']), timezone.localdate(extremos['ultima'])
+
+
+def _limites(desde, hasta):
+    # Rango de fechas -> rango de datetimes en la zona actual (usa compra_fecha_idx)
+    return (
+        timezone.make_aware(datetime.combine(desde, time.min)),
+        timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min)),
+    )
+
+
+def reconstruir_ventas(desde, hasta):
+    """Recalcula desde Compra los días de [desde, hasta] y los meses que los contienen."""
+    inicio, fin = _limites(desde, hasta)
+    compras = Compra.objects.filter(fecha__gte=inicio, fecha__lt=fin).order_by().annotate(dia=TruncDate('fecha'))
+    sumas = {'u': Sum('cantidad'), 'i': Sum('total'), 'n': Count('id')}
+    with transaction.atomic():
+        for modelo in (VentaProducto, VentaCategoria):
+            modelo.objects.filter(periodo=DIA, inicio__gte=desde, inicio__lte=hasta).delete()
+        VentaProducto.objects.bulk_create([
+            VentaProducto(
+                periodo=DIA, inicio=fila['dia'], producto_id=fila['producto_id'], categoria=fila['producto__categoria'],
+                unidades=fila['u'], ingresos=fila['i'], num_compras=fila['n'],
+            )
+            for fila in compras.values('dia', 'producto_id', 'producto__categoria').annotate(**sumas)
+        ], batch_size=1000)
+        VentaCategoria.objects.bulk_create([
+            VentaCategoria(
+                periodo=DIA, inicio=fila['dia'], categoria=fila['producto__categoria'],
+                unidades=fila['u'], ingresos=fila['i'], num_compras=fila['n'],
+            )
+            for fila in compras.values('dia', 'producto__categoria').annotate(**sumas)
+        ], batch_size=1000)
+
+        mes = inicio_mes(desde)
+        while mes <= hasta:
+            _reconstruir_mes(mes)
+            mes = mes_siguiente(mes)
+
+
+def _reconstruir_mes(mes):
+    # Suma de las filas diarias del mes: no vuelve a leer Compra
+    sumas = {'u': Sum('unidades'), 'i': Sum('ingresos'), 'n': Sum('num_compras')}
+    dias = {'periodo': DIA, 'inicio__gte': mes, 'inicio__lt': mes_siguiente(mes)}
+    for modelo in (VentaProducto, VentaCategoria):
+        modelo.objects.filter(periodo=MES, inicio=mes).delete()
+    VentaProducto.objects.bulk_create([
+        VentaProducto(
+            periodo=MES, inicio=mes, producto_id=fila['producto_id'], categoria=fila['c'],
+            unidades=fila['u'], ingresos=fila['i'], num_compras=fila['n'],
+        )
+        # Si la categoría cambió durante el mes, queda una de ellas
+        for fila in VentaProducto.objects.filter(**dias).values('producto_id').annotate(c=Max('categoria'), **sumas)
+    ], batch_size=1000)
+    VentaCategoria.objects.bulk_create([
+        VentaCategoria(
+            periodo=MES, inicio=mes, categoria=fila['categoria'],
+            unidades=fila['u'], ingresos=fila['i'], num_compras=fila['n'],
+        )
+        for fila in VentaCategoria.objects.filter(**dias).values('categoria').annotate(**sumas)
+    ], batch_size=1000)
+
+
+# --- CONSULTAS ---
+
+def consultar_ventas(desde, hasta, por='categoria', periodo=None, categoria=None):
+    """Ventas de [desde, hasta] (inclusive) agrupadas por categoría o por producto.
+
+    Con periodo 'dia' o 'mes' cada grupo se abre por día o por mes; sin periodo
+    se da el total del rango. Devuelve dicts con la clave del grupo, 'inicio'
+    (None sin periodo), 'unidades', 'ingresos' y 'num_compras', por período y
+    de mayor a menor ingreso.
+    """
+    if por == 'categoria':
+        modelo, campos, extras = VentaCategoria, ['categoria'], {}
+    else:
+        modelo, campos, extras = VentaProducto, ['producto_id'], {'nombre': F('producto__nombre')}
+    claves = [*campos, *extras]
+    base = modelo.objects.order_by()
+    if categoria:
+        base = base.filter(categoria=categoria)
+
+    # Meses completos dentro del rango: [primer_mes, fin_meses)
+    primer_mes = desde if desde.day == 1 else mes_siguiente(desde)
+    fin_meses = inicio_mes(hasta + timedelta(days=1))
+    if periodo == DIA or primer_mes >= fin_meses:
+        partes = [(DIA, Q(inicio__gte=desde, inicio__lte=hasta))]
+    else:
+        partes = [
+            (MES, Q(inicio__gte=primer_mes, inicio__lt=fin_meses)),
+            (DIA, Q(inicio__gte=desde, inicio__lt=primer_mes) | Q(inicio__gte=fin_meses, inicio__lte=hasta)),
+        ]
+
+    resultado = {}
+    for filas_de, rango in partes:
+        grupo = dict(extras)
+        if periodo:
+            # Los días de los bordes se juntan en su mes
+            grupo['tramo'] = TruncMonth('inicio') if periodo == MES and filas_de == DIA else F('inicio')
+        filas = (
+            base.filter(rango, periodo=filas_de).values(*campos, **grupo)
+            .annotate(u=Sum('unidades'), i=Sum('ingresos'), n=Sum('num_compras'))
+        )
+        for fila in filas:
+            clave = tuple(fila[c] for c in [*campos, *grupo])
+            acumulado = resultado.get(clave)
+            if acumulado is None:
+                acumulado = resultado[clave] = {
+                    **{c: fila[c] for c in claves}, 'inicio': fila.get('tramo'),
+                    'unidades': 0, 'ingresos': Decimal('0'), 'num_compras': 0,
+                }
+            acumulado['unidades'] += fila['u']
+            acumulado['ingresos'] += fila['i']
+            acumulado['num_compras'] += fila['n']
+
+    return sorted(resultado.values(), key=lambda f: (f['inicio'] is not None, f['inicio'], -f['ingresos']))
+
+
+# --- JERARQUÍA DE FECHAS DEL ADMIN ---
+
+def _resumenes(producto_id=None):
+    if producto_id:
+        return VentaProducto.objects.filter(producto_id=producto_id, num_compras__gt=0)
+    return VentaCategoria.objects.filter(num_compras__gt=0)
+
+
+def limites_ventas(producto_id=None):
+    """(primer día, último día) con ventas según los resúmenes diarios."""
+    extremos = _resumenes(producto_id).filter(periodo=DIA).aggregate(primero=Min('inicio'), ultimo=Max('inicio'))
+    return extremos['primero'], extremos['ultimo']
+
+
+def fechas_con_ventas(anio=None, mes=None, producto_id=None):
+    """Años con ventas; con `anio`, sus meses; con `anio` y `mes`, sus días."""
+    resumenes = _resumenes(producto_id)
+    if anio and mes:
+        inicio = date(anio, mes, 1)
+        dias = resumenes.filter(periodo=DIA, inicio__gte=inicio, inicio__lt=mes_siguiente(inicio))
+        return list(dias.dates('inicio', 'day'))
+    if anio:
+        return list(resumenes.filter(periodo=MES, inicio__year=anio).dates('inicio', 'month'))
+    return list(resumenes.filter(periodo=MES).dates('inicio', 'year'))
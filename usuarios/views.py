@@ -1,13 +1,40 @@
+import csv
+import hmac
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.contrib import messages
+from django.db import transaction
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
+from django.utils.decorators import method_decorator
+from django.utils.functional import SimpleLazyObject
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views import generic
 from django.contrib.auth.views import LoginView, LogoutView
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from .models import PerfilUsuario, Producto, Compra
-from .forms import EditarPerfilForm, RegistroForm, ProductoForm, CompraForm
+from django.views.decorators.http import require_POST
+from .models import PerfilUsuario, Producto, Compra, EstadisticasCompras
+from .forms import EditarPerfilForm, RegistroForm, ProductoForm, CompraForm, ImportarProductosForm, VentasForm
+from .cache_perfil import aversion_perfil, version_perfil
+from .catalogo import acargar_productos, aobtener_catalogo, cargar_productos, obtener_catalogo
+from .compras import LineaInvalida, StockInsuficiente, comprar_carrito, descontar_stock, normalizar_lineas
+from .condicional import catalogo_condicional
+from .estadisticas import estadisticas_de
+from .exportacion import FORMATOS, exportar, leer_fecha
+from .facetas import aconteos_categorias, conteos_categorias
+from .importacion import formato_de, importar, leer_filas
+from .metricas import registro as registro_metricas
+from .paginacion import PaginaKeyset
+from .ventas import consultar_ventas
 
 
 # --- LOGIN ---
@@ -80,19 +107,49 @@ class RegistroView(generic.CreateView):
 #     compras = request.user.compras.all()
 #     return render(request, 'usuarios/perfil.html', {'perfil': perfil, 'compras': compras})
 
+def perfil_de(request):
+    """Perfil del usuario logueado, memorizado en la petición.
+
+    Con PerfilBackend (autenticacion.py) llega en la misma consulta que el
+    usuario. Los usuarios creados fuera del registro (createsuperuser, admin)
+    pueden no tener perfil: se crea al primer acceso en vez de fallar con
+    DoesNotExist.
+    """
+    if not hasattr(request, '_perfil'):
+        try:
+            request._perfil = request.user.perfil
+        except PerfilUsuario.DoesNotExist:
+            request._perfil, _ = PerfilUsuario.objects.get_or_create(user=request.user)
+    return request._perfil
+
+
 class PerfilView(LoginRequiredMixin, generic.DetailView):
     model = PerfilUsuario
     template_name = 'usuarios/perfil.html'
     context_object_name = 'perfil'
 
     def get_object(self):
-        # Devuelve el perfil del usuario logueado, ignorando la URL
-        return self.request.user.perfil
+        # Devuelve el perfil del usuario logueado, ignorando la URL.
+        # Perezoso: si los fragmentos de perfil.html están en caché no se consulta
+        return SimpleLazyObject(lambda: perfil_de(self.request))
 
     def get_context_data(self, **kwargs):
-        # Inyectamos las compras al contexto
-        context = super().get_context_data(**kwargs)
-        context['compras'] = self.request.user.compras.all()
+        # Se salta SingleObjectMixin.get_context_data, que evalúa el objeto con `if self.object`
+        context = generic.base.ContextMixin.get_context_data(self, perfil=self.object, **kwargs)
+        context['version_perfil'] = version_perfil(self.request.user.pk)
+        context['cache_timeout'] = settings.PERFIL_CACHE_TIMEOUT
+        # Inyectamos las compras al contexto, paginadas por cursor (fecha, id);
+        # select_related evita una consulta por compra al leer compra.producto.nombre
+        compras = self.request.user.compras.select_related('producto').only(
+            'id', 'usuario', 'fecha', 'total', 'producto__nombre',
+        )
+        context['compras'] = PaginaKeyset(
+            compras,
+            ('-fecha', '-id'),
+            cursor=self.request.GET.get('cursor'),
+            tamano=settings.PAGINA_TAMANO,
+        )
+        context['estadisticas'] = SimpleLazyObject(lambda: estadisticas_de(self.request.user))
         return context
 
 
@@ -103,10 +160,25 @@ class PerfilView(LoginRequiredMixin, generic.DetailView):
 #     productos = Producto.objects.all()
 #     return render(request, 'usuarios/productos.html', {'productos': productos})
 
+# 304 si el catálogo no cambió desde la última visita (ver condicional.py)
+@method_decorator(catalogo_condicional, name='get')
 class ProductosView(LoginRequiredMixin, generic.ListView):
     model = Producto
     template_name = 'usuarios/productos.html'
     context_object_name = 'productos'
+    ordering = ('-creado_en', '-id')
+
+    def get_queryset(self):
+        # Desde la foto en memoria del catálogo (ver catalogo.py): sin consultas a productos
+        return obtener_catalogo().productos
+
+    def get_paginate_by(self, queryset):
+        return settings.PAGINA_TAMANO
+
+    def paginate_queryset(self, queryset, page_size):
+        # Paginación por cursor en vez del Paginator de Django (que usa OFFSET)
+        pagina = obtener_catalogo().pagina(self.request.GET.get('cursor'), page_size, solo_activos=False)
+        return (None, pagina, pagina, True)
 
 
 # --- CREAR PRODUCTO ---
@@ -165,7 +237,7 @@ class EditarPerfilView(LoginRequiredMixin, generic.UpdateView):
 
     def get_object(self):
         # Asegura que edite SU propio perfil
-        return self.request.user.perfil
+        return perfil_de(self.request)
 
     def get_form_kwargs(self):
         # Pasa el usuario al formulario para editar email/nombre también
@@ -177,23 +249,22 @@ class EditarPerfilView(LoginRequiredMixin, generic.UpdateView):
 # --- COMPRAR ---
 
 @login_required
+@catalogo_condicional
 def comprar_view(request):
     # Filtros
     search = request.GET.get("search", "")
     categoria = request.GET.get("categoria", "")
 
-    productos = Producto.objects.filter(activo=True)
-
-    if search:
-        productos = productos.filter(nombre__icontains=search)
-
-    if categoria:
-        productos = productos.filter(categoria__icontains=categoria)
-
     # Procesar compra
     if request.method == "POST":
-        producto_id = request.POST.get("producto_id")
-        cantidad = int(request.POST.get("cantidad", 1))
+        # Mismas reglas que el carrito: ids y cantidades enteras, cantidad >= 1
+        try:
+            [(producto_id, cantidad)] = normalizar_lineas(
+                [(request.POST.get("producto_id"), request.POST.get("cantidad", 1))]
+            ).items()
+        except LineaInvalida as exc:
+            messages.error(request, str(exc))
+            return redirect("usuarios:comprar")
 
         # Usamos get_object_or_404 por seguridad (mejora de ing.)
         producto = get_object_or_404(Producto, id=producto_id)
@@ -205,15 +276,250 @@ def comprar_view(request):
             precio_unitario=producto.costo,
             total=producto.costo * cantidad
         )
-        compra.save()
+        # Stock, compra y resumen (señal post_save) en la misma transacción
+        try:
+            with transaction.atomic():
+                descontar_stock({producto.id: cantidad})
+                compra.save()
+        except StockInsuficiente:
+            messages.error(request, f"No hay stock suficiente de {producto.nombre}")
+            return redirect("usuarios:comprar")
         return redirect("usuarios:perfil")
 
-    # Categorías disponibles
-    categorias = Producto.objects.values_list("categoria", flat=True).distinct()
+    # Filtro, búsqueda y página desde la foto en memoria del catálogo (ver catalogo.py);
+    # de la base solo se leen las filas de la página, por su stock y descripción
+    productos = obtener_catalogo().pagina(
+        request.GET.get("cursor"), settings.PAGINA_TAMANO, search=search, categoria=categoria,
+    )
+    productos.objetos = cargar_productos(productos.objetos)
+
+    # Categorías disponibles con su conteo (cacheado, ver facetas.py)
+    categorias = conteos_categorias(search)
 
     return render(request, "usuarios/comprar.html", {
         "productos": productos,
         "categorias": categorias,
         "search": search,
         "categoria": categoria
-    })
\ No newline at end of file
+    })
+
+
+# --- CARRITO ---
+
+@login_required
+@require_POST
+def carrito_view(request):
+    # Acepta un formulario con listas paralelas producto_id/cantidad o un JSON {"lineas": [...]}
+    es_json = request.content_type == "application/json"
+    try:
+        if es_json:
+            datos = json.loads(request.body)
+            lineas = [(linea.get("producto_id"), linea.get("cantidad", 1)) for linea in datos.get("lineas", [])]
+        else:
+            lineas = zip(request.POST.getlist("producto_id"), request.POST.getlist("cantidad"))
+        compras = comprar_carrito(request.user, lineas)
+    except (ValueError, AttributeError) as exc:
+        # LineaInvalida y JSON mal formado son ValueError
+        mensaje = str(exc) if isinstance(exc, LineaInvalida) else "Carrito mal formado"
+        if es_json:
+            return JsonResponse({"error": mensaje}, status=400)
+        messages.error(request, mensaje)
+        return redirect("usuarios:comprar")
+
+    if es_json:
+        return JsonResponse({
+            "compras": len(compras),
+            "unidades": sum(c.cantidad for c in compras),
+            "total": str(sum(c.total for c in compras)),
+        })
+    return redirect("usuarios:perfil")
+
+
+# --- IMPORTACIÓN (solo staff) ---
+
+class ImportarProductosView(LoginRequiredMixin, UserPassesTestMixin, generic.FormView):
+    form_class = ImportarProductosForm
+    template_name = 'usuarios/importar_productos.html'
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def form_valid(self, form):
+        archivo = form.cleaned_data['archivo']
+        try:
+            # Se lee del archivo subido en streaming, fila por fila
+            resultado = importar(leer_filas(archivo, formato_de(archivo.name)), lote=settings.IMPORTACION_LOTE)
+        except (ValueError, UnicodeDecodeError, csv.Error) as exc:
+            form.add_error('archivo', f"No se pudo leer el archivo: {exc}")
+            return self.form_invalid(form)
+        return self.render_to_response(self.get_context_data(
+            form=form, resultado=resultado, errores=resultado.errores[:100],
+        ))
+
+
+# --- EXPORTACIÓN (solo staff) ---
+
+def _solo_staff(vista):
+    @login_required
+    def envoltura(request, *args, **kwargs):
+        if not request.user.is_staff:
+            raise PermissionDenied
+        return vista(request, *args, **kwargs)
+    return envoltura
+
+
+def _exportar(request, modelo):
+    formato = request.GET.get("formato", "csv")
+    desde, hasta = request.GET.get("desde"), request.GET.get("hasta")
+    try:
+        desde = leer_fecha(desde) if desde else None
+        hasta = leer_fecha(hasta) if hasta else None
+    except ValueError:
+        desde = hasta = False
+    if formato not in FORMATOS or desde is False or hasta is False:
+        return HttpResponseBadRequest("Parámetros inválidos (formato: csv|jsonl, fechas: AAAA-MM-DD)")
+
+    # StreamingHttpResponse: el export se envía mientras se lee, sin armarlo en memoria
+    response = StreamingHttpResponse(
+        exportar(modelo, formato, desde=desde, hasta=hasta, categoria=request.GET.get("categoria")),
+        content_type=FORMATOS[formato],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{modelo}.{formato}"'
+    return response
+
+
+@_solo_staff
+def exportar_compras_view(request):
+    return _exportar(request, "compras")
+
+
+@_solo_staff
+def exportar_productos_view(request):
+    return _exportar(request, "productos")
+
+
+# --- MÉTRICAS (solo staff) ---
+
+@_solo_staff
+def metricas_view(request):
+    # Resumen por vista de los histogramas de MetricasMiddleware (solo este proceso)
+    return JsonResponse({
+        'muestreo': settings.METRICAS_MUESTREO,
+        'vistas': registro_metricas.resumen(),
+    })
+
+
+def metricas_prometheus_view(request):
+    # Formato de texto de Prometheus; acepta staff o "Authorization: Bearer <METRICAS_TOKEN>"
+    token = settings.METRICAS_TOKEN
+    # Comparación en tiempo constante (en bytes: compare_digest no acepta str no ASCII)
+    autorizado = bool(token) and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode(),
+    )
+    if not autorizado and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(registro_metricas.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# --- VENTAS (solo staff) ---
+# Se responden desde los resúmenes diarios/mensuales (ver ventas.py), sin agregar Compra
+
+@_solo_staff
+def ventas_view(request):
+    form = VentasForm(request.GET)
+    filas = consultar_ventas(**form.consulta()) if form.is_valid() else []
+    return render(request, 'usuarios/ventas.html', {
+        'form': form,
+        'filas': filas,
+        'totales': {
+            'unidades': sum(f['unidades'] for f in filas),
+            'ingresos': sum(f['ingresos'] for f in filas),
+        },
+    })
+
+
+@_solo_staff
+def ventas_api_view(request):
+    form = VentasForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errores': form.errors}, status=400)
+    consulta = form.consulta()
+    return JsonResponse({**consulta, 'filas': consultar_ventas(**consulta)})
+
+
+# --- VERSIONES ASYNC (ASGI) ---
+# Se activan con USUARIOS_VISTAS_ASYNC (ver urls.py). Cargan todo con el ORM async
+# antes de renderizar, para que la plantilla no haga consultas síncronas.
+
+async def _usuario_autenticado(request):
+    user = await request.auser()
+    # request.user y request.auser() cachean por separado: se fija para la plantilla
+    request.user = user
+    return user if user.is_authenticated else None
+
+
+@method_decorator(catalogo_condicional, name='get')
+class ProductosAsyncView(generic.View):
+    async def get(self, request):
+        if not await _usuario_autenticado(request):
+            return redirect_to_login(request.get_full_path())
+        catalogo = await aobtener_catalogo()
+        pagina = catalogo.pagina(request.GET.get('cursor'), settings.PAGINA_TAMANO, solo_activos=False)
+        return render(request, 'usuarios/productos.html', {'productos': pagina})
+
+
+@method_decorator(catalogo_condicional, name='get')
+class ComprarAsyncView(generic.View):
+    async def get(self, request):
+        if not await _usuario_autenticado(request):
+            return redirect_to_login(request.get_full_path())
+        search = request.GET.get("search", "")
+        categoria = request.GET.get("categoria", "")
+        catalogo = await aobtener_catalogo()
+        pagina = catalogo.pagina(request.GET.get("cursor"), settings.PAGINA_TAMANO, search=search, categoria=categoria)
+        pagina.objetos = await acargar_productos(pagina.objetos)
+        return render(request, "usuarios/comprar.html", {
+            "productos": pagina,
+            "categorias": await aconteos_categorias(search),
+            "search": search,
+            "categoria": categoria,
+        })
+
+    async def post(self, request):
+        # La compra sigue siendo síncrona (transacción + señales)
+        return await sync_to_async(comprar_view)(request)
+
+
+class PerfilAsyncView(generic.View):
+    async def get(self, request):
+        user = await _usuario_autenticado(request)
+        if not user:
+            return redirect_to_login(request.get_full_path())
+        version = await aversion_perfil(user.pk)
+        cursor = request.GET.get('cursor')
+        context = {
+            'version_perfil': version,
+            'cache_timeout': settings.PERFIL_CACHE_TIMEOUT,
+            'perfil': None, 'estadisticas': None, 'compras': None,
+        }
+        # Solo se consulta lo que no esté ya en los fragmentos cacheados de perfil.html
+        if not await cache.ahas_key(make_template_fragment_key('perfil_datos', [user.pk, version])):
+            # Ya cargado con el usuario por PerfilBackend; con sesiones de ModelBackend (o sin
+            # perfil) user.perfil sería una consulta síncrona dentro del event loop
+            if User.perfil.is_cached(user):
+                # Sin fila, select_related deja en caché None y el acceso lanza DoesNotExist
+                context['perfil'] = getattr(user, 'perfil', None)
+            if context['perfil'] is None:
+                context['perfil'], _ = await PerfilUsuario.objects.aget_or_create(user=user)
+            context['estadisticas'] = (
+                await EstadisticasCompras.objects.filter(usuario=user).afirst()
+                or EstadisticasCompras(usuario=user)
+            )
+        if not await cache.ahas_key(make_template_fragment_key('perfil_historial', [user.pk, version, cursor or ''])):
+            compras = Compra.objects.filter(usuario=user).select_related('producto').only(
+                'id', 'usuario', 'fecha', 'total', 'producto__nombre',
+            )
+            context['compras'] = await PaginaKeyset(
+                compras, ('-fecha', '-id'), cursor, settings.PAGINA_TAMANO,
+            ).acargar()
+        return render(request, 'usuarios/perfil.html', context)